@@ -0,0 +1,113 @@
+# benchmarks/bench_fetch.py
+"""
+read_webpage 抓取層效能測試 (完全離線，以本機 HTTP 替身伺服器模擬 Reader Proxy)。
+
+量測：
+  1. 舊版做法 (每次 requests.get、下載完整內文再截斷) vs. WebFetcher 連線池 + 串流截斷
+  2. fetch_many 平行抓取 (受 per-host 上限約束)
+  3. 伺服器端實際建立的 TCP 連線數、下載位元組數
+
+用法：
+    python benchmarks/bench_fetch.py --urls 24 --page-kb 400 --latency-ms 80 --output bench_fetch.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class StandInServer:
+    """模擬 Reader Proxy：固定延遲後以 Keep-Alive、限速分塊回傳大型純文字網頁，並統計連線數與送出位元組"""
+    def __init__(self, page_bytes: int, latency_ms: int, mbps: float):
+        stats = self.stats = {"connections": 0, "requests": 0, "bytes_sent": 0}
+        lock = threading.Lock()
+        chunk_delay = 16_384 / (mbps * 125_000)
+        body = ("台積電營收與毛利率分析 AI revenue guidance. " * (page_bytes // 60 + 1)).encode("utf-8")[:page_bytes]
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            def setup(self):
+                super().setup()
+                # 與一般正式伺服器相同關閉 Nagle，否則 Keep-Alive 連線會卡在 Delayed ACK
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with lock: stats["connections"] += 1
+            def log_message(self, *args): pass
+            def do_GET(self):
+                with lock: stats["requests"] += 1
+                time.sleep(latency_ms / 1000)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    for i in range(0, len(body), 16_384):
+                        self.wfile.write(body[i:i + 16_384])
+                        with lock: stats["bytes_sent"] += len(body[i:i + 16_384])
+                        time.sleep(chunk_delay)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass # 客戶端讀滿上限後提早關閉
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.handle_error = lambda request, client_address: None # 客戶端斷線屬預期行為
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}/"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def snapshot_and_reset(self) -> dict:
+        time.sleep(0.05) # 等伺服器端寫入計數
+        snap = dict(self.stats)
+        for key in self.stats: self.stats[key] = 0
+        return snap
+
+def legacy_fetch(base_url: str, url: str, max_chars: int) -> str:
+    import requests
+    response = requests.get(f"{base_url}{url}", timeout=15)
+    return response.text[:max_chars]
+
+def main():
+    parser = argparse.ArgumentParser(description="Smart Deck web fetch benchmark (offline)")
+    parser.add_argument("--urls", type=int, default=24)
+    parser.add_argument("--page-kb", type=int, default=400, help="替身網頁大小 (KB)")
+    parser.add_argument("--latency-ms", type=int, default=80, help="替身伺服器的回應延遲")
+    parser.add_argument("--mbps", type=float, default=20, help="替身伺服器的單一連線頻寬")
+    parser.add_argument("--max-chars", type=int, default=10_000)
+    parser.add_argument("--output", default="bench_fetch.json")
+    args = parser.parse_args()
+
+    sys.path.insert(0, PROJECT_ROOT)
+    os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+    from src.config import Config
+    from src.tools.web_fetch import WebFetcher
+
+    server = StandInServer(args.page_kb * 1024, args.latency_ms, args.mbps)
+    urls = [f"https://example.com/news/{i}" for i in range(args.urls)]
+    fetcher = WebFetcher(
+        reader_base_url=server.base_url, max_chars=args.max_chars,
+        connect_timeout=Config.WEB_FETCH_CONNECT_TIMEOUT, read_timeout=Config.WEB_FETCH_READ_TIMEOUT,
+        per_host_limit=Config.WEB_FETCH_PER_HOST_LIMIT, pool_size=Config.WEB_FETCH_POOL_SIZE
+    )
+    report = {"urls": args.urls, "page_kb": args.page_kb, "latency_ms": args.latency_ms, "mbps": args.mbps,
+              "per_host_limit": Config.WEB_FETCH_PER_HOST_LIMIT}
+
+    def run(name, fn):
+        print(f"▶ {name}...")
+        start = time.perf_counter()
+        fn()
+        report[name] = {"seconds": round(time.perf_counter() - start, 3), **server.snapshot_and_reset()}
+
+    run("legacy_sequential", lambda: [legacy_fetch(server.base_url, u, args.max_chars) for u in urls])
+    run("pooled_sequential", lambda: [fetcher.fetch(u) for u in urls])
+    run("pooled_fetch_many", lambda: fetcher.fetch_many(urls))
+    server.httpd.shutdown()
+
+    with open(os.path.abspath(args.output), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+# benchmarks/bench_rag.py
+"""
+RAG 匯入 / 查詢效能基準測試 (完全離線、結果可重現)。
+
+使用 HashingEmbeddings 取代 Gemini Embedding，在暫存目錄中建立獨立的 chroma_db，量測：
+  1. 匯入吞吐量 (pages/s、chunks/s)
+  2. 不同語料規模下的查詢延遲 p50 / p95 (冷查詢與快取命中)
+  3. BM25 重建成本 (舊版每次查詢重建 vs. 倒排索引全量建立 vs. 增量更新一批)
+  4. 行程峰值 RSS
+
+用法：
+    python benchmarks/bench_rag.py --sizes 1000,10000 --backend chroma --output bench_rag.json
+不同 commit 的 JSON 報告可直接 diff 比較。
+
+10 萬片段的規模需要明確指定，且建議改用 NumPy 後端 (Chroma 的 HNSW 逐批寫入在此規模超過 10 分鐘)：
+    python benchmarks/bench_rag.py --sizes 100000 --backend numpy --queries 10 --ingest-files 1
+單核約 8 分鐘 (其中建立語料約 5.5 分鐘)，峰值 RSS 約 2.4 GB。
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+VOCAB_EN = ["AI", "GPU", "revenue", "margin", "cloud", "TSMC", "Nvidia", "capex", "EPS", "guidance", "2024", "2025"]
+
+class CorpusGenerator:
+    """
+    以固定種子產生中英混合的合成語料。
+    中文詞彙表由隨機 CJK 字組成，並依 Zipf 分布抽樣，讓 Postings 長度接近真實文件 (少數高頻詞 + 大量長尾詞)。
+    """
+    def __init__(self, seed: int, vocab_size: int = 20_000):
+        self.rng = random.Random(seed)
+        self.vocab = ["".join(chr(self.rng.randint(0x4E00, 0x9FA5)) for _ in range(self.rng.randint(2, 4)))
+                      for _ in range(vocab_size)]
+        self.weights = [1.0 / (rank + 1) for rank in range(vocab_size)]
+
+    def text(self, n_tokens: int) -> str:
+        rng = self.rng
+        words = rng.choices(self.vocab, weights=self.weights, k=n_tokens)
+        for i in range(len(words)):
+            r = rng.random()
+            if r < 0.1: words[i] = rng.choice(VOCAB_EN)
+            elif r < 0.15: words[i] = f"{rng.uniform(0, 100):.1f}%"
+            elif r < 0.2: words[i] += "。"
+        return "".join(words)
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+def peak_rss_mb() -> float:
+    # Linux 回傳 KB，macOS 回傳 bytes
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, text=True).strip()
+    except Exception:
+        return "unknown"
+
+def bench_ingest(RAGManager, gen, n_files: int, chars_per_file: int) -> dict:
+    manager = RAGManager("bench-ingest")
+    files = [(gen.text(chars_per_file // 3).encode("utf-8"), f"report_{i}.txt") for i in range(n_files)]
+    pages = chunks = 0
+
+    def on_progress(p, c):
+        nonlocal pages, chunks
+        pages, chunks = p, c
+
+    totals = {"pages": 0, "chunks": 0}
+    start = time.perf_counter()
+    for data, name in files:
+        manager.ingest_file(data, name, on_progress=on_progress)
+        totals["pages"] += pages
+        totals["chunks"] += chunks
+    elapsed = time.perf_counter() - start
+
+    # 重複上傳同一批檔案：量測 Embedding 快取帶來的加速
+    manager.reset()
+    start = time.perf_counter()
+    for data, name in files:
+        manager.ingest_file(data, name)
+    reupload_elapsed = time.perf_counter() - start
+    manager.reset()
+    return {
+        "files": n_files,
+        "pages": totals["pages"],
+        "chunks": totals["chunks"],
+        "seconds": round(elapsed, 4),
+        "pages_per_sec": round(totals["pages"] / elapsed, 2),
+        "chunks_per_sec": round(totals["chunks"] / elapsed, 2),
+        "reupload_seconds": round(reupload_elapsed, 4),
+    }
+
+def build_corpus(manager, gen, n_chunks: int, batch: int = 512):
+    for start in range(0, n_chunks, batch):
+        count = min(batch, n_chunks - start)
+        ids = [f"c{start + i}" for i in range(count)]
+        texts = [gen.text(60) for _ in range(count)]
+        manager.add_chunks(ids, texts, [{"source": f"synthetic_{(start + i) % 50}.txt"} for i in range(count)])
+
+def bench_query(RAGManager, gen, size: int, n_queries: int) -> dict:
+    manager = RAGManager(f"bench-query-{size}")
+    manager.reset()
+    start = time.perf_counter()
+    build_corpus(manager, gen, size)
+    build_seconds = time.perf_counter() - start
+
+    queries = [gen.text(3) for _ in range(n_queries)]
+    cold, warm = [], []
+    for q in queries:
+        t0 = time.perf_counter(); manager.query(q); cold.append((time.perf_counter() - t0) * 1000)
+    for q in queries:
+        t0 = time.perf_counter(); manager.query(q); warm.append((time.perf_counter() - t0) * 1000)
+
+    # 8 個全新的問題合併成一次批次檢索 (一次 Embedding + 一次向量查詢)
+    t0 = time.perf_counter()
+    manager.query_batch([gen.text(3) for _ in range(8)])
+    batch_ms = (time.perf_counter() - t0) * 1000
+
+    result = {
+        "chunks": size,
+        "build_seconds": round(build_seconds, 3),
+        "cold_p50_ms": round(percentile(cold, 50), 3),
+        "cold_p95_ms": round(percentile(cold, 95), 3),
+        "cached_p50_ms": round(percentile(warm, 50), 4),
+        "cached_p95_ms": round(percentile(warm, 95), 4),
+        "batch8_ms": round(batch_ms, 3),
+    }
+    manager.reset()
+    return result
+
+def bench_bm25(gen, size: int) -> dict:
+    from src.tools.keyword_index import KeywordIndex, index_files
+    texts = [gen.text(60) for _ in range(size)]
+    ids = [f"c{i}" for i in range(size)]
+    result = {"chunks": size}
+
+    # 舊版做法：每次查詢都從全部文件重建 BM25Retriever (需 rank_bm25)
+    try:
+        from langchain_core.documents import Document
+        from langchain_community.retrievers import BM25Retriever
+        docs = [Document(page_content=t) for t in texts]
+        t0 = time.perf_counter()
+        BM25Retriever.from_documents(docs)
+        result["legacy_rebuild_seconds"] = round(time.perf_counter() - t0, 4)
+    except ImportError:
+        result["legacy_rebuild_seconds"] = None
+
+    index_path = os.path.join(tempfile.mkdtemp(prefix="bench_bm25_"), "index.sqlite3")
+    index = KeywordIndex(index_path)
+    t0 = time.perf_counter()
+    index.add(ids, texts, ["synthetic.txt"] * size)
+    result["index_full_build_seconds"] = round(time.perf_counter() - t0, 4)
+
+    extra = [gen.text(60) for _ in range(64)]
+    t0 = time.perf_counter()
+    index.add([f"x{i}" for i in range(64)], extra, ["extra.txt"] * 64)
+    result["index_incremental_64_seconds"] = round(time.perf_counter() - t0, 5)
+
+    # 索引在每次 add 時就已落盤：重新開啟只讀統計，不載入 Postings
+    index.close()
+    result["index_disk_bytes"] = sum(os.path.getsize(p) for p in index_files(index_path) if os.path.exists(p))
+    t0 = time.perf_counter()
+    reopened = KeywordIndex(index_path)
+    result["index_reopen_seconds"] = round(time.perf_counter() - t0, 5)
+    t0 = time.perf_counter()
+    reopened.search(gen.text(3))
+    result["index_first_search_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+    reopened.close()
+    shutil.rmtree(os.path.dirname(index_path), ignore_errors=True)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Smart Deck RAG benchmark (offline)")
+    parser.add_argument("--sizes", default="1000,10000", help="查詢測試的語料規模 (片段數)，逗號分隔；100000 請搭配 --backend numpy (約 8 分鐘)")
+    parser.add_argument("--queries", type=int, default=50, help="每個規模執行的查詢數")
+    parser.add_argument("--ingest-files", type=int, default=4)
+    parser.add_argument("--ingest-chars", type=int, default=200_000, help="每個匯入測試檔的字數")
+    parser.add_argument("--backend", choices=["chroma", "numpy"], default="chroma")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_rag.json")
+    args = parser.parse_args()
+    output_path = os.path.abspath(args.output)
+
+    # 在暫存目錄執行，避免污染專案的 chroma_db / uploads；必須在 import src.* 之前設定
+    workdir = tempfile.mkdtemp(prefix="smartdeck_bench_")
+    os.chdir(workdir)
+    os.environ["EMBEDDING_PROVIDER"] = "hash"
+    os.environ["VECTOR_BACKEND"] = args.backend
+    os.environ["DOC_SUMMARY_ENABLED"] = "false" # 文件摘要需要呼叫 Gemini，離線測試不啟用
+    os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+    os.environ["ANONYMIZED_TELEMETRY"] = "False"
+    sys.path.insert(0, PROJECT_ROOT)
+    from src.config import Config
+    Config.validate()
+    from src.tools.rag import RAGManager
+
+    gen = CorpusGenerator(args.seed)
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "backend": args.backend,
+        "seed": args.seed,
+        "ingest": None,
+        "query": [],
+        "bm25": [],
+    }
+    try:
+        print("▶ 匯入吞吐量...")
+        report["ingest"] = bench_ingest(RAGManager, gen, args.ingest_files, args.ingest_chars)
+        for size in sizes:
+            print(f"▶ 查詢延遲 ({size} chunks)...")
+            report["query"].append(bench_query(RAGManager, gen, size, args.queries))
+            print(f"▶ BM25 重建成本 ({size} chunks)...")
+            report["bm25"].append(bench_bm25(gen, size))
+        report["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    finally:
+        os.chdir(PROJECT_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+    print(json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True))
+    print(f"✅ 報告已寫入 {output_path}")
+
+if __name__ == "__main__":
+    main()
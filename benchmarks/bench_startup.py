@@ -0,0 +1,71 @@
+# benchmarks/bench_startup.py
+"""
+Streamlit 冷啟動與 rerun 前置耗時量測 (完全離線：Hash Embedding + 假金鑰，不呼叫任何 Google API)。
+
+以 streamlit.testing 的 AppTest 在全新行程中執行 src/app.py：
+  1. 第一次 run = 冷啟動 (模組匯入 + 設定檢查 + 建立 Session 物件)
+  2. 之後的 run = 使用者每次互動觸發的 rerun
+另外等待背景預熱完成，記錄各預熱步驟的耗時。
+
+用法：
+    python benchmarks/bench_startup.py --reruns 20 --output bench_startup.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Smart Deck startup benchmark (offline)")
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--output", default="bench_startup.json")
+    args = parser.parse_args()
+    output_path = os.path.abspath(args.output)
+
+    # 在暫存目錄執行，chroma_db / uploads 不會寫進專案
+    os.chdir(tempfile.mkdtemp(prefix="bench_startup_"))
+    sys.path.insert(0, PROJECT_ROOT)
+    for key in ("GOOGLE_API_KEY", "GOOGLE_SEARCH_API_KEY", "GOOGLE_CSE_ID"):
+        os.environ.setdefault(key, "offline-benchmark")
+    os.environ["EMBEDDING_PROVIDER"] = "hash"
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file(os.path.join(PROJECT_ROOT, "src", "app.py"), default_timeout=120)
+
+    print("▶ 冷啟動...")
+    start = time.perf_counter()
+    app.run()
+    cold_start = time.perf_counter() - start
+    if app.exception:
+        raise SystemExit(f"❌ app.py 執行失敗：{app.exception[0].value}")
+
+    print(f"▶ rerun x {args.reruns}...")
+    reruns = []
+    for _ in range(args.reruns):
+        start = time.perf_counter()
+        app.run()
+        reruns.append((time.perf_counter() - start) * 1000)
+    reruns.sort()
+
+    from src.warmup import WarmupThread
+    warmup = next((t for t in threading.enumerate() if isinstance(t, WarmupThread)), None)
+    if warmup is not None: warmup.join(timeout=120)
+
+    report = {
+        "cold_start_seconds": round(cold_start, 3),
+        "rerun_p50_ms": round(reruns[len(reruns) // 2], 1),
+        "rerun_p95_ms": round(reruns[int(len(reruns) * 0.95)], 1),
+        "warmup": warmup.report if warmup is not None else None,
+    }
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# src/agents/context_packer.py
+import re
+from dataclasses import dataclass
+from src.config import Config
+from src.tools.keyword_index import tokenize
+from src.utils.tokens import estimate_tokens
+
+# 前端交接的 chat_history 以 "HumanMessage: ..." 分段、系統背景以 "=====" 分隔；知識庫結果以 "---片段---" 分段
+_BLOCK_RE = re.compile(r"^(?=(?:HumanMessage|AIMessage|ToolMessage|SystemMessage):|={10,})", re.MULTILINE)
+_KIND_RE = re.compile(r"^(HumanMessage|AIMessage|ToolMessage|SystemMessage):")
+_CHUNK_RE = re.compile(r"(?=---片段---)")
+
+# 各類片段的基礎權重：使用者的原話最重要，其次是文件與工具查到的硬資料
+_KIND_WEIGHT = {"HumanMessage": 1.0, "rag": 0.8, "ToolMessage": 0.6, "AIMessage": 0.5, "SystemMessage": 0.3, "text": 0.5}
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+@dataclass
+class Snippet:
+    section: int
+    order: int
+    kind: str
+    text: str
+    score: float = 0.0
+
+def _split(section_idx: int, text: str) -> list:
+    parts = []
+    for block in _BLOCK_RE.split(text or ""):
+        if not block.strip(): continue
+        match = _KIND_RE.match(block)
+        kind = match.group(1) if match else "text"
+        # 知識庫結果再細切成單一片段，才能逐段去重與排序
+        for piece in _CHUNK_RE.split(block):
+            if not piece.strip(): continue
+            piece_kind = "rag" if piece.startswith("---片段---") else kind
+            parts.append(Snippet(section_idx, len(parts), piece_kind, piece.strip()))
+    return parts
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """過長的片段 (例如 1 萬字的網頁全文) 保留開頭，並標示截斷"""
+    if estimate_tokens(text) <= max_tokens: return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens: lo = mid
+        else: hi = mid - 1
+    return text[:lo] + "\n...(內容過長已截斷)"
+
+def _log_saving(stage: str, original_tokens: int, packed_tokens: int):
+    print(f"  -> [Context] {stage}: {original_tokens} -> {packed_tokens} tokens (省下 {original_tokens - packed_tokens})")
+
+def compact_outline_json(outline, stage: str) -> str:
+    """反思/修正階段重送大綱時省略預設值欄位 (level=0、column=0、空白 notes)"""
+    full = outline.model_dump_json()
+    compact = outline.model_dump_json(exclude_defaults=True)
+    _log_saving(stage, estimate_tokens(full), estimate_tokens(compact))
+    return compact
+
+def pack_context(stage: str, sections: list, query: str) -> str:
+    """
+    依 Config.CONTEXT_TOKEN_BUDGETS[stage] 將多個區塊打包成符合預算的 Prompt。
+    sections: [(標題, 內文) 或 (標題, 內文, True)]，第三欄為 True 表示整段必須保留 (例如使用者需求)。
+    流程：切段 -> 近似重複去除 -> 依相關性/類型/新舊評分 -> 貪婪裝箱 -> 依原順序輸出。
+    """
+    sections = [(s[0], s[1] or "", len(s) > 2 and s[2]) for s in sections]
+    budget = Config.CONTEXT_TOKEN_BUDGETS.get(stage)
+    rendered_full = "\n".join(f"{title}:{body}" for title, body, _ in sections)
+    original_tokens = estimate_tokens(rendered_full)
+    if budget is None or original_tokens <= budget:
+        return rendered_full
+
+    snippets = [s for idx, (_, body, pinned) in enumerate(sections) if not pinned for s in _split(idx, body)]
+    for order, snippet in enumerate(snippets): snippet.order = order
+    # 目標通常很籠統 (「請根據上述對話製作簡報」)，一併參考使用者最後一則發言
+    query_terms = set(tokenize(query))
+    last_human = next((s for s in reversed(snippets) if s.kind == "HumanMessage"), None)
+    if last_human: query_terms |= set(tokenize(last_human.text))
+
+    # 1. 近似重複去除 (Jaccard)，保留較新的一份
+    kept, seen = [], []
+    for snippet in reversed(snippets):
+        shingles = set(tokenize(snippet.text))
+        if shingles and any(len(shingles & other) / len(shingles | other) >= NEAR_DUPLICATE_THRESHOLD for other in seen):
+            continue
+        seen.append(shingles)
+        kept.append(snippet)
+
+    # 2. 評分：與目標的詞彙重疊 + 類型權重 + 越新的片段越重要
+    total = max(len(snippets), 1)
+    for snippet in kept:
+        terms = set(tokenize(snippet.text))
+        relevance = len(terms & query_terms) / (len(query_terms) or 1)
+        recency = (snippet.order + 1) / total if snippet.kind != "rag" else 0.5
+        snippet.score = relevance + _KIND_WEIGHT.get(snippet.kind, 0.5) + 0.5 * recency
+
+    # 3. 貪婪裝箱：必留區塊先扣預算；單一片段最多佔剩餘預算的 1/3，避免一篇網頁吃光所有空間
+    remaining = budget - sum(estimate_tokens(f"{title}:\n{body if pinned else ''}") for title, body, pinned in sections)
+    per_snippet_cap = max(remaining // 3, 200)
+    chosen = []
+    for snippet in sorted(kept, key=lambda s: s.score, reverse=True):
+        text = _truncate(snippet.text, per_snippet_cap)
+        cost = estimate_tokens(text) + 1
+        if cost > remaining: continue
+        remaining -= cost
+        chosen.append((snippet, text))
+
+    # 4. 依原本的區塊與先後順序輸出，維持對話脈絡
+    chosen.sort(key=lambda item: (item[0].section, item[0].order))
+    output = []
+    for idx, (title, body, pinned) in enumerate(sections):
+        if not pinned:
+            texts = [text for snippet, text in chosen if snippet.section == idx]
+            dropped = sum(1 for s in snippets if s.section == idx) - len(texts)
+            body = "\n".join(texts)
+            if dropped > 0: body += f"\n(…已省略 {dropped} 段重複或較不相關的內容)"
+        output.append(f"{title}:\n{body}")
+    packed = "\n".join(output)
+
+    _log_saving(stage, original_tokens, estimate_tokens(packed))
+    return packed
@@ -1,143 +1,380 @@
 # src/agents/manager.py
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import SystemMessage, HumanMessage
-from tenacity import retry, stop_after_attempt, wait_exponential # [新增] 引入重試套件
+import threading
+import concurrent.futures
+from langchain_core.messages import SystemMessage, HumanMessage, ToolMessage
+from langgraph.types import StreamWriter, Send
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_not_exception_type # [新增] 引入重試套件
 from src.config import Config
-from src.agents.state import AgentState, PresentationOutline
-from src.tools.rag import RAGManager
-
-# 初始化核心模型
-llm = ChatGoogleGenerativeAI(
-    model=Config.MODEL_SMART, 
-    google_api_key=Config.GOOGLE_API_KEY,
-    temperature=0.2 
+from src.agents.state import (
+    AgentState, PresentationOutline, Slide, ContentItem, OutlineSkeleton, SlideTask, DraftedSlide, ReflectionReport, SlideGroup
 )
+from src.agents.context_packer import pack_context, compact_outline_json
+from src.agents.reflection import lint_outline, lint_verdicts, combine_verdicts, splice_slides
+from src.tools.rag_registry import rag_registry
+from src.tools.search import get_web_tools
+from src.tools.tool_executor import tool_executor
+from src.utils.cache import normalize_query, canonical_url
+from src.utils.llm_cache import llm_cache
+from src.utils.rate_limiter import quota_scheduler, QuotaExceededError, PRIORITY_PLANNING
+from src.utils.tracing import span, record, annotate, bind_context
 
-# 企業級 API 呼叫包裝器 (遇到 429 限制時自動等待並重試，最高重試 3 次)
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1.5, min=4, max=15), reraise=True)
-def call_llm_with_retry(model, messages):
-    return model.invoke(messages)
+# 盤點結果交給撰寫大綱階段時的標題
+_RESULT_TITLES = {
+    "read_knowledge_base": "【知識庫精確比對結果】",
+    "google_search": "【網路搜尋結果】",
+    "read_webpage": "【網頁內容】",
+}
 
-def manager_node(state: AgentState):
+_llm = None
+_llm_lock = threading.Lock()
+
+def get_llm():
+    """核心模型 (全行程共用)；langchain_google_genai 匯入耗時，延遲到第一次規劃大綱才建立"""
+    global _llm
+    with _llm_lock:
+        if _llm is None:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+            _llm = ChatGoogleGenerativeAI(
+                model=Config.MODEL_SMART, 
+                google_api_key=Config.GOOGLE_API_KEY,
+                temperature=0.2 
+            )
+        return _llm
+
+# 企業級 API 呼叫包裝器：配額與 429 由全域排程器統一處理 (排隊、降速、重試)，
+# 這裡只重試其他暫時性錯誤 (例如結構化輸出解析失敗)，最高重試 3 次 (重試次數記在目前的 Trace Span)
+@retry(retry=retry_if_not_exception_type(QuotaExceededError), stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1.5, min=4, max=15),
+       before_sleep=lambda retry_state: record(retries=1), reraise=True)
+def _invoke_with_retry(model, messages):
+    return quota_scheduler.invoke(Config.MODEL_SMART, model, messages, priority=PRIORITY_PLANNING)
+
+def call_llm_with_retry(llm, messages, schema=None, tools=None, bypass_cache: bool = False):
+    """
+    呼叫核心模型：指定 schema 時回傳結構化輸出，指定 tools 時綁定工具。
+    開啟 Config.LLM_CACHE_ENABLED 時，相同輸入的呼叫直接回傳上次的結果 (重新規劃同一段對話只需數毫秒)；
+    bypass_cache=True 強制重新呼叫模型。
+    """
+    return llm_cache.invoke(llm, messages, _invoke_with_retry, schema=schema, tools=tools, bypass=bypass_cache)
+
+def _call_key(tc) -> tuple:
+    """判斷重複呼叫用的 Key：查詢字串正規化、網址去除追蹤參數"""
+    args = tc["args"]
+    if "url" in args: return tc["name"], canonical_url(str(args["url"]))
+    return tc["name"], normalize_query(str(args.get("query", args)))
+
+def _truncate_result(result: str, max_chars: int) -> str:
+    return result if len(result) <= max_chars else result[:max_chars] + "\n...(內容過長已截斷)"
+
+def run_investigation(tools: list, messages: list, rag_manager, writer, bypass_cache: bool = False) -> list:
+    """
+    多輪資料盤點：每一輪由模型決定要查什麼，同一輪的所有工具呼叫平行執行
+    (知識庫查詢合併成一次批次檢索)，結果回饋給模型後進入下一輪。
+    - 跨輪去重：相同查詢 / 網址直接沿用先前的結果，不重複呼叫
+    - 每輪有時間上限 (Config.MANAGER_ROUND_DEADLINE_SECONDS)，總耗時約為「各輪最慢的一個呼叫」之和
+    - 模型不再要求工具 (回報資料足夠)、或整輪都是重複呼叫時提早結束；最多 Config.MANAGER_MAX_ROUNDS 輪
+    回傳 [(tool_name, 參數摘要, 結果), ...]，依首次取得的順序排列。
+    """
+    tool_map = {t.name: t for t in tools}
+    results = {} # _call_key -> (tool_name, 參數摘要, 結果)
+    for round_no in range(1, Config.MANAGER_MAX_ROUNDS + 1):
+        response = call_llm_with_retry(get_llm(), messages, tools=tools, bypass_cache=bypass_cache)
+        messages.append(response)
+        if not response.tool_calls:
+            writer({"stage": "investigation", "message": f"✅ 第 {round_no} 輪：模型回報資料已足夠"})
+            break
+
+        new_calls, seen_this_round = [], set()
+        for tc in response.tool_calls:
+            key = _call_key(tc)
+            if key in results or key in seen_this_round: continue
+            seen_this_round.add(key)
+            new_calls.append(tc)
+        if not new_calls:
+            writer({"stage": "investigation", "message": f"⏹️ 第 {round_no} 輪沒有新的查詢，結束盤點"})
+            break
+
+        print(f"  -> Manager 第 {round_no} 輪：平行執行 {len(new_calls)} 個工具呼叫 (略過重複 {len(response.tool_calls) - len(new_calls)} 個)")
+        writer({"stage": "investigation", "message": f"📚 第 {round_no} 輪：平行查詢 {len(new_calls)} 項資料"})
+
+        def on_result(tc, result, elapsed, done, total):
+            label = tc["args"].get("query") or tc["args"].get("url") or ""
+            writer({"stage": "investigation_tool", "message": f"  · ({done}/{total}) {tc['name']}：{str(label)[:30]} · {elapsed:.1f}s"})
+
+        result_by_id = tool_executor.run(
+            new_calls, tool_map, on_result=on_result,
+            batch_handlers={"read_knowledge_base": lambda calls: rag_manager.query_batch([tc["args"].get("query", "提取關鍵數據") for tc in calls])},
+            deadline_seconds=Config.MANAGER_ROUND_DEADLINE_SECONDS
+        )
+        for tc in new_calls:
+            label = tc["args"].get("query") or tc["args"].get("url") or ""
+            results[_call_key(tc)] = (tc["name"], str(label), str(result_by_id[tc["id"]]))
+        # 每個 tool_call 都要有對應的 ToolMessage (重複的呼叫回填先前的結果)
+        for tc in response.tool_calls:
+            messages.append(ToolMessage(
+                content=_truncate_result(results[_call_key(tc)][2], Config.MANAGER_TOOL_RESULT_CHARS),
+                tool_call_id=tc["id"], name=tc["name"]
+            ))
+    return list(results.values())
+
+def manager_node(state: AgentState, writer: StreamWriter):
+    """
+    writer 由 LangGraph 注入：以 stream_mode="custom" 串流時，前端可即時收到各階段的進度事件
+    ({"stage": ..., "message": ...})；一般 invoke 時為空操作。
+    """
     print(f"--- [Manager] 啟動深度規劃 (Session: {state.session_id[:8]}) ---")
+    writer({"stage": "investigation", "message": "🔍 正在盤點交接資料..."})
     
-    rag_manager = RAGManager(state.session_id)
-    session_rag_tool = rag_manager.get_tool()
-    llm_with_tools = llm.bind_tools([session_rag_tool])
+    rag_manager = rag_registry.get(state.session_id)
+    tools = [rag_manager.get_tool(), *get_web_tools(state.session_id)]
     
     # 1. 資訊盤點 (Information Synthesis)
-    investigation_system = """
+    investigation_system = f"""
     你是頂級簡報架構師的「資料盤點助理」。
-    你的任務是：檢查前端交接的資料，若需要確認原始文件的精確數據，請呼叫 `read_knowledge_base`。
+    你的任務是：檢查前端交接的資料，找出製作簡報還缺少的數據並補齊。
+    - 需要確認原始文件的精確數據：呼叫 `read_knowledge_base`
+    - 需要外部資料：呼叫 `google_search`，再把有價值的網址交給 `read_webpage` 閱讀全文
+    同一輪可以一次提出多個工具呼叫 (會平行執行)；你最多有 {Config.MANAGER_MAX_ROUNDS} 輪可以根據結果繼續追查。
     
     【警告與守則】：
     1. 現在是準備階段，【絕對不要在此時生成大綱】！
-    2. 你絕對不可捏造數據。所有資訊必須來自【Chat History】。
-    3. 若判斷資料已足夠排版，請直接回覆「資料確認完畢，可進入排版階段」。
+    2. 你絕對不可捏造數據。所有資訊必須來自【Chat History】或工具查到的結果。
+    3. 不要重複查詢已經查過的關鍵字或網址。
+    4. 若判斷資料已足夠排版，請不要再呼叫工具，直接回覆「資料確認完畢，可進入排版階段」。
     """
     
-    context_msg = f"Chat History (前端交接資料):\n{state.chat_history}\n\nUser Request (最終目標):\n{state.user_request}"
+    context_msg = pack_context("investigation", [
+        ("Chat History (前端交接資料)", state.chat_history),
+        ("\nUser Request (最終目標)", state.user_request, True)
+    ], query=state.user_request)
 
     try:
-        response = call_llm_with_retry(llm_with_tools, [
+        findings = run_investigation(tools, [
             SystemMessage(content=investigation_system),
             HumanMessage(content=context_msg)
-        ])
-        
-        rag_context = ""
-        if hasattr(response, 'tool_calls') and response.tool_calls:
-            print("  -> Manager 正在向內部知識庫確認細節...")
-            for tc in response.tool_calls:
-                if tc["name"] == "read_knowledge_base":
-                    try:
-                        query = tc["args"].get("query", "提取關鍵數據")
-                        res = session_rag_tool.invoke(query)
-                        rag_context += f"\n【知識庫精確比對結果】:\n{res}\n"
-                    except Exception as e:
-                        print(f"RAG Error: {e}")
+        ], rag_manager, writer, bypass_cache=state.bypass_llm_cache)
+        rag_context = "".join(f"\n{_RESULT_TITLES.get(name, '【工具結果】')} ({label[:60]}):\n{result}\n" for name, label, result in findings)
     except Exception as e:
         # ✨ 如果資訊盤點階段就炸了 (例如 429)，直接阻斷並回報
         error_msg = f"資訊盤點階段失敗 (API限制或網路錯誤)：{str(e)}"
         print(error_msg)
-        return {"outline": None, "error_message": error_msg}
+        return {"outline": None, "skeleton": None, "error_message": error_msg}
 
-    # 2. 結構化輸出 (Drafting)
-    print("  -> 生成大綱結構...")
-    draft_system = """
-    請根據【交接資料】與【知識庫比對結果】撰寫最終的 PPT 簡報內容。
-    
-    【⚠️ 核心警告：你寫的文字會直接印在 PPT 上】：
-    你產出的內容必須是「真實且專業的簡報文案」，絕對不可是「給人類的建議」或「佔位符」。
-    ❌ 錯誤示範：標題寫「封面頁」或「介紹」、內容寫「這裡放公司簡介」或「結語與建議」。
-    ✅ 正確示範：標題寫「Smart Deck 核心優勢」、內容寫「結合三代理架構，提升 80% 製作效率」。
-    
-    【結構規範】：
-    1. **ContentItem 層級控制 (Level)**：
-       - `level=0`: 核心主軸 (大重點)。
-       - `level=1`: 支撐性論點/數據 (子重點)。
-       - `level=2`: 補充說明/來源。
-    2. **欄位控制 (Column)**：
-       - `column=0`: 左欄 (預設)。
-       - `column=1`: 右欄 (僅用於 two_column 版型，適合做比較或對比)。
-    3. **嚴格基於事實**：嚴禁發明 Chat History 中未提及的新聞或數據。若無數據請標示(需補充數據)。
+    writer({"stage": "investigation_done", "message": f"✅ 資料盤點完成 (共取得 {len(findings)} 筆資料)"})
+
+    # 2. 骨架規劃 (Skeleton)：只決定每頁的版型、標題與重點提示，內文交給後續平行撰寫
+    print("  -> 規劃簡報骨架...")
+    writer({"stage": "skeleton", "message": "🦴 正在規劃簡報骨架..."})
+    skeleton_system = """
+    你是頂級簡報架構師。請根據【盤點結果】與【Chat History】規劃整份簡報的「骨架」：
+    - 決定頁數、每頁的版型 (layout) 與標題，以及這頁要涵蓋的 2~5 個重點提示 (key_points)
+    - 只需規劃，不要撰寫完整內文；內文會由其他撰稿人依你的骨架逐頁完成
+    - 標題必須是能直接印在投影片上的真實文案，嚴禁「封面頁」、「介紹」、「結語」等佔位詞
+    - 對比性內容 (例如 A 公司 vs B 公司) 請規劃為 `two_column`
+    - 嚴禁發明 Chat History 與盤點結果中未提及的新聞或數據
     """
-    
-    base_msg = f"【內部文件比對】:{rag_context}\n【Chat History】:{state.chat_history}\n【Req】:{state.user_request}"
-    structured_llm = llm.with_structured_output(PresentationOutline)
-    
+    research_context = pack_context("skeleton", [
+        ("【盤點結果】", rag_context),
+        ("【Chat History】", state.chat_history),
+        ("【Req】", state.user_request, True)
+    ], query=state.user_request)
+
     try:
-        draft = call_llm_with_retry(structured_llm, [
-            SystemMessage(content=draft_system),
-            HumanMessage(content=base_msg)
-        ])
+        skeleton = call_llm_with_retry(get_llm(), [
+            SystemMessage(content=skeleton_system),
+            HumanMessage(content=research_context)
+        ], schema=OutlineSkeleton, bypass_cache=state.bypass_llm_cache)
     except Exception as e:
-        # ✨ 關鍵修改：生成大綱解析失敗，把真實的報錯抓出來傳給前端
+        # ✨ 關鍵修改：骨架解析失敗，把真實的報錯抓出來傳給前端
         error_msg = f"生成大綱結構失敗 (格式錯亂或API限制)：\n{str(e)}"
         print(error_msg)
-        return {"outline": None, "error_message": error_msg}
+        return {"outline": None, "skeleton": None, "error_message": error_msg}
 
     # ✨ 防呆：如果 LLM 回傳了空值，但沒拋出 Exception
-    if not draft: 
-        return {"outline": None, "error_message": "LLM 回傳了空的結果，可能因為上下文不足以產生大綱。"}
+    if not skeleton or not skeleton.slides:
+        return {"outline": None, "skeleton": None, "error_message": "LLM 回傳了空的結果，可能因為上下文不足以產生大綱。"}
 
-    # 3. 邏輯反思 (Logic Reflection)
-    print("  -> 進行邏輯與版面反思...")
-    reflection_prompt = f"""
-    請檢視你剛才產出的這份大綱：{draft.model_dump_json()}
-    
-    身為架構師，你需要檢查「邏輯」、「排版」與「文案真實性」：
-    【檢查1】：是否有「標題與內文重複」的冗餘資訊？
-    【檢查2】：對於對比性內容(如A公司 vs B公司)，是否正確使用了 `two_column` 版型並分置左右欄？
-    【檢查3】：單頁資訊量是否過載（超過 6 個重點）？若有，是否該拆頁？
-    【檢查4】：是否出現「封面頁」、「結語」、「這裡放入數據」等無意義的佔位符或描述性文字？若有，請務必將其改寫為「真實的簡報文案」！
-    
-    若有任何排版、邏輯瑕疵或佔位符，請直接給出「具體的修改指令」。
-    若結構完美且全是真實文案，回傳 "PERFECT"。
-    """
+    writer({"stage": "skeleton_done", "message": f"🦴 骨架完成，共 {len(skeleton.slides)} 頁，開始逐頁撰寫..."})
+    # drafted_slides=None 會清空上一次規劃留下的逐頁結果 (見 merge_drafted_slides)
+    return {"skeleton": skeleton, "research_context": rag_context, "drafted_slides": None, "outline": None, "error_message": None}
+
+SLIDE_DRAFT_SYSTEM = """
+你是簡報撰稿人，負責依照架構師的骨架撰寫「其中一頁」投影片的完整內容。
+
+【⚠️ 核心警告：你寫的文字會直接印在 PPT 上】：
+你產出的內容必須是「真實且專業的簡報文案」，絕對不可是「給人類的建議」或「佔位符」。
+❌ 錯誤示範：標題寫「封面頁」或「介紹」、內容寫「這裡放公司簡介」或「結語與建議」。
+✅ 正確示範：標題寫「Smart Deck 核心優勢」、內容寫「結合三代理架構，提升 80% 製作效率」。
+
+【結構規範】：
+1. **ContentItem 層級控制 (Level)**：
+   - `level=0`: 核心主軸 (大重點)。
+   - `level=1`: 支撐性論點/數據 (子重點)。
+   - `level=2`: 補充說明/來源。
+2. **欄位控制 (Column)**：
+   - `column=0`: 左欄 (預設)。
+   - `column=1`: 右欄 (僅用於 two_column 版型，適合做比較或對比)。
+3. **嚴格基於事實**：嚴禁發明 Chat History 中未提及的新聞或數據。若無數據請標示(需補充數據)。
+4. 只撰寫指定的這一頁，不要重複其他頁的內容。
+"""
+
+def _slide_context(state: AgentState, focus: str) -> str:
+    """依單頁的標題與重點挑選最相關的盤點資料，在 "slide" 預算內打包 (逐頁撰寫與反思修正共用)"""
+    return pack_context("slide", [
+        ("【盤點結果】", state.research_context),
+        ("【Chat History】", state.chat_history),
+        ("【Req】", state.user_request, True)
+    ], query=focus)
 
+def fan_out_slides(state: AgentState):
+    """骨架完成後，每一頁各送出一個 slide_drafter 任務 (LangGraph Send，平行執行)；骨架失敗則直接交給 writer_node 前的暫停點"""
+    if state.skeleton is None: return "writer_node"
+    skeleton = state.skeleton
+    deck_titles = [plan.title for plan in skeleton.slides]
+    tasks = []
+    for index, plan in enumerate(skeleton.slides):
+        # 每頁依自己的標題與重點挑選最相關的資料，各自在較小的預算內打包
+        context = _slide_context(state, f"{plan.title} {' '.join(plan.key_points)}")
+        tasks.append(Send("slide_drafter", SlideTask(
+            index=index, total=len(skeleton.slides), plan=plan, topic=skeleton.topic,
+            target_audience=skeleton.target_audience, deck_titles=deck_titles, context=context,
+            bypass_cache=state.bypass_llm_cache
+        )))
+    return tasks
+
+def slide_drafter(task: SlideTask, writer: StreamWriter):
+    """
+    撰寫單一頁投影片 (與其他頁平行執行)。
+    每頁各自重試 (call_llm_with_retry)；重試仍失敗時以骨架的重點提示產生替代頁，不影響其他頁。
+    """
+    plan = task.plan
+    annotate(slide=task.index + 1)
+    deck_overview = "\n".join(f"{i + 1}. {title}" for i, title in enumerate(task.deck_titles))
+    slide_request = (
+        f"簡報主題：{task.topic}\n目標受眾：{task.target_audience}\n\n【整份簡報的頁面】\n{deck_overview}\n\n"
+        f"【請撰寫第 {task.index + 1} 頁】\n版型：{plan.layout}\n標題：{plan.title}\n重點提示：{'；'.join(plan.key_points) or '(無)'}\n\n"
+        f"{task.context}"
+    )
     try:
-        reflect_res = call_llm_with_retry(llm, reflection_prompt).content.strip()
-
-        if "PERFECT" not in reflect_res.upper(): 
-            print(f"  -> 發現版面優化空間:\n{reflect_res}")
-            
-            refine_system = """
-            請根據【修改指令】重組並優化你的大綱結構。
-            你只需調整排版與分頁，絕對不可改變或捏造原有的數據與事實。
-            """
-            
-            final_outline = call_llm_with_retry(structured_llm, [
-                SystemMessage(content=refine_system),
-                HumanMessage(content=f"【原始簡報目標】:{state.user_request}\n【初版大綱】:{draft.model_dump_json()}\n【排版優化指令】:{reflect_res}")
-            ])
-            # ✨ 最終成功：回傳最終大綱，並清空錯誤
-            return {"outline": final_outline, "error_message": None}
-            
+        slide = call_llm_with_retry(get_llm(), [
+            SystemMessage(content=SLIDE_DRAFT_SYSTEM),
+            HumanMessage(content=slide_request)
+        ], schema=Slide, bypass_cache=task.bypass_cache)
+        if slide is None: raise ValueError("LLM 回傳了空的投影片")
+        # 版型以骨架為準，確保整份簡報的結構與規劃一致
+        slide = slide.model_copy(update={"layout": plan.layout})
+        failed = False
     except Exception as e:
-        # 如果在反思或修改階段炸掉，沒關係，我們至少還有初版 draft 可以用！
-        # 這裡不報錯，直接把初版回傳出去，這是非常棒的降級容錯設計。
-        print(f"Reflection/Refine Error: {e}. Falling back to initial draft.")
-        return {"outline": draft, "error_message": None}
-            
-    # ✨ 最終成功：回傳初版大綱 (因為反思說 PERFECT)，並清空錯誤
-    return {"outline": draft, "error_message": None}
\ No newline at end of file
+        print(f"⚠️ 第 {task.index + 1} 頁撰寫失敗，改用骨架內容：{e}")
+        slide = Slide(layout=plan.layout, title=plan.title, content=[ContentItem(text=point) for point in plan.key_points])
+        failed = True
+    writer({"stage": "draft_slide", "message": f"📄 第 {task.index + 1} 頁：{slide.title}" + (" (使用骨架內容)" if failed else ""),
+            "index": task.index + 1, "total": task.total})
+    return {"drafted_slides": [DraftedSlide(index=task.index, slide=slide, failed=failed)]}
+
+def outline_merger(state: AgentState, writer: StreamWriter):
+    """所有 slide_drafter 完成後，依骨架順序合併成完整大綱"""
+    skeleton = state.skeleton
+    slides = [drafted.slide for drafted in sorted(state.drafted_slides, key=lambda d: d.index)]
+    failed = sum(1 for drafted in state.drafted_slides if drafted.failed)
+    if not slides:
+        return {"outline": None, "error_message": "所有投影片都撰寫失敗，請稍後再試。"}
+    outline = PresentationOutline(topic=skeleton.topic, target_audience=skeleton.target_audience, slides=slides)
+    writer({"stage": "draft_done", "message": f"📝 初稿完成，共 {len(slides)} 頁" + (f" ({failed} 頁使用骨架內容)" if failed else "")})
+    return {"outline": outline}
+
+REFLECTION_SYSTEM = """
+你是頂級簡報架構師，正在審閱一份簡報大綱，請逐頁檢查「邏輯」、「排版」與「文案真實性」：
+【檢查1】：是否有「標題與內文重複」的冗餘資訊？
+【檢查2】：對於對比性內容(如A公司 vs B公司)，是否正確使用了 `two_column` 版型並分置左右欄？
+【檢查3】：單頁資訊量是否過載（超過 {max_bullets} 個重點）？若有，該拆頁 (split)。
+【檢查4】：是否出現「封面頁」、「結語」、「這裡放入數據」等無意義的佔位符或描述性文字？若有，必須改寫 (rewrite) 為真實的簡報文案。
+【檢查5】：相鄰兩頁內容單薄且主題相同時，可合併 (merge，與下一頁合併)。
+
+只列出需要修改的頁面並給出具體的修改指令；整份大綱都沒問題時回傳空的 verdicts。
+"""
+
+def _regenerate(state: AgentState, outline: PresentationOutline, verdict) -> list:
+    """依判決重新生成受影響的頁面，回傳新的投影片列表 (rewrite 為 1 頁、split 為多頁、merge 把兩頁合成 1 頁)"""
+    idx = verdict.index - 1
+    originals = outline.slides[idx:idx + (2 if verdict.action == "merge" else 1)]
+    focus = " ".join(slide.title for slide in originals)
+    originals_json = "\n".join(slide.model_dump_json(exclude_defaults=True) for slide in originals)
+    action_hint = {
+        "rewrite": "請改寫這一頁，輸出 1 頁。",
+        "split": "這一頁資訊過載，請拆成 2~3 頁，每頁重點不超過上限，並保留所有數據。",
+        "merge": "請把這兩頁合併成 1 頁，保留所有關鍵數據。",
+    }[verdict.action]
+    request = (
+        f"簡報主題：{outline.topic}\n目標受眾：{outline.target_audience}\n\n"
+        f"【原始頁面】\n{originals_json}\n\n【修改指令】\n{verdict.instruction or '(無)'}\n{action_hint}\n\n"
+        f"{_slide_context(state, focus)}"
+    )
+    with span(f"reflect.{verdict.action}", slide=verdict.index):
+        group = call_llm_with_retry(get_llm(), [
+            SystemMessage(content=SLIDE_DRAFT_SYSTEM),
+            HumanMessage(content=request)
+        ], schema=SlideGroup, bypass_cache=state.bypass_llm_cache)
+    if not group or not group.slides: raise ValueError("LLM 回傳了空的投影片")
+    return group.slides[:1] if verdict.action in ("rewrite", "merge") else group.slides
+
+def reflect_node(state: AgentState, writer: StreamWriter):
+    """
+    結構化反思 (最多 Config.REFLECTION_MAX_ITERATIONS 輪)：
+    1. 先做不需模型的本地檢查 (佔位符、重點過多、雙欄缺右欄)；全數通過且開啟
+       Config.REFLECTION_SKIP_CRITIQUE_WHEN_CLEAN 時才略過模型審閱 (預設仍審閱冗餘、雙欄配置與可合併的頁面)
+    2. 否則由模型逐頁給出判決 (keep / rewrite / split / merge)，與本地檢查的結果合併
+    3. 只平行重新生成受影響的頁面，再依原順序拼回大綱；任何一步失敗都保留現有版本
+    """
+    outline = state.outline
+    if outline is None: return {}
+    max_bullets = Config.MAX_BULLETS_PER_SLIDE
+
+    for iteration in range(1, Config.REFLECTION_MAX_ITERATIONS + 1):
+        print(f"  -> 進行邏輯與版面反思 (第 {iteration} 輪)...")
+        issues = lint_outline(outline, max_bullets)
+        if not issues and Config.REFLECTION_SKIP_CRITIQUE_WHEN_CLEAN:
+            writer({"stage": "reflect_verdict", "message": "✨ 結構檢查通過，無需修改", "verdict": "perfect"})
+            break
+
+        if issues:
+            writer({"stage": "reflect", "message": f"🧐 本地檢查發現 {len(issues)} 頁可能有問題，正在逐頁審閱..."})
+            lint_notes = "\n".join(f"第 {idx + 1} 頁：{'；'.join(found)}" for idx, found in issues.items())
+        else:
+            writer({"stage": "reflect", "message": "🧐 結構檢查通過，正在審閱冗餘、雙欄配置與可合併的頁面..."})
+            lint_notes = "(本地檢查未發現問題)"
+        try:
+            report = call_llm_with_retry(get_llm(), [
+                SystemMessage(content=REFLECTION_SYSTEM.format(max_bullets=max_bullets)),
+                HumanMessage(content=f"【大綱】\n{compact_outline_json(outline, 'reflect')}\n\n【本地檢查結果】\n{lint_notes}")
+            ], schema=ReflectionReport, bypass_cache=state.bypass_llm_cache)
+            llm_verdicts = report.verdicts if report else []
+        except Exception as e:
+            # 模型審閱失敗時仍依本地檢查的結果修正
+            print(f"Reflection Error: {e}. Using local lint verdicts only.")
+            llm_verdicts = []
+
+        verdicts = combine_verdicts(llm_verdicts, lint_verdicts(issues, outline, max_bullets), len(outline.slides))
+        if not verdicts:
+            writer({"stage": "reflect_verdict", "message": "✨ 審閱後無需修改", "verdict": "perfect"})
+            break
+
+        summary = "、".join(f"第 {v.index} 頁 {v.action}" for v in verdicts)
+        print(f"  -> 需要修正的頁面：{summary}")
+        writer({"stage": "reflect_verdict", "message": f"🛠️ 正在修正：{summary}", "verdict": "refine"})
+
+        replacements = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(verdicts), Config.REFLECTION_WORKERS)) as pool:
+            futures = {pool.submit(bind_context(_regenerate), state, outline, v): v for v in verdicts}
+            for future in concurrent.futures.as_completed(futures):
+                v = futures[future]
+                try:
+                    replacements[v.index - 1] = (2 if v.action == "merge" else 1, future.result())
+                except Exception as e:
+                    # 單頁修正失敗就保留原頁面
+                    print(f"⚠️ 第 {v.index} 頁修正失敗，保留原內容：{e}")
+        if not replacements: break
+
+        outline = outline.model_copy(update={"slides": splice_slides(outline.slides, replacements)})
+        writer({"stage": "refine_done", "message": f"✅ 已修正 {len(replacements)} 處，共 {len(outline.slides)} 頁"})
+
+    return {"outline": outline, "error_message": None}
@@ -0,0 +1,172 @@
+# src/agents/memory.py
+import threading
+import concurrent.futures
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, ToolMessage
+from src.config import Config
+from src.utils.tokens import estimate_tokens, estimate_message_tokens
+from src.utils.rate_limiter import quota_scheduler
+from src.utils.tracing import span, bind_context
+
+SUMMARY_SYSTEM = """
+你是研究對話的「記憶整理員」。請把【新增對話】的內容併入【目前摘要】，輸出一份更新後的完整摘要。
+規則：
+1. 保留所有具體事實與數字 (營收、成長率、日期、排名…)，並標註來源 (文件名稱或網址)。
+2. 保留使用者的目標、偏好、已確認的決策與尚未解決的問題。
+3. 刪除寒暄、重複內容與工具呼叫的過程細節；不要捏造任何內容。
+4. 以條列式繁體中文輸出，總長度控制在約 {max_tokens} tokens 以內，篇幅不足時優先保留數據與來源。
+"""
+
+SUMMARY_HEADER = "【先前對話摘要】(較早回合已壓縮，以下為重點與數據)"
+SYSTEM_NOTICE_KEY = "system_notice"
+
+# 摘要在背景執行緒更新，使用者的回覆不必等摘要模型
+_summary_pool = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-summary")
+
+_llm = None
+_llm_lock = threading.Lock()
+
+def get_summary_llm():
+    """摘要用的模型 (全行程共用，temperature=0 讓摘要穩定)"""
+    global _llm
+    with _llm_lock:
+        if _llm is None:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+            _llm = ChatGoogleGenerativeAI(model=Config.MODEL_FAST, google_api_key=Config.GOOGLE_API_KEY, temperature=0)
+        return _llm
+
+def system_notice(text: str) -> HumanMessage:
+    """App 插入對話的系統通知 (檔案匯入 / 移除)；模型看得到，但不算一個使用者回合"""
+    return HumanMessage(content=f"[系統] {text}", additional_kwargs={SYSTEM_NOTICE_KEY: True})
+
+def is_system_notice(message) -> bool:
+    return isinstance(message, HumanMessage) and bool(message.additional_kwargs.get(SYSTEM_NOTICE_KEY))
+
+def _is_turn_start(message) -> bool:
+    return isinstance(message, HumanMessage) and not is_system_notice(message)
+
+def _fingerprint(message) -> tuple:
+    return type(message).__name__, hash(str(message.content))
+
+def format_transcript(messages: list, tool_chars: int) -> str:
+    """把一段對話轉成給摘要模型閱讀的逐字稿，工具結果只保留開頭"""
+    lines = []
+    for m in messages:
+        if is_system_notice(m):
+            lines.append(f"系統通知：{m.content}")
+        elif isinstance(m, HumanMessage):
+            lines.append(f"使用者：{m.content}")
+        elif isinstance(m, ToolMessage):
+            content = str(m.content)
+            if len(content) > tool_chars: content = content[:tool_chars] + "…(以下省略)"
+            lines.append(f"工具結果 ({m.name})：{content}")
+        elif isinstance(m, AIMessage):
+            for tc in getattr(m, "tool_calls", None) or []:
+                lines.append(f"助理呼叫工具 {tc['name']}：{tc['args']}")
+            if m.content: lines.append(f"助理：{m.content}")
+    return "\n".join(lines)
+
+class ConversationMemory:
+    """
+    每個 Session 的滾動對話記憶。
+    - 最近 keep_turns 個回合 (以使用者的 HumanMessage 起算，系統通知不算回合) 保留原文；其中已完成回合的工具結果截短，
+      因為助理的回覆已消化過這些內容，只有進行中的回合需要完整的工具結果
+    - 更早的回合併入滾動摘要；每累積 summarize_every 個回合才呼叫一次模型，且只送「上次摘要 + 新增的回合」
+    - 摘要在背景更新，build 不等待：完成前較早的回合暫時保留原文，完成後下一次 build 才套用
+    - 摘要失敗時這些回合繼續保留原文，下次再試，不會遺失資料
+    """
+    def __init__(self, keep_turns: int, summarize_every: int, summary_max_tokens: int, tool_result_chars: int, digest_tool_chars: int):
+        self.keep_turns = keep_turns
+        self.summarize_every = summarize_every
+        self.summary_max_tokens = summary_max_tokens
+        self.tool_result_chars = tool_result_chars
+        self.digest_tool_chars = digest_tool_chars
+        self.summary = ""
+        self.summarized_upto = 0   # messages[:summarized_upto] 已併入摘要
+        self._anchor = None        # messages[summarized_upto - 1] 的指紋，用來偵測歷史被清空或改寫
+        self._pending = None       # 背景進行中的摘要更新 (同時最多一個)
+        self._generation = 0       # reset 時遞增，讓 reset 之前送出的摘要結果作廢
+        self._lock = threading.RLock()
+        self.stats = {"updates": 0, "failures": 0, "summarized_messages": 0}
+
+    def reset(self):
+        with self._lock:
+            self.summary, self.summarized_upto, self._anchor = "", 0, None
+            self._generation += 1
+
+    def _check_history(self, messages: list):
+        if self.summarized_upto == 0: return
+        if len(messages) < self.summarized_upto or _fingerprint(messages[self.summarized_upto - 1]) != self._anchor:
+            self.reset()
+
+    def _turn_starts(self, messages: list) -> list:
+        return [i for i in range(self.summarized_upto, len(messages)) if _is_turn_start(messages[i])]
+
+    def build(self, messages: list) -> tuple:
+        """回傳 (摘要文字, 最近回合的訊息)；訊息一定以 HumanMessage (使用者或系統通知) 開頭"""
+        with self._lock:
+            self._check_history(messages)
+            starts = self._turn_starts(messages)
+            if len(starts) >= self.keep_turns + self.summarize_every and self._pending is None:
+                self._schedule_summary(messages, starts[len(starts) - self.keep_turns])
+            # 第一個保留回合之前、尚未併入摘要的系統通知一起保留
+            first = starts[0] if starts else len(messages)
+            while first > self.summarized_upto and is_system_notice(messages[first - 1]):
+                first -= 1
+            summary = self.summary
+        recent = messages[first:]
+        return summary, self._compact_tool_results(recent) if recent else []
+
+    def _compact_tool_results(self, recent: list) -> list:
+        last_turn = max((i for i, m in enumerate(recent) if _is_turn_start(m)), default=len(recent))
+        compacted = []
+        for i, m in enumerate(recent):
+            if i < last_turn and isinstance(m, ToolMessage) and len(str(m.content)) > self.tool_result_chars:
+                m = m.model_copy(update={"content": str(m.content)[:self.tool_result_chars] + "\n…(較早回合的工具結果已截短，重點見助理當時的回覆)"})
+            compacted.append(m)
+        return compacted
+
+    def _schedule_summary(self, messages: list, boundary: int):
+        """在背景把 messages[summarized_upto:boundary] 併入摘要 (呼叫端需持有 _lock)"""
+        delta = messages[self.summarized_upto:boundary]
+        self._pending = _summary_pool.submit(bind_context(self._update_summary), delta, self.summary, boundary,
+                                             _fingerprint(messages[boundary - 1]), self._generation)
+
+    def _update_summary(self, delta: list, base_summary: str, boundary: int, anchor: tuple, generation: int):
+        prompt = [
+            SystemMessage(content=SUMMARY_SYSTEM.format(max_tokens=self.summary_max_tokens)),
+            HumanMessage(content=f"【目前摘要】\n{base_summary or '(尚無)'}\n\n【新增對話】\n{format_transcript(delta, self.digest_tool_chars)}")
+        ]
+        try:
+            with span("llm.memory_summary", "llm", model=Config.MODEL_FAST):
+                result = quota_scheduler.invoke(Config.MODEL_FAST, get_summary_llm(), prompt)
+        except Exception as e:
+            with self._lock:
+                self._pending = None
+                self.stats["failures"] += 1
+            print(f"⚠️ 對話摘要更新失敗，暫時保留原文：{e}")
+            return
+        with self._lock:
+            self._pending = None
+            if generation != self._generation: return # 摘要期間對話已被清空
+            self.summary = str(result.content).strip()
+            self.summarized_upto = boundary
+            self._anchor = anchor
+            self.stats["updates"] += 1
+            self.stats["summarized_messages"] += len(delta)
+        print(f"  -> [Memory] 併入 {len(delta)} 則訊息 ({estimate_message_tokens(delta)} tokens)，摘要 {estimate_tokens(self.summary)} tokens")
+
+    def to_handoff_text(self, messages: list) -> str:
+        """交接給 LangGraph 的 chat_history：摘要 + 最近回合原文 (格式與 context_packer 的分段規則一致)"""
+        summary, recent = self.build(messages)
+        parts = [f"====================\n{SUMMARY_HEADER}\n{summary}\n===================="] if summary else []
+        parts += [f"{type(m).__name__}: {m.content}" for m in recent]
+        return "\n".join(parts)
+
+def create_memory() -> ConversationMemory:
+    return ConversationMemory(
+        keep_turns=Config.MEMORY_KEEP_TURNS,
+        summarize_every=Config.MEMORY_SUMMARIZE_EVERY,
+        summary_max_tokens=Config.MEMORY_SUMMARY_MAX_TOKENS,
+        tool_result_chars=Config.MEMORY_TOOL_RESULT_CHARS,
+        digest_tool_chars=Config.MEMORY_DIGEST_TOOL_CHARS
+    )
@@ -0,0 +1,77 @@
+# src/agents/reflection.py
+import re
+from src.agents.state import SlideVerdict
+
+# 常見的佔位符與「給人類的建議」式文字 (「需補充數據」是撰寫規範允許的標示，不列入)
+PLACEHOLDER_RE = re.compile(
+    r"^(封面頁?|目錄|介紹|簡介|結語|謝謝|標題)$"
+    r"|這裡(放|填|插入|加入)|請(填入|插入|補上|在此)|在此(輸入|放入)|待補"
+    r"|\b(TODO|TBD|XXX|lorem ipsum|placeholder)\b",
+    re.IGNORECASE
+)
+
+def _is_placeholder(text: str) -> bool:
+    return bool(PLACEHOLDER_RE.search(text.strip()))
+
+def lint_outline(outline, max_bullets: int) -> dict:
+    """
+    不呼叫模型的本地檢查，回傳 {slide_index (0 起算): [問題描述, ...]}：
+    佔位符標題/內文、重點超過 max_bullets 個、雙欄版型缺右欄、內文只是重複標題。
+    """
+    issues = {}
+    for idx, slide in enumerate(outline.slides):
+        found = []
+        if _is_placeholder(slide.title):
+            found.append(f"標題「{slide.title}」是佔位詞")
+        placeholders = [item.text for item in slide.content if _is_placeholder(item.text)]
+        if placeholders:
+            found.append(f"內文含佔位文字：{'、'.join(t[:20] for t in placeholders[:3])}")
+        if len(slide.content) > max_bullets:
+            found.append(f"共 {len(slide.content)} 個重點，超過 {max_bullets} 個")
+        if slide.layout == "two_column" and not any(item.column == 1 for item in slide.content):
+            found.append("雙欄版型但沒有右欄內容")
+        if slide.content and all(item.text.strip() == slide.title.strip() for item in slide.content):
+            found.append("內文只是重複標題")
+        if found: issues[idx] = found
+    return issues
+
+def lint_verdicts(issues: dict, outline, max_bullets: int) -> list:
+    """把本地檢查的問題轉成判決：重點過多就拆頁，其餘改寫"""
+    verdicts = []
+    for idx, found in issues.items():
+        action = "split" if len(outline.slides[idx].content) > max_bullets else "rewrite"
+        verdicts.append(SlideVerdict(index=idx + 1, action=action, instruction="；".join(found)))
+    return verdicts
+
+def combine_verdicts(llm_verdicts: list, local_verdicts: list, slide_count: int) -> list:
+    """
+    合併模型與本地檢查的判決 (同一頁以模型為準，但模型判 keep 的頁面若本地檢查有問題仍會處理)，
+    並排除越界與互相衝突的判決 (merge 會吃掉下一頁，下一頁的其他判決就不再適用)。
+    """
+    by_index = {v.index: v for v in local_verdicts}
+    for v in llm_verdicts:
+        if not 1 <= v.index <= slide_count: continue
+        if v.action == "keep" and v.index in by_index: continue
+        by_index[v.index] = v
+    combined, consumed = [], set()
+    for index in sorted(by_index):
+        v = by_index[index]
+        if v.action == "keep" or index in consumed: continue
+        if v.action == "merge":
+            if index == slide_count: continue # 最後一頁沒有下一頁可合併
+            consumed.add(index + 1)
+        combined.append(v)
+    return combined
+
+def splice_slides(slides: list, replacements: dict) -> list:
+    """replacements: {起始 index (0 起算): (取代的頁數, [新投影片, ...])}，其餘頁面原樣保留"""
+    result, idx = [], 0
+    while idx < len(slides):
+        if idx in replacements:
+            span, new_slides = replacements[idx]
+            result.extend(new_slides)
+            idx += span
+        else:
+            result.append(slides[idx])
+            idx += 1
+    return result
@@ -1,5 +1,5 @@
 # src/agents/state.py
-from typing import List, Optional, Union, Literal
+from typing import List, Optional, Union, Literal, Annotated
 from pydantic import BaseModel, Field
 
 # --- 核心版型定義 (Layout Constitution) ---
@@ -28,6 +28,54 @@ class PresentationOutline(BaseModel):
     target_audience: str = Field(description="目標受眾")
     slides: List[Slide] = Field(description="規劃好的投影片列表")
 
+# --- 兩階段規劃：先出骨架，再逐頁平行撰寫 ---
+class SlidePlan(BaseModel):
+    layout: Literal["title", "section", "content", "two_column"] = Field(
+        description="版型 ID，必須精確符合此四者之一。"
+    )
+    title: str = Field(description="投影片標題")
+    key_points: List[str] = Field(default_factory=list, description="這一頁要涵蓋的重點提示 (2~5 點，供逐頁撰寫時參考)")
+
+class OutlineSkeleton(BaseModel):
+    topic: str = Field(description="簡報主題")
+    target_audience: str = Field(description="目標受眾")
+    slides: List[SlidePlan] = Field(description="依序排列的每頁規劃")
+
+class SlideTask(BaseModel):
+    """slide_drafter 節點的輸入 (由 Send 個別派送，不經過 AgentState)"""
+    index: int
+    total: int
+    plan: SlidePlan
+    topic: str
+    target_audience: str
+    deck_titles: List[str]
+    context: str # 已依本頁重點打包好的參考資料
+    bypass_cache: bool = False
+
+class DraftedSlide(BaseModel):
+    index: int
+    slide: Slide
+    failed: bool = False # 撰寫失敗、改用骨架內容
+
+# --- 結構化反思：逐頁判決，只重新生成有問題的頁面 ---
+class SlideVerdict(BaseModel):
+    index: int = Field(description="投影片編號 (從 1 開始)")
+    action: Literal["keep", "rewrite", "split", "merge"] = Field(
+        description="keep=保留、rewrite=改寫本頁、split=拆成多頁、merge=與下一頁合併"
+    )
+    instruction: str = Field(default="", description="具體的修改指令")
+
+class ReflectionReport(BaseModel):
+    verdicts: List[SlideVerdict] = Field(default_factory=list, description="只需列出需要修改的頁面，未列出的頁面視為 keep")
+
+class SlideGroup(BaseModel):
+    slides: List[Slide] = Field(description="拆頁 / 合併後的投影片 (依序)")
+
+def merge_drafted_slides(existing: Optional[list], new: Optional[list]) -> list:
+    """平行撰寫的結果彙整 (Reducer)；回傳 None 代表開始新一輪規劃，清空舊結果"""
+    if new is None: return []
+    return (existing or []) + new
+
 class AgentState(BaseModel):
     """
     LangGraph 的狀態物件，在各個 Node 之間傳遞。
@@ -35,8 +83,12 @@ class AgentState(BaseModel):
     user_request: str
     chat_history: str = ""
     session_id: str = "default"  # 隔離不同使用者的資料
+    skeleton: Optional[OutlineSkeleton] = None
+    research_context: str = ""   # 資料盤點的結果，逐頁撰寫時依各頁重點重新打包
+    drafted_slides: Annotated[List[DraftedSlide], merge_drafted_slides] = Field(default_factory=list)
     outline: Optional[PresentationOutline] = None
     final_file_path: Optional[str] = None
+    bypass_llm_cache: bool = False  # True：本次規劃不讀取 LLM 回應快取 (強制重新生成)
     
     # 專門讓後端把錯誤訊息傳給前端的通道
     error_message: Optional[str] = None
\ No newline at end of file
@@ -5,6 +5,7 @@ import traceback
 from src.agents.state import AgentState, ContentItem
 from src.tools.ppt_builder import create_presentation
 from src.config import Config
+from src.utils.tracing import span
 
 def clean_markdown_text(text: str) -> str:
     """清除 LLM 生成的 Markdown 符號，保持 PPT 純文字排版"""
@@ -78,16 +79,17 @@ def writer_node(state: AgentState):
         final_slides_data.append(slide_data)
         
     # ✨ [修改] 將檔名結合 Config.OUTPUT_DIR 變成絕對路徑
-    output_filename = f"presentation_{state.session_id[:8]}.pptx"
+    output_filename = f"presentation_{state.session_id}.pptx" # 完整 session_id，Session GC 依此比對要刪除的檔案
     output_filepath = os.path.join(Config.OUTPUT_DIR, output_filename)
     
     try:
-        ppt_path = create_presentation(
-            title=clean_markdown_text(outline.topic),
-            slides_content=final_slides_data,
-            template_path="template.pptx",
-            filename=output_filepath
-        )
+        with span("render.create_presentation", "render", slides=len(final_slides_data)):
+            ppt_path = create_presentation(
+                title=clean_markdown_text(outline.topic),
+                slides_content=final_slides_data,
+                template_path="template.pptx",
+                filename=output_filepath
+            )
         return {"final_file_path": ppt_path, "error_message": None}
     except Exception as e:
         error_msg = f"PPT 檔案生成失敗：{str(e)}"
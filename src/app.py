@@ -4,7 +4,9 @@ import os
 import sys
 import uuid
 import json
-import concurrent.futures
+import time
+
+rerun_started = time.perf_counter() # 量測每次 rerun 的前置耗時 (第一次 rerun 含匯入，即冷啟動)
 
 # 路徑修正
 current_file_path = os.path.abspath(__file__)
@@ -14,14 +16,20 @@ if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
 from src.config import Config
-from src.tools.rag import RAGManager
-from src.tools.search import search_tool, read_webpage
+from src.tools.rag_registry import rag_registry
+from src.tools.ingest_jobs import ingest_jobs
+from src.tools.session_gc import session_sweeper
+from src.tools.search import get_web_tools
+from src.tools.prefetch import page_prefetcher
+from src.tools.tool_executor import tool_executor
 from src.graph import agent_workflow
-from langchain_google_genai import ChatGoogleGenerativeAI
+from src.warmup import start_background_warmup
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage, SystemMessage
 from src.agents.state import PresentationOutline 
-from tenacity import retry, wait_exponential, stop_after_attempt, retry_if_exception_type
-from google.api_core.exceptions import ResourceExhausted 
+from src.agents.memory import create_memory, system_notice, SUMMARY_HEADER
+from src.utils.rate_limiter import quota_scheduler
+from src.utils.llm_cache import llm_cache
+from src.utils.tracing import trace, start_metrics_server
 
 TOOL_DISPLAY_NAMES = {
     "google_search": "🌏 正在搜尋網路... (Web Research)",
@@ -47,8 +55,42 @@ SYSTEM_PROMPT_TEMPLATE = """
 4. **絕對禁區**：嚴禁呼叫空參數。嚴禁捏造數據。
 """
 
+@st.cache_resource(show_spinner=False)
+def init_runtime():
+    """每個行程只執行一次：檢查設定、啟動背景回收與預熱 (設定錯誤時拋出例外，不會被快取)"""
+    Config.validate()
+    session_sweeper.start() # 背景回收過期 Session 的向量庫、上傳檔與輸出簡報
+    # 使用者看到畫面的同時，在背景建立 Gemini / Search Client，第一則訊息不必等待匯入
+    warmup = start_background_warmup()
+    if Config.METRICS_PORT: start_metrics_server(Config.METRICS_PORT)
+    return {"import_seconds": time.perf_counter() - rerun_started, "cold_start_seconds": None, "warmup": warmup}
+
+@st.cache_resource(show_spinner=False)
+def get_chat_llm():
+    """對話模型全行程共用，不必每次 rerun 重建"""
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model=Config.MODEL_FAST, google_api_key=Config.GOOGLE_API_KEY, temperature=0.7)
+
+def get_session_tools(rag_manager) -> dict:
+    """
+    Session 專屬的工具組與 bind_tools 結果存放在 session_state，rerun 時直接重用；
+    rag_manager 換人 (重置對話或被回收後重建) 時才重新建立。llm_with_tools 在第一次對話時才綁定。
+    """
+    cached = st.session_state.get("session_tools")
+    if cached is None or cached["owner"] is not rag_manager:
+        tools = [rag_manager.get_tool(), *get_web_tools(rag_manager.session_id)] # 搜尋工具綁定 Session，背景預取依 Session 計算額度
+        cached = {"owner": rag_manager, "tools": tools, "tool_map": {t.name: t for t in tools}, "llm_with_tools": None}
+        st.session_state.session_tools = cached
+    return cached
+
+def get_llm_with_tools():
+    session_tools = get_session_tools(rag_manager)
+    if session_tools["llm_with_tools"] is None:
+        session_tools["llm_with_tools"] = get_chat_llm().bind_tools(session_tools["tools"])
+    return session_tools["llm_with_tools"]
+
 st.set_page_config(page_title="Smart Deck Agent", page_icon="📊", layout="wide")
-try: Config.validate()
+try: runtime = init_runtime()
 except Exception as e: st.error(f"環境設定錯誤: {e}"); st.stop()
 
 # --- 狀態初始化 ---
@@ -56,61 +98,120 @@ if "session_id" not in st.session_state:
     st.session_state.session_id = str(uuid.uuid4())
     st.session_state.messages = []
     st.session_state.db_files = set() 
+    st.session_state.ingest_job_ids = {} # 背景匯入中的工作 {job_id: (filename, size)}
+    st.session_state.failed_uploads = set() # 匯入失敗或已取消的上傳 {(filename, size)}，檔案仍留在上傳區時不重送
     st.session_state.file_uploader_key = 0
     st.session_state.final_file_path = None 
+if "memory" not in st.session_state:
+    st.session_state.memory = create_memory() # 滾動對話記憶 (歷史被清空時會自動重置)
 
-rag_manager = RAGManager(st.session_state.session_id)
-rag_tool = rag_manager.get_tool()
-tools = [rag_tool, search_tool, read_webpage]
-tool_map = {"read_knowledge_base": rag_tool, "google_search": search_tool, "read_webpage": read_webpage}
-llm = ChatGoogleGenerativeAI(model=Config.MODEL_FAST, google_api_key=Config.GOOGLE_API_KEY, temperature=0.7)
-llm_with_tools = llm.bind_tools(tools)
+rag_manager = rag_registry.get(st.session_state.session_id) # 同一 Session 重複使用同一個 Manager
+session_tools = get_session_tools(rag_manager)
+rag_tool, tool_map = session_tools["tools"][0], session_tools["tool_map"]
 
 # 讀取目前 Graph 執行緒的狀態
 thread_config = {"configurable": {"thread_id": st.session_state.session_id}}
 state_snapshot = agent_workflow.get_state(thread_config)
 is_paused = "writer_node" in state_snapshot.next
 
-def get_safe_history(messages, limit=10):
-    if not messages: return []
-    if len(messages) <= limit:
-        start_idx = 0
-        while start_idx < len(messages) and not isinstance(messages[start_idx], HumanMessage): start_idx += 1
-        return messages[start_idx:] if start_idx < len(messages) else []
-    start_idx = len(messages) - limit
-    while start_idx > 0 and not isinstance(messages[start_idx], HumanMessage): start_idx -= 1
-    return messages[start_idx:]
+rerun_setup_ms = (time.perf_counter() - rerun_started) * 1000
+if runtime["cold_start_seconds"] is None:
+    runtime["cold_start_seconds"] = rerun_setup_ms / 1000
+    print(f"🚀 冷啟動完成：匯入 {runtime['import_seconds']:.2f}s，首次畫面前置 {runtime['cold_start_seconds']:.2f}s")
+
+def build_chat_messages(system_prompt: str) -> list:
+    """系統提示 + 較早回合的滾動摘要 + 最近回合原文 (摘要在累積足夠回合時於背景增量更新，不阻塞回覆)"""
+    summary, recent = st.session_state.memory.build(st.session_state.messages)
+    if summary: system_prompt += f"\n### 🗂️ {SUMMARY_HEADER}\n{summary}\n"
+    return [SystemMessage(content=system_prompt)] + recent
+
+@st.fragment(run_every=1.5)
+def render_ingest_progress():
+    """輪詢背景匯入工作的進度；有工作結束時才觸發整頁 rerun 更新知識庫狀態"""
+    finished = False
+    for job_id, (filename, size) in list(st.session_state.ingest_job_ids.items()):
+        job = ingest_jobs.status(job_id)
+        if job is None:
+            del st.session_state.ingest_job_ids[job_id]
+            continue
+        if job["status"] in ("queued", "running"):
+            if job["status"] == "queued": label = "排隊中"
+            elif job["stage"] == "summarizing": label = f"已嵌入 {job['chunks_embedded']} 個片段，正在產生文件摘要"
+            else: label = f"已解析 {job['pages_parsed']} 頁、已嵌入 {job['chunks_embedded']} 個片段"
+            col_info, col_cancel = st.columns([4, 1])
+            col_info.caption(f"⏳ {filename}：{label}")
+            if col_cancel.button("✖", key=f"cancel_{job_id}", help="取消匯入"):
+                ingest_jobs.cancel(job_id)
+            continue
+
+        finished = True
+        del st.session_state.ingest_job_ids[job_id]
+        if job["status"] == "done":
+            st.session_state.db_files.add(filename)
+            st.session_state.messages.append(system_notice(job["message"]))
+        else:
+            # 失敗或取消只提示一次；同一份上傳不再自動重送，移除或換檔後才會重新匯入
+            st.session_state.failed_uploads.add((filename, size))
+        st.toast(job["message"])
+    if finished: st.rerun()
 
 # --- Sidebar UI ---
 with st.sidebar:
     st.title("💬 Smart Deck Agent")
     st.caption(f"🔑 Session: {st.session_state.session_id[:8]}")
+    if Config.ENV_MODE == "dev":
+        warmup_report = runtime["warmup"].report
+        warmup_label = f"{warmup_report['total_seconds']:.1f}s" if warmup_report else "進行中"
+        st.caption(f"🚀 冷啟動 {runtime['cold_start_seconds']:.1f}s · 預熱 {warmup_label} · 本次 rerun 前置 {rerun_setup_ms:.0f} ms")
+    llm_quota = quota_scheduler.stats().get(Config.MODEL_FAST)
+    if llm_quota and llm_quota["wait_max_ms"] > 0:
+        st.caption(f"⏱️ Gemini 排隊等待 p95：{llm_quota['wait_p95_ms'] / 1000:.1f}s (429 次數：{llm_quota['throttled']})")
+    if Config.PREFETCH_ENABLED:
+        prefetch_stats = page_prefetcher.stats()
+        st.caption(f"⚡ 網頁預取：{prefetch_stats['issued']} 頁，實際被閱讀 {prefetch_stats['used']} 頁 ({prefetch_stats['usage_rate']:.0%})")
+    if Config.LLM_CACHE_ENABLED:
+        llm_cache_stats = llm_cache.stats()
+        st.caption(f"🧠 LLM 回應快取：命中 {llm_cache_stats['hits']} 次 ({llm_cache_stats['hit_rate']:.0%})")
     st.header("📂 資料來源")
     
     uploaded_files = st.file_uploader("上傳 PDF/TXT", type=["pdf", "txt"], accept_multiple_files=True, key=f"uploader_{st.session_state.file_uploader_key}")
     current_filenames = {f.name for f in uploaded_files} if uploaded_files else set()
 
-    new_files = [f for f in uploaded_files if f.name not in st.session_state.db_files] if uploaded_files else []
+    # 新檔案丟進背景佇列建立索引，不阻塞對話
+    # 已離開上傳區的失敗檔案不再記錄，使用者重新上傳時會再匯入一次
+    st.session_state.failed_uploads = {entry for entry in st.session_state.failed_uploads if entry[0] in current_filenames}
+    pending_filenames = {filename for filename, _ in st.session_state.ingest_job_ids.values()}
+    new_files = [
+        f for f in uploaded_files
+        if f.name not in st.session_state.db_files and f.name not in pending_filenames and (f.name, f.size) not in st.session_state.failed_uploads
+    ] if uploaded_files else []
     for file in new_files:
-        with st.spinner(f"處理中：{file.name}..."):
-            res = rag_manager.ingest_file(file.getbuffer(), file.name)
-            if "✅" in res:
-                st.session_state.db_files.add(file.name)
-                st.session_state.messages.append(HumanMessage(content=f"[系統] {res}"))
-                st.success(res) 
-            else: st.error(res)
+        job_id = ingest_jobs.submit(rag_manager, file.getbuffer(), file.name)
+        st.session_state.ingest_job_ids[job_id] = (file.name, file.size)
+
+    # 還在匯入中就被移除的檔案：直接取消工作
+    for job_id, (filename, _) in st.session_state.ingest_job_ids.items():
+        if filename not in current_filenames: ingest_jobs.cancel(job_id)
+
+    if st.session_state.ingest_job_ids:
+        render_ingest_progress()
 
     removed_files = st.session_state.db_files - current_filenames
     if removed_files:
         for filename in removed_files:
             res = rag_manager.remove_file(filename)
             st.session_state.db_files.remove(filename)
-            st.session_state.messages.append(HumanMessage(content=f"[系統] {res}"))
+            st.session_state.messages.append(system_notice(res))
             st.success(res) 
 
     if st.button("🗑️ Reset", type="secondary"):
+        ingest_jobs.cancel_session(st.session_state.session_id)
+        page_prefetcher.cancel_session(st.session_state.session_id)
         rag_manager.reset()
+        session_sweeper.retire(st.session_state.session_id)
         st.session_state.db_files = set()
+        st.session_state.ingest_job_ids = {}
+        st.session_state.failed_uploads = set()
         st.session_state.messages = []
         st.session_state.file_uploader_key += 1
         st.session_state.session_id = str(uuid.uuid4()) 
@@ -122,24 +223,30 @@ with st.sidebar:
     st.header("⚙️ 生成控制台")
     if not is_paused:
         # 【階段 1】：規劃大綱
+        bypass_llm_cache = Config.LLM_CACHE_ENABLED and st.checkbox("🔄 忽略快取，重新生成", help="相同的對話與資料預設會直接沿用上次的規劃結果")
         if st.button("✨ 1. 規劃簡報大綱", type="primary", use_container_width=True):
             if not st.session_state.messages and not st.session_state.db_files:
                 st.warning("⚠️ 請先在右側與 AI 討論，或者在上傳文件後再點擊生成！")
             else:
-                with st.status("🤖 🧠 Manager: 正在分析資料與規劃大綱...", expanded=True) as status:
-                    
-                    safe_outline_msgs = get_safe_history(st.session_state.messages, limit=12) if st.session_state.messages else []
-                    chat_history_str = "\n".join([f"{type(m).__name__}: {m.content}" for m in safe_outline_msgs])
+                with st.status("🤖 🧠 Manager: 正在分析資料與規劃大綱...", expanded=True) as status, \
+                     trace("plan_outline", session_id=st.session_state.session_id[:8]) as run_trace:
+                    st.session_state.last_trace = run_trace # st.rerun() 之後 Trace 已結束，下一次 rerun 顯示瀑布圖
+                    chat_history_str = st.session_state.memory.to_handoff_text(st.session_state.messages)
                     
                     rag_context = ""
                     if st.session_state.db_files:
-                        status.update(label="📚 Manager: 正在調閱並整合知識庫文件內容...")
-                        try:
-                            file_names = ", ".join(st.session_state.db_files)
-                            rag_result = rag_tool.invoke({"query": f"請詳細總結 {file_names} 的所有核心內容、數據與亮點，以利後續製作簡報。"})
-                            rag_context = f"\n\n====================\n【系統背景提取：知識庫文件核心內容】:\n{rag_result}\n====================\n"
-                        except Exception as e:
-                            rag_context = f"\n\n(知識庫文件讀取發生錯誤，請依賴對話紀錄: {e})\n"
+                        # 匯入時已預先算好每份文件的摘要，直接組裝即可；只有沒有摘要的檔案才即時檢索
+                        doc_summaries = rag_manager.get_document_summaries()
+                        summary_blocks = [f"---片段---\n《{name}》\n{doc_summaries[name]}" for name in sorted(st.session_state.db_files) if name in doc_summaries]
+                        missing_files = [name for name in sorted(st.session_state.db_files) if name not in doc_summaries]
+                        if missing_files:
+                            status.update(label="📚 Manager: 正在調閱並整合知識庫文件內容...")
+                            try:
+                                file_names = ", ".join(missing_files)
+                                summary_blocks.append(rag_tool.invoke({"query": f"請詳細總結 {file_names} 的所有核心內容、數據與亮點，以利後續製作簡報。"}))
+                            except Exception as e:
+                                summary_blocks.append(f"(知識庫文件讀取發生錯誤，請依賴對話紀錄: {e})")
+                        rag_context = "\n\n====================\n【系統背景提取：知識庫文件核心內容】:\n" + "\n\n".join(summary_blocks) + "\n====================\n"
                             
                     final_chat_history = chat_history_str + rag_context
                     
@@ -153,11 +260,15 @@ with st.sidebar:
                     initial_state = {
                         "user_request": user_request_text, 
                         "chat_history": final_chat_history,
-                        "session_id": st.session_state.session_id
+                        "session_id": st.session_state.session_id,
+                        "bypass_llm_cache": bypass_llm_cache
                     }
                     try:
-                        for output in agent_workflow.stream(initial_state, config=thread_config):
-                            pass 
+                        # 同時串流節點更新與 manager_node 的進度事件，邊規劃邊顯示
+                        for mode, chunk in agent_workflow.stream(initial_state, config=thread_config, stream_mode=["updates", "custom"]):
+                            if mode == "custom":
+                                st.write(chunk["message"])
+                                status.update(label=f"🤖 🧠 Manager: {chunk['message']}")
                         status.update(label="✅ 大綱規劃完成！請在右側主畫面檢查。", state="complete")
                         st.rerun() 
                     except Exception as e:
@@ -171,6 +282,8 @@ with st.sidebar:
         st.info("👉 請在右側主畫面檢查並修改大綱內容。")
         
         if st.button("🗑️ 捨棄重來", use_container_width=True):
+            page_prefetcher.cancel_session(st.session_state.session_id)
+            session_sweeper.retire(st.session_state.session_id)
             st.session_state.session_id = str(uuid.uuid4())
             st.session_state.final_file_path = None
             st.rerun()
@@ -178,17 +291,72 @@ with st.sidebar:
     if st.session_state.get("final_file_path") and os.path.exists(st.session_state.final_file_path):
         with open(st.session_state.final_file_path, "rb") as f:
             st.download_button(
-                label="📥 點此下載最新簡報 (PPTX)", data=f, file_name=os.path.basename(st.session_state.final_file_path),
+                label="📥 點此下載最新簡報 (PPTX)", data=f, file_name=f"presentation_{st.session_state.session_id[:8]}.pptx",
                 mime="application/vnd.openxmlformats-officedocument.presentationml.presentation", type="primary", use_container_width=True
             )
 
-@retry(retry=retry_if_exception_type(ResourceExhausted), wait=wait_exponential(multiplier=2, min=2, max=10), stop=stop_after_attempt(3), reraise=True)
 def safe_llm_invoke(llm, messages):
-    return llm.invoke(messages)
+    # 經過全域配額排程器：額度不足時排隊 (對話優先於背景匯入)，遇到 429 自動降速重試
+    return quota_scheduler.invoke(Config.MODEL_FAST, llm, messages)
+
+def stream_llm_response(llm, messages, placeholder):
+    """串流模型回覆：文字逐字顯示在 placeholder，結束後回傳完整的 AIMessage (含合併後的 tool_calls)"""
+    collected = {}
+    def text_chunks():
+        full = None
+        for chunk in quota_scheduler.stream(Config.MODEL_FAST, llm, messages):
+            full = chunk if full is None else full + chunk
+            if isinstance(chunk.content, str) and chunk.content:
+                yield chunk.content
+        collected["message"] = full
+
+    with placeholder.container():
+        st.write_stream(text_chunks())
+    full = collected.get("message")
+    if full is None: return AIMessage(content="")
+    # AIMessageChunk 轉回一般 AIMessage，歷史紀錄與 chat_history 的型別名稱才會一致
+    return AIMessage(content=full.content, tool_calls=full.tool_calls, id=full.id,
+                     response_metadata=full.response_metadata, usage_metadata=full.usage_metadata)
+
+TRACE_LABELS = {"plan_outline": "規劃大綱", "render_deck": "排版"}
+
+def render_trace_waterfall(run_trace):
+    """上一次規劃 / 排版的耗時瀑布圖：每個 Span 一列 (依開始時間排序，子 Span 縮排)，滑鼠移上去看 Token、重試與快取"""
+    import altair as alt
+    spans = run_trace.span_dicts()
+    parents = {s["span_id"]: s["parent_id"] for s in spans}
+    def depth(span_id):
+        level = 0
+        while parents.get(span_id): span_id, level = parents[span_id], level + 1
+        return level
+
+    rows = []
+    for order, s in enumerate(sorted(spans, key=lambda s: s["start_ms"]), 1):
+        rows.append({
+            "row": f"{order:>2}. {'　' * depth(s['span_id'])}{s['name']}", "kind": s["kind"],
+            "start_ms": s["start_ms"], "end_ms": s["start_ms"] + s["duration_ms"], "duration_ms": s["duration_ms"],
+            "tokens": f"{s['input_tokens']} / {s['output_tokens']}", "retries": s["retries"],
+            "cache": f"{s['cache_hits']} hit / {s['cache_misses']} miss", "detail": json.dumps(s["attrs"], ensure_ascii=False)[:200],
+        })
+    totals = run_trace.totals()
+    label = TRACE_LABELS.get(run_trace.name, run_trace.name)
+    with st.expander(f"⏱️ 上次{label}：{totals['duration_ms'] / 1000:.1f}s · LLM {totals['llm_calls']} 次 · "
+                     f"{totals['input_tokens'] + totals['output_tokens']} tokens · 重試 {totals['retries']} 次 · 快取命中 {totals['cache_hits']} 次"):
+        chart = alt.Chart(alt.Data(values=rows)).mark_bar().encode(
+            x=alt.X("start_ms:Q", title="ms"), x2="end_ms:Q",
+            y=alt.Y("row:N", sort=None, title=None),
+            color=alt.Color("kind:N", title="類型"),
+            tooltip=["row:N", "duration_ms:Q", "tokens:N", "retries:Q", "cache:N", "detail:N"],
+        ).properties(height=max(120, 22 * len(rows)))
+        st.altair_chart(chart, use_container_width=True)
+        st.download_button("📄 下載 Trace (JSONL)", run_trace.to_jsonl(), file_name=f"trace_{run_trace.trace_id[:8]}.jsonl", mime="application/jsonl")
 
 # ==========================================
 # --- 畫面主體切換邏輯 ---
 # ==========================================
+if st.session_state.get("last_trace") is not None and st.session_state.last_trace.end is not None:
+    render_trace_waterfall(st.session_state.last_trace)
+
 if is_paused:
     # 🔴 暫停模式：顯示寬敞的 JSON 編輯器
     st.header("📝 簡報大綱編輯器")
@@ -208,11 +376,11 @@ if is_paused:
                 with st.spinner("🧠 AI 正在理解指示並進行局部修改..."):
                     try:
                         editor_system = "你是頂尖的簡報大綱編輯器。請根據使用者的【修改指示】，調整現有的【目前大綱】，並回傳完整的最新 JSON 結構。"
-                        structured_editor = llm.with_structured_output(PresentationOutline)
-                        new_outline = structured_editor.invoke([
+                        # 相同的大綱與指示直接沿用上次的修改結果 (Config.LLM_CACHE_ENABLED)
+                        new_outline = llm_cache.invoke(get_chat_llm(), [
                             SystemMessage(content=editor_system),
                             HumanMessage(content=f"【目前大綱】:\n{edited_json}\n\n【修改指示】:\n{ai_edit_instruction}")
-                        ])
+                        ], safe_llm_invoke, schema=PresentationOutline)
                         agent_workflow.update_state(thread_config, {"outline": new_outline})
                         st.rerun() 
                     except Exception as e:
@@ -222,7 +390,9 @@ if is_paused:
                 
         st.markdown("---")
         if st.button("✅ 2. 確認並排版 (產生 PPT)", type="primary"):
-            with st.status("✍️ Writer: 正在渲染投影片...", expanded=True) as status:
+            with st.status("✍️ Writer: 正在渲染投影片...", expanded=True) as status, \
+                 trace("render_deck", session_id=st.session_state.session_id[:8]) as run_trace:
+                st.session_state.last_trace = run_trace
                 try:
                     updated_outline_dict = json.loads(edited_json)
                     updated_outline = PresentationOutline(**updated_outline_dict)
@@ -282,16 +452,17 @@ else:
 
         with st.chat_message("assistant"):
             status_box = st.empty()
+            reply_box = st.empty() # 模型回覆逐字串流顯示的位置
             with st.spinner("思考中..."):
                 try:
                     file_count = len(st.session_state.db_files)
                     file_names = ", ".join(st.session_state.db_files) if file_count > 0 else "無"
                     dynamic_system_prompt = SYSTEM_PROMPT_TEMPLATE.format(file_count=file_count, file_names=file_names)
                     
-                    safe_messages = get_safe_history(st.session_state.messages, limit=12)
-                    messages_to_send = [SystemMessage(content=dynamic_system_prompt)] + safe_messages
+                    messages_to_send = build_chat_messages(dynamic_system_prompt)
                     
-                    response = safe_llm_invoke(llm_with_tools, messages_to_send)
+                    llm_with_tools = get_llm_with_tools()
+                    response = stream_llm_response(llm_with_tools, messages_to_send, reply_box)
                     st.session_state.messages.append(response)
 
                     MAX_ITERATIONS = 3
@@ -300,31 +471,38 @@ else:
                     while response.tool_calls and current_iteration < MAX_ITERATIONS:
                         current_iteration += 1
                         
-                        for tc in response.tool_calls:
-                            name = tc["name"]
-                            args = tc["args"]
-                            display_val = args.get("query") or args.get("url") or str(args)
-                            display_name = TOOL_DISPLAY_NAMES.get(name, f"🔧 {name}")
-                            
-                            if current_iteration == 1: action_prefix = "⚡ 正在執行"
-                            elif current_iteration == 2: action_prefix = "🔄 深入追蹤線索"
-                            else: action_prefix = "🕵️‍♂️ 擴大檢索範圍"
-                            status_box.info(f"{action_prefix}：{display_name} ({display_val[:30]}...)")
-                        
-                        def execute_tool(tc):
-                            tool_instance = tool_map.get(tc["name"])
-                            return tool_instance.invoke(tc["args"]) if tool_instance else "Tool not found"
+                        if current_iteration == 1: action_prefix = "⚡ 正在執行"
+                        elif current_iteration == 2: action_prefix = "🔄 深入追蹤線索"
+                        else: action_prefix = "🕵️‍♂️ 擴大檢索範圍"
+
+                        def describe(tc):
+                            display_val = tc["args"].get("query") or tc["args"].get("url") or str(tc["args"])
+                            display_name = TOOL_DISPLAY_NAMES.get(tc["name"], f"🔧 {tc['name']}")
+                            return f"{display_name} ({display_val[:30]}...)"
+
+                        status_lines = {tc["id"]: f"⏳ {describe(tc)}" for tc in response.tool_calls}
+                        status_box.info(f"{action_prefix}：\n\n" + "\n\n".join(status_lines.values()))
+
+                        def on_tool_result(tc, res, elapsed, done, total):
+                            # 每完成一個工具就更新狀態框，不必等最慢的網頁
+                            icon = "⏱️" if str(res).startswith(("⏱️", "⏹️")) else "✅"
+                            status_lines[tc["id"]] = f"{icon} {describe(tc)} · {elapsed:.1f}s"
+                            status_box.info(f"{action_prefix} ({done}/{total})：\n\n" + "\n\n".join(status_lines.values()))
 
-                        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-                            results = list(executor.map(execute_tool, response.tool_calls))
+                        # 知識庫查詢合併成一次批次檢索，其餘工具依各自的併發上限與逾時平行執行
+                        result_by_id = tool_executor.run(
+                            response.tool_calls, tool_map, on_result=on_tool_result,
+                            batch_handlers={"read_knowledge_base": lambda calls: rag_manager.query_batch([tc["args"].get("query", "") for tc in calls])},
+                            deadline_seconds=Config.TOOL_ROUND_DEADLINE_SECONDS
+                        )
+                        results = [result_by_id[tc["id"]] for tc in response.tool_calls]
                         
                         for tc, res in zip(response.tool_calls, results):
                             st.session_state.messages.append(ToolMessage(content=str(res), tool_call_id=tc["id"], name=tc["name"]))
                         
-                        safe_messages = get_safe_history(st.session_state.messages, limit=15)
-                        messages_to_send = [SystemMessage(content=dynamic_system_prompt)] + safe_messages
+                        messages_to_send = build_chat_messages(dynamic_system_prompt)
                         
-                        response = safe_llm_invoke(llm_with_tools, messages_to_send)
+                        response = stream_llm_response(llm_with_tools, messages_to_send, reply_box)
                         st.session_state.messages.append(response)
                     
                     status_box.empty()
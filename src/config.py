@@ -9,11 +9,108 @@ class Config:
     MODEL_SMART = "gemini-2.5-flash-lite" # rate limit 限制, 先用輕量模型
     MODEL_FAST = "gemini-2.5-flash-lite" 
     MODEL_EMBEDDING = "models/gemini-embedding-001"
+    # 各模型每分鐘的請求數 / Token 配額 (依實際方案調整)；MODEL_SMART 與 MODEL_FAST 相同時共用同一組額度
+    MODEL_QUOTAS = {
+        MODEL_SMART: {"rpm": int(os.getenv("QUOTA_LLM_RPM", "15")), "tpm": int(os.getenv("QUOTA_LLM_TPM", "250000"))},
+        MODEL_FAST: {"rpm": int(os.getenv("QUOTA_LLM_RPM", "15")), "tpm": int(os.getenv("QUOTA_LLM_TPM", "250000"))},
+        MODEL_EMBEDDING: {"rpm": int(os.getenv("QUOTA_EMBEDDING_RPM", "100")), "tpm": int(os.getenv("QUOTA_EMBEDDING_TPM", "30000"))},
+    }
+    QUOTA_MAX_RETRIES = 3                                                     # 收到 429 後由排程器統一重試的次數
+    EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "google") # "google" 或 "hash" (離線 Benchmark 用)
+    HASH_EMBEDDING_DIM = 768
+    
+    # --- RAG 設定 ---
+    EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000")) # 跨 Session Embedding 快取上限 (片段數)
+    INGEST_PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", "2"))       # PDF 平行解析的行程數
+    INGEST_PAGES_PER_TASK = 8                                                 # 每個解析任務負責的頁數
+    INGEST_EMBED_BATCH = 64                                                   # 每批送去 Embedding 的片段數
+    INGEST_EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", "4"))       # 全域同時進行的 Embedding 批次數
+    INGEST_MAX_INFLIGHT_BATCHES = 4                                           # 單一檔案最多在途批次 (控制記憶體上限)
+    INGEST_MAX_CONCURRENT_FILES = 3                                           # 同時匯入的檔案數
+    DOC_SUMMARY_ENABLED = os.getenv("DOC_SUMMARY_ENABLED", "true").lower() == "true" # 匯入時預先產生文件摘要 (規劃大綱用)
+    DOC_SUMMARY_GROUP_CHARS = int(os.getenv("DOC_SUMMARY_GROUP_CHARS", "16000")) # 每個 Map 摘要涵蓋的原文字數
+    DOC_SUMMARY_REDUCE_FANIN = 8                                              # 每次 Reduce 最多合併的摘要數
+    DOC_SUMMARY_MAP_CHARS = 400                                               # 單段摘要的目標字數
+    DOC_SUMMARY_REDUCE_CHARS = 1200                                           # 整份文件摘要的目標字數
+    DOC_SUMMARY_WORKERS = int(os.getenv("DOC_SUMMARY_WORKERS", "3"))         # 全域同時進行的摘要呼叫數
+    RAG_REGISTRY_MAX_SESSIONS = int(os.getenv("RAG_REGISTRY_MAX_SESSIONS", "32"))      # 常駐記憶體的 Session 數上限
+    RAG_REGISTRY_TTL_SECONDS = int(os.getenv("RAG_REGISTRY_TTL_SECONDS", "1800"))     # 閒置多久後釋放 Session
+    RAG_REGISTRY_MAX_MEMORY_MB = int(os.getenv("RAG_REGISTRY_MAX_MEMORY_MB", "512"))  # 所有 Session 索引的記憶體上限
+    RAG_QUERY_CACHE_SIZE = 128                                                # 每個 Session 快取的查詢結果數
+    RAG_QUERY_CACHE_TTL = int(os.getenv("RAG_QUERY_CACHE_TTL", "600"))       # 查詢結果快取存活秒數
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")                    # "chroma" 或 "numpy" (memmap 精確檢索)
+    VECTOR_QUANTIZE_INT8 = os.getenv("VECTOR_QUANTIZE_INT8", "true").lower() == "true" # numpy 後端是否做 int8 量化
+
+    # --- Prompt 上下文預算 (估計 Token 數，超過時由 context_packer 排序裁剪) ---
+    CONTEXT_TOKEN_BUDGETS = {
+        "investigation": int(os.getenv("CONTEXT_BUDGET_INVESTIGATION", "6000")),
+        "skeleton": int(os.getenv("CONTEXT_BUDGET_SKELETON", "12000")),
+        "slide": int(os.getenv("CONTEXT_BUDGET_SLIDE", "4000")),
+        "reflect": int(os.getenv("CONTEXT_BUDGET_REFLECT", "6000")),
+    }
+
+    # --- 大綱反思 (本地檢查 + 逐頁判決，只重新生成有問題的頁面) ---
+    REFLECTION_MAX_ITERATIONS = int(os.getenv("REFLECTION_MAX_ITERATIONS", "1"))  # 反思 -> 修正最多幾輪 (0 = 不反思)
+    # 本地檢查全數通過時是否略過模型審閱 (預設 false：冗餘、雙欄配置、可合併等只有模型看得出的問題仍會檢查)
+    REFLECTION_SKIP_CRITIQUE_WHEN_CLEAN = os.getenv("REFLECTION_SKIP_CRITIQUE_WHEN_CLEAN", "false").lower() == "true"
+    REFLECTION_WORKERS = 4                                                       # 同時重新生成的頁面數
+    MAX_BULLETS_PER_SLIDE = 6                                                    # 單頁重點上限 (超過就拆頁)
+
+    # --- LLM 回應快取 (相同輸入的規劃 / 大綱微調直接回傳上次的結果) ---
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "false").lower() == "true"
+    LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))               # 回應保留的秒數
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2000"))        # 筆數上限 (LRU 淘汰)
+
+    # --- 對話記憶 (較早的回合壓縮成滾動摘要，最近幾個回合保留原文) ---
+    MEMORY_KEEP_TURNS = int(os.getenv("MEMORY_KEEP_TURNS", "3"))                  # 保留原文的回合數
+    MEMORY_SUMMARIZE_EVERY = int(os.getenv("MEMORY_SUMMARIZE_EVERY", "2"))        # 累積幾個回合才更新一次摘要
+    MEMORY_SUMMARY_MAX_TOKENS = int(os.getenv("MEMORY_SUMMARY_MAX_TOKENS", "1500"))
+    MEMORY_TOOL_RESULT_CHARS = 1500   # 已完成回合的工具結果在原文視窗中保留的字數
+    MEMORY_DIGEST_TOOL_CHARS = 4000   # 送去摘要時每個工具結果保留的字數
+
+    # --- Session 回收設定 ---
+    SESSION_TTL_HOURS = float(os.getenv("SESSION_TTL_HOURS", "24"))              # 閒置多久後刪除 Session 資料
+    SESSION_DISK_BUDGET_MB = int(os.getenv("SESSION_DISK_BUDGET_MB", "2048"))    # chroma_db + uploads + outputs 的磁碟預算
+    SESSION_PRESSURE_TTL_HOURS = float(os.getenv("SESSION_PRESSURE_TTL_HOURS", "1")) # 超出磁碟預算時改用的較短 TTL，閒置未滿的 Session 仍不回收
+    SESSION_GC_INTERVAL_SECONDS = int(os.getenv("SESSION_GC_INTERVAL_SECONDS", "300"))
+    SESSION_GC_BATCH_SIZE = 20                                                   # 每輪最多回收的 Session 數
     
     # --- 工具設定 ---
     GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
     GOOGLE_SEARCH_API_KEY = os.getenv("GOOGLE_SEARCH_API_KEY")
     GOOGLE_CSE_ID = os.getenv("GOOGLE_CSE_ID")
+    WEB_READER_BASE_URL = os.getenv("WEB_READER_BASE_URL", "https://r.jina.ai/")    # 網頁轉純文字的 Reader Proxy
+    WEB_FETCH_MAX_CHARS = 10000                                                      # read_webpage 回傳的字數上限
+    WEB_FETCH_CONNECT_TIMEOUT = float(os.getenv("WEB_FETCH_CONNECT_TIMEOUT", "5"))
+    WEB_FETCH_READ_TIMEOUT = float(os.getenv("WEB_FETCH_READ_TIMEOUT", "15"))
+    WEB_FETCH_PER_HOST_LIMIT = int(os.getenv("WEB_FETCH_PER_HOST_LIMIT", "4"))     # 同一主機的同時連線數
+    WEB_FETCH_POOL_SIZE = 16                                                         # 連線池大小 / 平行抓取執行緒數
+    SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", str(6 * 3600)))             # 搜尋結果視為新鮮的秒數
+    SEARCH_CACHE_STALE_SECONDS = int(os.getenv("SEARCH_CACHE_STALE_SECONDS", str(24 * 3600))) # 過期後仍可先回傳舊值、背景更新的期間
+    WEBPAGE_CACHE_TTL = int(os.getenv("WEBPAGE_CACHE_TTL", str(24 * 3600)))
+    WEBPAGE_CACHE_STALE_SECONDS = int(os.getenv("WEBPAGE_CACHE_STALE_SECONDS", str(72 * 3600)))
+    TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "5000"))       # 工具快取筆數上限 (LRU 淘汰)
+    PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "false").lower() == "true"     # 搜尋後是否在背景預取網頁全文
+    PREFETCH_TOP_K = int(os.getenv("PREFETCH_TOP_K", "3"))                          # 每次搜尋預取的網址數
+    PREFETCH_TTL_SECONDS = 300                                                       # 預取結果在記憶體中保留的秒數
+    PREFETCH_BUDGET_PER_SESSION = int(os.getenv("PREFETCH_BUDGET_PER_SESSION", "30")) # 每個 Session 最多預取的頁數
+    PREFETCH_WORKERS = 2                                                             # 需小於 WEB_FETCH_PER_HOST_LIMIT
+    TOOL_EXECUTOR_WORKERS = 8                                                        # 每種對話工具各自的執行緒數 (工具之間互不佔用)
+    TOOL_CONCURRENCY = {"google_search": 2, "read_webpage": 5, "read_knowledge_base": 1} # 每種工具同時執行的上限
+    TOOL_TIMEOUTS = {"google_search": 15, "read_webpage": 20, "read_knowledge_base": 30} # 單次呼叫逾時秒數
+    TOOL_ROUND_DEADLINE_SECONDS = 45                                                 # 一輪工具呼叫的總時間上限
+
+    # --- Manager 資料盤點 (多輪平行檢索) ---
+    MANAGER_MAX_ROUNDS = int(os.getenv("MANAGER_MAX_ROUNDS", "3"))                   # 最多幾輪「模型決定查詢 -> 平行執行」
+    MANAGER_ROUND_DEADLINE_SECONDS = int(os.getenv("MANAGER_ROUND_DEADLINE_SECONDS", "40")) # 每輪工具呼叫的總時間上限
+    MANAGER_TOOL_RESULT_CHARS = 4000                                                 # 回饋給下一輪模型的單一工具結果字數上限
+
+    # --- Tracing (每次規劃 / 排版的巢狀 Span：耗時、Token、重試、快取命中) ---
+    TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+    TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")                           # JSONL 匯出路徑 (空字串 = 不寫檔)
+    TRACE_RECENT_RUNS = 20                                                           # 記憶體中保留的最近 Trace 數
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))                               # Prometheus /metrics 埠號 (0 = 不啟動)
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
     ENV_MODE = os.getenv("ENV_MODE", "dev")
 
     # --- 檔案路徑設定 ---
@@ -1,20 +1,29 @@
 # src/graph.py
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.memory import MemorySaver # 引入記憶體套件
-from src.agents.state import AgentState
-from src.agents.manager import manager_node
+from src.agents.state import AgentState, SlideTask
+from src.agents.manager import manager_node, fan_out_slides, slide_drafter, outline_merger, reflect_node
 from src.agents.workers import writer_node
+from src.utils.tracing import traced
 
 def build_graph():
     """
     建構簡報生成的 Agent 流程圖 (Workflow)
     """
     workflow = StateGraph(AgentState)
-    workflow.add_node("manager_node", manager_node)
-    workflow.add_node("writer_node", writer_node)
+    # 每個節點包成一個 Trace Span (見 src/utils/tracing.py)
+    workflow.add_node("manager_node", traced("manager_node")(manager_node))       # 資料盤點 + 簡報骨架
+    workflow.add_node("slide_drafter", traced("slide_drafter")(slide_drafter), input=SlideTask) # 逐頁撰寫 (每頁一個平行任務)
+    workflow.add_node("outline_merger", traced("outline_merger")(outline_merger)) # 依骨架順序合併
+    workflow.add_node("reflect_node", traced("reflect_node")(reflect_node))       # 邏輯與版面反思
+    workflow.add_node("writer_node", traced("writer_node")(writer_node))
 
     workflow.set_entry_point("manager_node")
-    workflow.add_edge("manager_node", "writer_node")
+    # 骨架完成後以 Send 平行派送每一頁；骨架失敗則直接停在 writer_node 前，由前端顯示錯誤
+    workflow.add_conditional_edges("manager_node", fan_out_slides, ["slide_drafter", "writer_node"])
+    workflow.add_edge("slide_drafter", "outline_merger")
+    workflow.add_edge("outline_merger", "reflect_node")
+    workflow.add_edge("reflect_node", "writer_node")
     workflow.add_edge("writer_node", END)
 
     # 實例化記憶體機制，讓 Graph 可以記住每一步的狀態並支援暫停
@@ -0,0 +1,148 @@
+# src/tools/doc_summaries.py
+import os
+import json
+import time
+import threading
+import concurrent.futures
+from langchain_core.messages import SystemMessage, HumanMessage
+from src.config import Config
+from src.utils.rate_limiter import quota_scheduler, PRIORITY_BACKGROUND
+
+MAP_SYSTEM = """
+你是文件分析師。請摘要使用者提供的文件段落，條列以下重點 (繁體中文，約 {max_chars} 字以內)：
+- 核心論點與結論
+- 關鍵數據 (保留原始數字、單位、年份與比較基準)
+- 重要名詞、產品、人物或事件
+只根據段落內容撰寫，不要推測或補充外部資訊。
+"""
+
+REDUCE_SYSTEM = """
+你是文件分析師。以下是同一份文件各段落的摘要，請合併成一份完整的文件摘要 (繁體中文，約 {max_chars} 字以內)：
+1. 開頭一句話說明這份文件的主題與用途
+2. 依主題整理重點，去除重複，但保留所有關鍵數據與其出處頁碼
+3. 最後列出文件的主要結論
+"""
+
+_summary_pool = None
+_pool_lock = threading.Lock()
+
+def _get_summary_pool():
+    global _summary_pool
+    with _pool_lock:
+        if _summary_pool is None:
+            _summary_pool = concurrent.futures.ThreadPoolExecutor(max_workers=Config.DOC_SUMMARY_WORKERS, thread_name_prefix="doc-summary")
+        return _summary_pool
+
+_llm = None
+_llm_lock = threading.Lock()
+
+def get_summary_llm():
+    """文件摘要用的模型 (全行程共用)"""
+    global _llm
+    with _llm_lock:
+        if _llm is None:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+            _llm = ChatGoogleGenerativeAI(model=Config.MODEL_FAST, google_api_key=Config.GOOGLE_API_KEY, temperature=0)
+        return _llm
+
+def _summarize(system: str, content: str) -> str:
+    # 背景工作：排在使用者對話與大綱規劃之後
+    result = quota_scheduler.invoke(Config.MODEL_FAST, get_summary_llm(), [
+        SystemMessage(content=system), HumanMessage(content=content)
+    ], priority=PRIORITY_BACKGROUND)
+    return str(result.content).strip()
+
+class DocumentSummaryBuilder:
+    """
+    匯入時的 Map-Reduce 摘要。
+    匯入管線每解析一頁就呼叫 add_page()，累積滿 group_chars 字就在背景送出一個 Map 摘要 (與 Embedding 同時進行)；
+    finish() 等待所有 Map 完成後逐層 Reduce (每次最多合併 reduce_fanin 份)，回傳整份文件的摘要。
+    """
+    def __init__(self, filename: str, group_chars: int, reduce_fanin: int, map_chars: int, reduce_chars: int):
+        self.filename = filename
+        self.group_chars = group_chars
+        self.reduce_fanin = max(2, reduce_fanin)
+        self.map_chars = map_chars
+        self.reduce_chars = reduce_chars
+        self._buffer, self._buffer_len, self._first_page, self._last_page = [], 0, None, None
+        self._futures = []
+
+    def add_page(self, metadata: dict, text: str):
+        if not text.strip(): return
+        page = metadata.get("page")
+        if self._first_page is None: self._first_page = page
+        self._last_page = page
+        self._buffer.append(text)
+        self._buffer_len += len(text)
+        if self._buffer_len >= self.group_chars:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer: return
+        # PDF 標示頁碼範圍 (metadata 的 page 從 0 起算)，純文字檔只標示段落序號
+        pages = f"第 {self._first_page + 1}–{self._last_page + 1} 頁" if self._first_page is not None else f"第 {len(self._futures) + 1} 段"
+        content = f"文件《{self.filename}》{pages}：\n\n" + "\n".join(self._buffer)
+        self._futures.append(_get_summary_pool().submit(_summarize, MAP_SYSTEM.format(max_chars=self.map_chars), content))
+        self._buffer, self._buffer_len, self._first_page, self._last_page = [], 0, None, None
+
+    def cancel(self):
+        for future in self._futures: future.cancel()
+
+    def finish(self) -> str:
+        self._flush()
+        parts = [future.result() for future in self._futures]
+        if not parts: return ""
+        # 逐層 Reduce：同一層的各組平行合併，直到剩下一份
+        while len(parts) > 1:
+            groups = [parts[i:i + self.reduce_fanin] for i in range(0, len(parts), self.reduce_fanin)]
+            futures = [
+                _get_summary_pool().submit(
+                    _summarize, REDUCE_SYSTEM.format(max_chars=self.reduce_chars),
+                    f"文件《{self.filename}》的段落摘要：\n\n" + "\n\n---\n\n".join(group)
+                ) if len(group) > 1 else None
+                for group in groups
+            ]
+            parts = [future.result() if future else group[0] for future, group in zip(futures, groups)]
+        return parts[0]
+
+class DocumentSummaryStore:
+    """
+    每個 Session 的文件摘要 (JSON，與該 Session 的關鍵字索引一起存放在 chroma_db/)。
+    以檔名為 Key；檔案被移除或重新上傳時覆蓋/刪除，Session 被回收時整個檔案一起刪除。
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except Exception as e:
+                print(f"⚠️ 文件摘要檔損毀，將重新建立：{e}")
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def set(self, filename: str, summary: str, chunks: int, pages: int):
+        with self._lock:
+            self._entries[filename] = {"summary": summary, "chunks": chunks, "pages": pages, "updated_at": time.time()}
+            self._save()
+
+    def remove(self, filename: str):
+        with self._lock:
+            if self._entries.pop(filename, None) is not None: self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            if os.path.exists(self.path): os.remove(self.path)
+
+    def get_all(self) -> dict:
+        """{檔名: 摘要}"""
+        with self._lock:
+            return {name: entry["summary"] for name, entry in self._entries.items()}
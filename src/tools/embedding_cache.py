@@ -0,0 +1,128 @@
+# src/tools/embedding_cache.py
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from langchain_core.embeddings import Embeddings
+
+class CachedEmbeddings(Embeddings):
+    """
+    以內容雜湊 (Content-Addressed) 為 Key 的本地 Embedding 快取。
+    Key = (Embedding 模型, 片段文字的 SHA-256)，跨 Session 與重複上傳共用。
+    儲存於 SQLite，超過容量上限時依最後存取時間做 LRU 淘汰。
+    """
+    def __init__(self, inner: Embeddings, model_name: str, db_path: str, max_entries: int = 200_000):
+        self.inner = inner
+        self.model_name = model_name
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _get_conn(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (model, text_hash)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _lookup(self, hashes: list) -> dict:
+        found = {}
+        with self._lock:
+            conn = self._get_conn()
+            # SQLite 單次查詢的參數數量有限，分批查
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [self.model_name, *batch]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?",
+                    [(now, self.model_name, h) for h in found]
+                )
+                conn.commit()
+        return found
+
+    def _store(self, items: dict):
+        with self._lock:
+            conn = self._get_conn()
+            now = time.time()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_access) VALUES (?, ?, ?, ?)",
+                [(self.model_name, h, array("f", vec).tobytes(), now) for h, vec in items.items()]
+            )
+            # LRU 淘汰：超出上限時刪除最久未被存取的項目
+            total = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if total > self.max_entries:
+                conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                    (total - self.max_entries,)
+                )
+            conn.commit()
+
+    def embed_documents_with_stats(self, texts: list):
+        """回傳 (向量列表, 快取命中數)。只有從未見過的片段才會呼叫 Embedding API"""
+        if not texts: return [], 0
+        hashes = [self._hash(t) for t in texts]
+        cached = {}
+        try:
+            cached = self._lookup(list(set(hashes)))
+        except Exception as e:
+            print(f"⚠️ Embedding 快取讀取失敗，改為直接呼叫 API：{e}")
+
+        # 同一批次內重複的片段也只送一次
+        missing = {}
+        for h, text in zip(hashes, texts):
+            if h not in cached and h not in missing:
+                missing[h] = text
+
+        if missing:
+            new_vectors = self.inner.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), new_vectors))
+            cached.update(fresh)
+            try:
+                self._store(fresh)
+            except Exception as e:
+                print(f"⚠️ Embedding 快取寫入失敗：{e}")
+
+        hits = sum(1 for h in hashes if h not in missing)
+        return [cached[h] for h in hashes], hits
+
+    def embed_documents(self, texts: list) -> list:
+        return self.embed_documents_with_stats(texts)[0]
+
+    def embed_query(self, text: str) -> list:
+        # Query 與 Document 的 task_type 不同，不共用快取
+        return self.inner.embed_query(text)
+
+    def embed_queries(self, texts: list) -> list:
+        """多個 Query 合併成一次 API 請求 (task_type 與 embed_query 相同)"""
+        if len(texts) == 1: return [self.embed_query(texts[0])]
+        try:
+            return self.inner.embed_documents(texts, task_type="RETRIEVAL_QUERY")
+        except TypeError:
+            # 底層 Embeddings 不支援 task_type 參數時，退回逐筆查詢
+            return [self.inner.embed_query(t) for t in texts]
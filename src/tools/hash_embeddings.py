@@ -0,0 +1,36 @@
+# src/tools/hash_embeddings.py
+import math
+import hashlib
+from langchain_core.embeddings import Embeddings
+from src.tools.keyword_index import tokenize
+
+class HashingEmbeddings(Embeddings):
+    """
+    離線、可重現的 Embedding 替身 (Hashed Bag-of-N-grams)。
+    以 CJK Bigram / 英數詞彙與字元 Trigram 做 Signed Feature Hashing，再 L2 正規化。
+    不需網路、不耗 Gemini 額度，供 Benchmark 與本地開發使用 (EMBEDDING_PROVIDER=hash)。
+    """
+    def __init__(self, dim: int = 768):
+        self.dim = dim
+
+    def _features(self, text: str):
+        tokens = tokenize(text)
+        yield from tokens
+        compact = "".join(tokens)
+        for i in range(len(compact) - 2):
+            yield "#" + compact[i:i + 3]
+
+    def _embed(self, text: str) -> list:
+        vec = [0.0] * self.dim
+        for feature in self._features(text):
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vec[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+        return [v / norm for v in vec]
+
+    def embed_documents(self, texts: list, **kwargs) -> list:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> list:
+        return self._embed(text)
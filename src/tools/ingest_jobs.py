@@ -0,0 +1,113 @@
+# src/tools/ingest_jobs.py
+import time
+import uuid
+import threading
+import concurrent.futures
+from dataclasses import dataclass, field
+from src.config import Config
+
+# 工作狀態
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+@dataclass
+class IngestJob:
+    job_id: str
+    session_id: str
+    filename: str
+    status: str = QUEUED
+    pages_parsed: int = 0
+    chunks_embedded: int = 0
+    stage: str = "indexing" # indexing -> summarizing (索引完成後產生文件摘要)
+    message: str = ""
+    created_at: float = field(default_factory=time.time)
+    finished_at: float = None
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    def snapshot(self) -> dict:
+        return {
+            "job_id": self.job_id, "session_id": self.session_id, "filename": self.filename,
+            "status": self.status, "pages_parsed": self.pages_parsed, "chunks_embedded": self.chunks_embedded,
+            "stage": self.stage, "message": self.message, "created_at": self.created_at, "finished_at": self.finished_at,
+        }
+
+class IngestJobQueue:
+    """
+    行程層級的背景匯入佇列。
+    文件在背景執行緒建立索引，Streamlit 主執行緒只需輪詢 status()，使用者可同時繼續聊天。
+    """
+    # 已結束的工作保留多久供前端讀取結果 (秒)
+    FINISHED_RETENTION = 600
+
+    def __init__(self, max_workers: int):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, rag_manager, file_bytes: bytes, filename: str) -> str:
+        """排入一個匯入工作並立即回傳 job_id"""
+        job = IngestJob(job_id=uuid.uuid4().hex[:12], session_id=rag_manager.session_id, filename=filename)
+        with self._lock:
+            self._prune()
+            self._jobs[job.job_id] = job
+        # Streamlit 的 UploadedFile buffer 在 rerun 後可能失效，先複製一份
+        self._executor.submit(self._run, job, rag_manager, bytes(file_bytes))
+        return job.job_id
+
+    def _run(self, job: IngestJob, rag_manager, file_bytes: bytes):
+        if job.cancel_event.is_set():
+            self._finish(job, CANCELLED, f"⏹️ 已取消匯入：{job.filename}")
+            return
+        job.status = RUNNING
+
+        def on_progress(pages_parsed, chunks_embedded, stage="indexing"):
+            job.pages_parsed, job.chunks_embedded, job.stage = pages_parsed, chunks_embedded, stage
+
+        try:
+            res = rag_manager.ingest_file(file_bytes, job.filename, on_progress=on_progress, cancel_event=job.cancel_event)
+            if job.cancel_event.is_set(): self._finish(job, CANCELLED, res)
+            elif "✅" in res: self._finish(job, DONE, res)
+            else: self._finish(job, FAILED, res)
+        except Exception as e:
+            self._finish(job, FAILED, f"❌ 讀取失敗：{str(e)}")
+
+    def _finish(self, job: IngestJob, status: str, message: str):
+        job.status, job.message, job.finished_at = status, message, time.time()
+
+    def _prune(self):
+        """清掉結束太久的工作紀錄，避免長期執行的容器累積"""
+        now = time.time()
+        expired = [jid for jid, job in self._jobs.items()
+                   if job.finished_at and now - job.finished_at > self.FINISHED_RETENTION]
+        for jid in expired: del self._jobs[jid]
+
+    # --- 狀態 API (供 Sidebar 輪詢) ---
+    def status(self, job_id: str):
+        job = self._jobs.get(job_id)
+        return job.snapshot() if job else None
+
+    def list_jobs(self, session_id: str) -> list:
+        with self._lock:
+            return [job.snapshot() for job in self._jobs.values() if job.session_id == session_id]
+
+    def active_count(self, session_id: str) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.session_id == session_id and job.is_active)
+
+    def cancel(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if not job or not job.is_active: return False
+        job.cancel_event.set()
+        return True
+
+    def cancel_session(self, session_id: str):
+        """取消某個 Session 所有未完成的工作 (Reset 時使用)"""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.session_id == session_id and job.is_active]
+        for job in jobs: job.cancel_event.set()
+
+# 全行程共用的匯入佇列
+ingest_jobs = IngestJobQueue(max_workers=Config.INGEST_MAX_CONCURRENT_FILES)
@@ -0,0 +1,169 @@
+# src/tools/ingest_pipeline.py
+import uuid
+import threading
+import multiprocessing
+import concurrent.futures
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from src.config import Config
+
+# 純文字檔以固定字數切成「虛擬頁」，避免整份檔案一次讀進記憶體
+TEXT_BLOCK_CHARS = 20_000
+
+_process_pool = None
+_embed_pool = None
+_pool_lock = threading.Lock()
+
+def _get_process_pool():
+    """PDF 解析用的 Process Pool (spawn 模式，避免在多執行緒的 Streamlit 中 fork)"""
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is None:
+            _process_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=Config.INGEST_PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _process_pool
+
+def _discard_process_pool(pool):
+    """損壞的 Process Pool 無法再使用：關閉並清除，下一次匯入會重新建立"""
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is pool: _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _get_embed_pool():
+    """Embedding + 寫入用的共用 Thread Pool，全域限制同時打 API 的批次數"""
+    global _embed_pool
+    with _pool_lock:
+        if _embed_pool is None:
+            _embed_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=Config.INGEST_EMBED_WORKERS, thread_name_prefix="ingest-embed"
+            )
+        return _embed_pool
+
+def _extract_pdf_pages(file_path: str, start: int, end: int) -> list:
+    """[子行程] 只解析指定範圍的頁面，回傳 [(頁碼, 文字), ...]"""
+    from pypdf import PdfReader
+    reader = PdfReader(file_path)
+    return [(i, reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+def _count_pdf_pages(file_path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(file_path).pages)
+
+def iter_pages(file_path: str):
+    """
+    逐頁產出 (metadata, 文字)。
+    PDF 以頁面區段分派到 Process Pool 平行解析，並限制同時在途的區段數，確保記憶體有上限。
+    """
+    if file_path.lower().endswith('.txt'):
+        with open(file_path, "r", encoding="utf-8") as f:
+            while True:
+                block = f.read(TEXT_BLOCK_CHARS)
+                if not block: break
+                yield {"source": file_path}, block
+        return
+
+    total_pages = _count_pdf_pages(file_path)
+    step = Config.INGEST_PAGES_PER_TASK
+    ranges = [(start, min(start + step, total_pages)) for start in range(0, total_pages, step)]
+    max_inflight = Config.INGEST_PARSE_WORKERS * 2
+    yielded_ranges = 0 # 已完整產出的區段數 (依序產出，所以前 yielded_ranges 個區段都已交出)
+
+    pool = _get_process_pool()
+    try:
+        pending = []
+        next_range = 0
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < max_inflight:
+                start, end = ranges[next_range]
+                pending.append(pool.submit(_extract_pdf_pages, file_path, start, end))
+                next_range += 1
+            # 依頁序產出，後面的區段在背景繼續解析
+            for page_no, text in pending.pop(0).result():
+                yield {"source": file_path, "page": page_no}, text
+            yielded_ranges += 1
+    except concurrent.futures.process.BrokenProcessPool:
+        # Process Pool 不可用 (例如受限的容器環境)：丟棄損壞的 Pool，從尚未產出的區段起改用單行程解析，
+        # 已產出的頁面不重複解析 (否則會以新的 id 重複寫入知識庫)
+        print(f"⚠️ PDF 平行解析失敗，從第 {yielded_ranges + 1} 個區段起改用單行程模式")
+        _discard_process_pool(pool)
+        for start, end in ranges[yielded_ranges:]:
+            for page_no, text in _extract_pdf_pages(file_path, start, end):
+                yield {"source": file_path, "page": page_no}, text
+
+class IngestCancelled(Exception):
+    """匯入工作被使用者取消"""
+
+class StreamingIngestor:
+    """
+    串流式匯入引擎：邊解析邊切塊，切好的片段湊滿一批就送去 Embedding，
+    Embedding 完成的批次立即寫入向量庫；解析、Embedding、寫入三段管線同時進行。
+    """
+    def __init__(self, rag_manager):
+        self.rag_manager = rag_manager
+        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
+
+    def ingest(self, file_path: str, on_progress=None, cancel_event=None, on_page=None) -> dict:
+        """
+        on_progress(pages_parsed, chunks_embedded)：每解析一頁、每寫入一批時回報進度。
+        cancel_event：被 set() 時中止匯入並回滾已寫入的片段 (拋出 IngestCancelled)。
+        on_page(metadata, text)：每解析完一頁就呼叫 (例如交給文件摘要的 Map 階段)。
+        """
+        batch_size = Config.INGEST_EMBED_BATCH
+        inflight = threading.BoundedSemaphore(Config.INGEST_MAX_INFLIGHT_BATCHES)
+        stats = {"pages": 0, "chunks": 0, "cache_hits": 0}
+        stats_lock = threading.Lock()
+        futures, written_ids = [], []
+
+        def is_cancelled():
+            return cancel_event is not None and cancel_event.is_set()
+
+        def report():
+            if on_progress: on_progress(stats["pages"], stats["chunks"])
+
+        def embed_and_write(texts, metadatas):
+            try:
+                if is_cancelled(): return # 已取消就不再浪費 Embedding 額度
+                ids = [uuid.uuid4().hex for _ in texts]
+                hits = self.rag_manager.add_chunks(ids, texts, metadatas)
+                with stats_lock:
+                    written_ids.extend(ids)
+                    stats["chunks"] += len(texts)
+                    stats["cache_hits"] += hits
+                    report()
+            finally:
+                inflight.release()
+
+        def submit(texts, metadatas):
+            inflight.acquire() # 在途批次已滿時，讓解析端停下來等 (Back-pressure)
+            futures.append(_get_embed_pool().submit(embed_and_write, texts, metadatas))
+
+        buffer_texts, buffer_metas = [], []
+        try:
+            for metadata, text in iter_pages(file_path):
+                if is_cancelled(): raise IngestCancelled()
+                with stats_lock:
+                    stats["pages"] += 1
+                    report()
+                if on_page: on_page(metadata, text)
+                for chunk in self.text_splitter.split_text(text):
+                    buffer_texts.append(chunk)
+                    buffer_metas.append(metadata)
+                    if len(buffer_texts) >= batch_size:
+                        submit(buffer_texts, buffer_metas)
+                        buffer_texts, buffer_metas = [], []
+                # 提早發現失敗的批次，不必等整份檔案解析完
+                if any(f.done() and f.exception() for f in futures): break
+            if buffer_texts:
+                submit(buffer_texts, buffer_metas)
+
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+            if is_cancelled(): raise IngestCancelled()
+        except Exception:
+            # 任何一段失敗都回滾已寫入的片段，避免知識庫只收到半份文件
+            concurrent.futures.wait(futures)
+            self.rag_manager.delete_chunks(file_path, written_ids)
+            raise
+        return stats
@@ -0,0 +1,337 @@
+# src/tools/keyword_index.py
+import os
+import re
+import math
+import zlib
+import marshal
+import sqlite3
+import threading
+from array import array
+from functools import lru_cache
+from collections import Counter
+
+# CJK 字元範圍 (中日韓統一表意文字、擴充 A、相容字、假名、韓文)
+_CJK_CHARS = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af"
+# 一段連續的 CJK 字串，或一段英數字 (保留 3.5、12% 這類數字寫法)
+_TOKEN_RE = re.compile(rf"[{_CJK_CHARS}]+|[A-Za-z0-9]+(?:\.[0-9]+)?%?")
+_CJK_RE = re.compile(rf"[{_CJK_CHARS}]")
+
+def tokenize(text: str) -> list:
+    """
+    CJK 感知的斷詞器：
+    - 中文等 CJK 連續字串切成 Bigram (「人工智慧」 -> 人工/工智/智慧)，單字則保留單字
+    - 英文與數字以整段為單位並轉小寫
+    """
+    if not text: return []
+    tokens = []
+    for match in _TOKEN_RE.finditer(text):
+        span = match.group(0)
+        if _CJK_RE.match(span):
+            if len(span) == 1:
+                tokens.append(span)
+            else:
+                tokens.extend(span[i:i + 2] for i in range(len(span) - 1))
+        else:
+            tokens.append(span.lower())
+    return tokens
+
+class KeywordIndex:
+    """
+    每個 Session 專屬的 BM25 倒排索引，以 SQLite 存放成「分段 (Segment) + 墓碑」的 Log-Structured 結構：
+    - 每次 add 的一批片段寫成一個不可變的 Segment；詞彙依雜湊分到多個 Bucket，每個 Bucket 一列
+      (BLOB 內是 {詞彙: Postings}，Postings 為 doc_id / tf / 文件長度的 int32 三元組)
+    - 同一層級 (大小相近) 的 Segment 累積 MERGE_FANIN 個才合併成一個，寫入放大只有 O(log N)
+    - 移除來源只寫墓碑，合併時才真正清掉；墓碑過半時整份壓實
+    - 開啟時只讀取文件數、總長度與墓碑；查詢時每個詞彙在每個 Segment 只讀一個 Bucket，開啟成本與語料大小無關
+    - 讀寫各用一個連線 (WAL)：寫入 / 合併時查詢讀的是交易開始時的快照，不必互相等待
+    - 片段內文不存在這裡 (向量後端已保存)，索引只負責「查詢 -> chunk_id」
+    """
+    K1 = 1.5
+    B = 0.75
+    MERGE_FANIN = 8       # 同一層級累積幾個 Segment 才合併
+    TERMS_PER_BUCKET = 64 # 每個 Bucket 平均的詞彙數 (越大列數越少、查詢時解開的 BLOB 越大)
+    CACHE_KIB = 2048      # 每個連線的 SQLite 頁面快取上限，也是 approx_memory_bytes 的估計值
+    BATCH_PARAMS = 500    # SQLite 單次查詢的參數數量有限，分批處理
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._write_lock = threading.Lock() # 寫入、合併、壓實依序進行
+        self._read_lock = threading.Lock()  # 保護讀取用的連線
+        self._state_lock = threading.Lock() # 保護下列記憶體中的統計
+        self._write_conn = None
+        self._read_conn = None
+        self.n_docs = 0
+        self.total_length = 0
+        self._tombstones = set() # 已移除但仍留在 Segment 中的 doc_id (doc_id 不會重複使用)
+        if os.path.exists(db_path):
+            with self._write_lock:
+                self._get_write_conn()
+
+    # --- 連線 ---
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{self.CACHE_KIB}")
+        return conn
+
+    def _get_write_conn(self):
+        """呼叫端需持有 _write_lock；第一次開啟時建立資料表並載入統計"""
+        if self._write_conn is None:
+            try:
+                conn = self._open_tables()
+            except sqlite3.OperationalError:
+                raise # 例如資料庫被鎖住，不是損毀
+            except sqlite3.DatabaseError as e:
+                print(f"⚠️ 關鍵字索引損毀，將重新建立：{e}")
+                for path in index_files(self.db_path):
+                    if os.path.exists(path): os.remove(path)
+                conn = self._open_tables()
+            n_docs, total_length = conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+            tombstones = {row[0] for row in conn.execute("SELECT doc_id FROM tombstones")}
+            with self._state_lock:
+                self.n_docs, self.total_length, self._tombstones = n_docs, total_length, tombstones
+            self._write_conn = conn
+        return self._write_conn
+
+    def _open_tables(self):
+        conn = self._connect()
+        try:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS docs (
+                    doc_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chunk_id TEXT NOT NULL UNIQUE,
+                    source TEXT NOT NULL,
+                    length INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_docs_source ON docs(source);
+                CREATE TABLE IF NOT EXISTS segments (
+                    segment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    doc_count INTEGER NOT NULL,
+                    buckets INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS postings (
+                    segment_id INTEGER NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    data BLOB NOT NULL,
+                    PRIMARY KEY (segment_id, bucket)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS tombstones (doc_id INTEGER PRIMARY KEY);
+            """)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    def _get_read_conn(self):
+        """呼叫端需持有 _read_lock"""
+        if self._read_conn is None:
+            with self._write_lock:
+                self._get_write_conn() # 確保資料表已建立
+            self._read_conn = self._connect()
+        return self._read_conn
+
+    def close(self):
+        """釋放連線 (例如 Session 被換出記憶體)；之後再使用會自動重新開啟"""
+        with self._write_lock, self._read_lock:
+            for conn in (self._write_conn, self._read_conn):
+                if conn is not None: conn.close()
+            self._write_conn = self._read_conn = None
+
+    # --- Segment 編碼 ---
+    @staticmethod
+    def _bucket_of(term: str, buckets: int) -> int:
+        return _term_hash(term) % buckets
+
+    def _write_segment(self, conn, postings: dict, doc_count: int):
+        """postings: term -> int32 三元組 (doc_id, tf, length) 的 bytes；呼叫端需在交易中"""
+        buckets = max(1, len(postings) // self.TERMS_PER_BUCKET)
+        groups = [{} for _ in range(buckets)]
+        for term, data in postings.items():
+            groups[self._bucket_of(term, buckets)][term] = data
+        segment_id = conn.execute("INSERT INTO segments (doc_count, buckets) VALUES (?, ?)", (doc_count, buckets)).lastrowid
+        conn.executemany(
+            "INSERT INTO postings (segment_id, bucket, data) VALUES (?, ?, ?)",
+            ((segment_id, bucket, marshal.dumps(group)) for bucket, group in enumerate(groups) if group)
+        )
+
+    # --- 增量更新 ---
+    def add(self, chunk_ids: list, texts: list, sources: list):
+        # 斷詞不需持有任何鎖
+        entries = [(chunk_id, source, Counter(tokenize(text))) for chunk_id, text, source in zip(chunk_ids, texts, sources)]
+        if not entries: return
+        with self._write_lock:
+            conn = self._get_write_conn()
+            existing = set()
+            ids = [chunk_id for chunk_id, _, _ in entries]
+            for i in range(0, len(ids), self.BATCH_PARAMS):
+                batch = ids[i:i + self.BATCH_PARAMS]
+                existing.update(row[0] for row in conn.execute(
+                    f"SELECT chunk_id FROM docs WHERE chunk_id IN ({','.join('?' * len(batch))})", batch))
+
+            postings, added, added_length = {}, 0, 0
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for chunk_id, source, term_freqs in entries:
+                    if chunk_id in existing: continue
+                    existing.add(chunk_id)
+                    length = sum(term_freqs.values())
+                    doc_id = conn.execute("INSERT INTO docs (chunk_id, source, length) VALUES (?, ?, ?)", (chunk_id, source, length)).lastrowid
+                    for term, tf in term_freqs.items():
+                        postings.setdefault(term, []).extend((doc_id, tf, length))
+                    added += 1
+                    added_length += length
+                if added:
+                    self._write_segment(conn, {term: array("i", flat).tobytes() for term, flat in postings.items()}, added)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            if not added: return
+            with self._state_lock:
+                self.n_docs += added
+                self.total_length += added_length
+            self._merge_tiers(conn)
+
+    def _tier(self, doc_count: int) -> int:
+        return int(math.log(max(doc_count, 1), self.MERGE_FANIN))
+
+    def _merge_tiers(self, conn):
+        """同一層級累積 MERGE_FANIN 個 Segment 就合併 (合併結果落到更高層級，可能再觸發下一次合併)"""
+        while True:
+            tiers = {}
+            for segment_id, doc_count in conn.execute("SELECT segment_id, doc_count FROM segments ORDER BY segment_id"):
+                tiers.setdefault(self._tier(doc_count), []).append(segment_id)
+            full = next((ids for _, ids in sorted(tiers.items()) if len(ids) >= self.MERGE_FANIN), None)
+            if full is None: return
+            self._merge(conn, full)
+
+    def _merge(self, conn, segment_ids: list):
+        """把多個 Segment 合併成一個，並清掉其中被墓碑標記的文件；呼叫端需持有 _write_lock"""
+        with self._state_lock:
+            tombstones = set(self._tombstones)
+        placeholders = ",".join("?" * len(segment_ids))
+        parts, live_docs, dropped = {}, set(), set()
+        for (data,) in conn.execute(f"SELECT data FROM postings WHERE segment_id IN ({placeholders})", segment_ids):
+            for term, posting in marshal.loads(data).items():
+                triples = array("i", posting)
+                doc_ids = triples[0::3]
+                if not tombstones.isdisjoint(doc_ids):
+                    keep = array("i")
+                    for i, doc_id in enumerate(doc_ids):
+                        if doc_id in tombstones: dropped.add(doc_id)
+                        else: keep.extend(triples[3 * i:3 * i + 3])
+                    if not keep: continue
+                    posting, doc_ids = keep.tobytes(), keep[0::3]
+                live_docs.update(doc_ids)
+                parts.setdefault(term, []).append(posting)
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(f"DELETE FROM postings WHERE segment_id IN ({placeholders})", segment_ids)
+            conn.execute(f"DELETE FROM segments WHERE segment_id IN ({placeholders})", segment_ids)
+            if parts: self._write_segment(conn, {term: b"".join(chunks) for term, chunks in parts.items()}, len(live_docs))
+            conn.executemany("DELETE FROM tombstones WHERE doc_id = ?", ((doc_id,) for doc_id in dropped))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        # 記憶體中的墓碑保留到行程結束：仍在讀舊快照的查詢需要它們 (doc_id 不會重複使用，多留無害)
+
+    def remove_source(self, source: str) -> list:
+        """移除某個來源檔案的所有片段 (寫入墓碑)，回傳被移除的 chunk_id"""
+        with self._write_lock:
+            if self._write_conn is None and not os.path.exists(self.db_path): return []
+            conn = self._get_write_conn()
+            rows = conn.execute("SELECT doc_id, chunk_id, length FROM docs WHERE source = ?", (source,)).fetchall()
+            if not rows: return []
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany("INSERT OR IGNORE INTO tombstones (doc_id) VALUES (?)", ((doc_id,) for doc_id, _, _ in rows))
+                conn.execute("DELETE FROM docs WHERE source = ?", (source,))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            with self._state_lock:
+                self._tombstones.update(doc_id for doc_id, _, _ in rows)
+                self.n_docs -= len(rows)
+                self.total_length -= sum(length for _, _, length in rows)
+                compact = len(self._tombstones) > self.n_docs
+            if compact:
+                segment_ids = [row[0] for row in conn.execute("SELECT segment_id FROM segments")]
+                if segment_ids: self._merge(conn, segment_ids)
+            return [chunk_id for _, chunk_id, _ in rows]
+
+    def clear(self):
+        self.close()
+        with self._write_lock:
+            with self._state_lock:
+                self.n_docs, self.total_length, self._tombstones = 0, 0, set()
+            for path in index_files(self.db_path):
+                if os.path.exists(path): os.remove(path)
+
+    # --- 查詢 ---
+    def is_empty(self) -> bool:
+        return self.n_docs == 0
+
+    def approx_memory_bytes(self) -> int:
+        """索引本體在磁碟上，常駐記憶體只有連線的頁面快取"""
+        return sum(self.CACHE_KIB * 1024 for conn in (self._write_conn, self._read_conn) if conn is not None)
+
+    def _read_postings(self, terms) -> dict:
+        """在同一個讀取快照中取出每個詞彙在各 Segment 的 Postings (bytes 列表)"""
+        found = {term: [] for term in terms}
+        with self._read_lock:
+            conn = self._get_read_conn()
+            conn.execute("BEGIN") # 查詢途中發生的合併不會讓 Segment 忽隱忽現
+            try:
+                for segment_id, buckets in conn.execute("SELECT segment_id, buckets FROM segments").fetchall():
+                    loaded = {}
+                    for term in terms:
+                        bucket = self._bucket_of(term, buckets)
+                        if bucket not in loaded:
+                            row = conn.execute("SELECT data FROM postings WHERE segment_id = ? AND bucket = ?", (segment_id, bucket)).fetchone()
+                            loaded[bucket] = marshal.loads(row[0]) if row else {}
+                        posting = loaded[bucket].get(term)
+                        if posting: found[term].append(posting)
+            finally:
+                conn.execute("COMMIT")
+        return found
+
+    def search(self, query: str, k: int = 4) -> list:
+        """BM25 評分，只讀取查詢詞彙所在的 Bucket。回傳 [(chunk_id, score), ...]"""
+        query_terms = Counter(tokenize(query))
+        with self._state_lock:
+            n_docs, total_length, tombstones = self.n_docs, self.total_length, self._tombstones
+        if n_docs == 0 or not query_terms: return []
+        avg_len = total_length / n_docs or 1.0
+
+        scores = Counter()
+        for term, chunks in self._read_postings(list(query_terms)).items():
+            triples = array("i", b"".join(chunks))
+            postings = [(triples[i], triples[i + 1], triples[i + 2]) for i in range(0, len(triples), 3) if triples[i] not in tombstones]
+            if not postings: continue
+            qtf, df = query_terms[term], len(postings)
+            idf = math.log((n_docs - df + 0.5) / (df + 0.5) + 1.0)
+            for doc_id, tf, doc_len in postings:
+                denom = tf + self.K1 * (1 - self.B + self.B * doc_len / avg_len)
+                scores[doc_id] += qtf * idf * tf * (self.K1 + 1) / denom
+        top = scores.most_common(k)
+        if not top: return []
+
+        with self._read_lock:
+            conn = self._get_read_conn()
+            chunk_of = dict(conn.execute(
+                f"SELECT doc_id, chunk_id FROM docs WHERE doc_id IN ({','.join('?' * len(top))})", [doc_id for doc_id, _ in top]))
+        return [(chunk_of[doc_id], score) for doc_id, score in top if doc_id in chunk_of]
+
+@lru_cache(maxsize=1 << 18)
+def _term_hash(term: str) -> int:
+    """詞彙的穩定雜湊 (不能用 hash()：每個行程的雜湊種子不同，重開後會找錯 Bucket)"""
+    return zlib.crc32(term.encode("utf-8"))
+
+def index_files(db_path: str) -> list:
+    """索引在磁碟上的所有檔案 (SQLite 本體與 WAL)"""
+    return [db_path, f"{db_path}-wal", f"{db_path}-shm"]
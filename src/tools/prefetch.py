@@ -0,0 +1,98 @@
+# src/tools/prefetch.py
+import threading
+import concurrent.futures
+from src.config import Config
+from src.tools.web_fetch import web_fetcher
+from src.utils.cache import TTLCache, canonical_url
+
+class PagePrefetcher:
+    """
+    搜尋結果網頁的推測性預取 (Speculative Prefetch)。
+    google_search 回傳後立刻在背景抓取前 top_k 個網址，放進短效快取；
+    Agent 下一輪呼叫 read_webpage 時直接取用 (仍在下載中則等待同一個下載，不重複抓取)。
+    每個 Session 有預取額度上限，可整個 Session 取消，並統計預取頁面實際被讀取的比例。
+    """
+    def __init__(self, top_k: int, ttl_seconds: float, budget_per_session: int, max_workers: int):
+        self.top_k = top_k
+        self.budget_per_session = budget_per_session
+        self._pages = TTLCache(max_size=256, ttl_seconds=ttl_seconds) # canonical_url -> FetchResult
+        self._inflight = {}   # canonical_url -> (session_id, Future)
+        self._issued = {}     # session_id -> 已使用的預取額度
+        self._cancel_events = {}
+        self._lock = threading.Lock()
+        # 工作數刻意小於 WEB_FETCH_PER_HOST_LIMIT，讓使用者主動的讀取永遠有空位
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self.metrics = {"issued": 0, "used": 0, "waited": 0, "failed": 0, "cancelled": 0, "over_budget": 0}
+
+    def schedule(self, session_id: str, urls: list, skip=None):
+        """安排預取；skip(key) 回傳 True 的網址 (例如已在持久化快取中) 不抓取"""
+        for url in urls[:self.top_k]:
+            key = canonical_url(url)
+            with self._lock:
+                if key in self._inflight or self._pages.get(key) is not None: continue
+                if skip is not None and skip(key): continue
+                if self._issued.get(session_id, 0) >= self.budget_per_session:
+                    self.metrics["over_budget"] += 1
+                    continue
+                self._issued[session_id] = self._issued.get(session_id, 0) + 1
+                self.metrics["issued"] += 1
+                cancel_event = self._cancel_events.setdefault(session_id, threading.Event())
+                future = self._executor.submit(self._fetch, key, url, cancel_event)
+                self._inflight[key] = (session_id, future)
+
+    def _fetch(self, key: str, url: str, cancel_event: threading.Event):
+        try:
+            result = web_fetcher.fetch(url, cancel_event=cancel_event)
+            if result.ok:
+                self._pages.set(key, result)
+            else:
+                with self._lock:
+                    self.metrics["cancelled" if result.error == "cancelled" else "failed"] += 1
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def take(self, url: str):
+        """取出預取結果 (下載中則等待完成)；沒有可用結果時回傳 None，由呼叫端自行抓取"""
+        key = canonical_url(url)
+        with self._lock:
+            entry = self._inflight.get(key)
+        if entry is not None:
+            try:
+                result = entry[1].result(timeout=sum(web_fetcher.timeout))
+            except Exception:
+                return None
+            if not result.ok: return None
+            with self._lock:
+                self.metrics["waited"] += 1
+        result = self._pages.pop(key)
+        if result is not None:
+            with self._lock:
+                self.metrics["used"] += 1
+        return result
+
+    def cancel_session(self, session_id: str):
+        """取消該 Session 尚未完成的預取並歸還額度 (重置對話 / Session 回收時呼叫)"""
+        with self._lock:
+            event = self._cancel_events.pop(session_id, None)
+            if event is not None: event.set()
+            for key, (session, future) in list(self._inflight.items()):
+                # 尚未開始的直接取消；下載中的由 cancel_event 中止
+                if session == session_id and future.cancel():
+                    del self._inflight[key]
+                    self.metrics["cancelled"] += 1
+            self._issued.pop(session_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            issued = self.metrics["issued"]
+            return {**self.metrics, "usage_rate": self.metrics["used"] / issued if issued else 0.0, "cached_pages": len(self._pages)}
+
+# 全行程共用的預取器 (Config.PREFETCH_ENABLED 為 True 時才會被呼叫)
+page_prefetcher = PagePrefetcher(
+    top_k=Config.PREFETCH_TOP_K,
+    ttl_seconds=Config.PREFETCH_TTL_SECONDS,
+    budget_per_session=Config.PREFETCH_BUDGET_PER_SESSION,
+    max_workers=Config.PREFETCH_WORKERS
+)
@@ -1,24 +1,116 @@
 # src/tools/rag.py
 import os
+import json
+import time
 import shutil
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+import threading
 from langchain_core.tools import Tool
-from langchain_core.documents import Document # 用於重建文件格式
-from langchain_community.retrievers import BM25Retriever # 關鍵字檢索器
-from langchain.retrievers import EnsembleRetriever # 混合檢索融合器
 from src.config import Config
+from src.tools.keyword_index import KeywordIndex, index_files # CJK 感知的增量 BM25 索引
+from src.tools.embedding_cache import CachedEmbeddings # 跨 Session 共用的 Embedding 快取
+from src.tools.vector_backends import create_vector_backend # Chroma / NumPy memmap 向量後端
+from src.tools.ingest_pipeline import StreamingIngestor, IngestCancelled # 串流式平行匯入管線
+from src.tools.ingest_jobs import ingest_jobs # 背景匯入佇列
+from src.tools.doc_summaries import DocumentSummaryBuilder, DocumentSummaryStore # 匯入時預先計算的文件摘要
+from src.utils.cache import TTLCache, normalize_query
+from src.utils.rate_limiter import quota_scheduler, RateLimitedEmbeddings
+from src.utils.tracing import traced, record
 from pydantic import BaseModel, Field
 
 # 設定路徑
 PERSIST_DIRECTORY = os.path.join(os.getcwd(), "chroma_db")
+KEYWORD_INDEX_DIRECTORY = os.path.join(PERSIST_DIRECTORY, "keyword_index")
+EMBEDDING_CACHE_PATH = os.path.join(PERSIST_DIRECTORY, "embedding_cache.sqlite3")
+NUMPY_VECTOR_DIRECTORY = os.path.join(PERSIST_DIRECTORY, "numpy_vectors")
+DOC_SUMMARY_DIRECTORY = os.path.join(PERSIST_DIRECTORY, "doc_summaries")
 
-embeddings = GoogleGenerativeAIEmbeddings(
-    model=Config.MODEL_EMBEDDING,
-    google_api_key=Config.GOOGLE_API_KEY
-)
+# Reciprocal Rank Fusion 的平滑常數 (與 LangChain EnsembleRetriever 預設相同)
+RRF_C = 60
+
+_chroma_client = None
+_chroma_client_lock = threading.Lock()
+
+def get_chroma_client():
+    """全行程共用一個持久化 Chroma Client，避免每個 Session / 每次 rerun 都重新開啟 chroma_db"""
+    global _chroma_client
+    with _chroma_client_lock:
+        if _chroma_client is None:
+            import chromadb # 延遲載入：匯入 chromadb 本身就要數百毫秒，只在第一次用到時付出
+            _chroma_client = chromadb.PersistentClient(path=PERSIST_DIRECTORY)
+        return _chroma_client
+
+def _build_base_embeddings():
+    """依 Config.EMBEDDING_PROVIDER 選擇 Embedding 來源，回傳 (Embeddings, 快取用的模型名稱)"""
+    if Config.EMBEDDING_PROVIDER == "hash":
+        # 離線可重現的替身，用於 Benchmark 與本地開發，不耗 Gemini 額度
+        from src.tools.hash_embeddings import HashingEmbeddings
+        return HashingEmbeddings(dim=Config.HASH_EMBEDDING_DIM), f"hash-{Config.HASH_EMBEDDING_DIM}"
+    # 實際 API 呼叫經過全域配額排程器 (快取命中的片段不會佔用額度)
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    return RateLimitedEmbeddings(GoogleGenerativeAIEmbeddings(
+        model=Config.MODEL_EMBEDDING,
+        google_api_key=Config.GOOGLE_API_KEY
+    ), Config.MODEL_EMBEDDING, quota_scheduler), Config.MODEL_EMBEDDING
+
+_embeddings = None
+_embeddings_lock = threading.Lock()
+
+def get_embeddings() -> CachedEmbeddings:
+    """全行程共用的 Embedding (含持久化快取)，第一次匯入或查詢時才建立 Client"""
+    global _embeddings
+    with _embeddings_lock:
+        if _embeddings is None:
+            base_embeddings, model_name = _build_base_embeddings()
+            _embeddings = CachedEmbeddings(
+                base_embeddings,
+                model_name=model_name,
+                db_path=EMBEDDING_CACHE_PATH,
+                max_entries=Config.EMBEDDING_CACHE_MAX_ENTRIES
+            )
+        return _embeddings
+
+def collection_name_for(session_id: str) -> str:
+    return f"user_{session_id.replace('-', '_')}"
+
+def session_id_for(collection_name: str) -> str:
+    """collection_name_for 的反向轉換 (Session ID 為 UUID，只含英數與 '-')"""
+    return collection_name[len("user_"):].replace('_', '-')
+
+def keyword_index_path(collection_name: str) -> str:
+    return os.path.join(KEYWORD_INDEX_DIRECTORY, f"{collection_name}.sqlite3")
+
+def legacy_keyword_index_path(collection_name: str) -> str:
+    """舊版整份寫成 JSON 的關鍵字索引 (含片段內文)，開啟 Session 時會搬移後刪除"""
+    return os.path.join(KEYWORD_INDEX_DIRECTORY, f"{collection_name}.json")
+
+def list_stored_sessions() -> set:
+    """列出磁碟上仍留有資料的所有 Session (上傳目錄、關鍵字索引、文件摘要、向量集合)"""
+    sessions = set()
+    if os.path.isdir(Config.UPLOAD_DIR):
+        sessions.update(name for name in os.listdir(Config.UPLOAD_DIR) if os.path.isdir(os.path.join(Config.UPLOAD_DIR, name)))
+    for directory, suffixes in ((KEYWORD_INDEX_DIRECTORY, (".sqlite3", ".json")), (DOC_SUMMARY_DIRECTORY, (".json",))):
+        if os.path.isdir(directory):
+            sessions.update(session_id_for(name[:name.rindex(".")]) for name in os.listdir(directory)
+                            if name.startswith("user_") and name.endswith(suffixes))
+    if os.path.isdir(NUMPY_VECTOR_DIRECTORY):
+        sessions.update(session_id_for(name) for name in os.listdir(NUMPY_VECTOR_DIRECTORY) if name.startswith("user_"))
+    try:
+        for collection in get_chroma_client().list_collections():
+            name = getattr(collection, "name", collection)
+            if name.startswith("user_"): sessions.add(session_id_for(name))
+    except Exception as e:
+        print(f"⚠️ 無法列出 Chroma collections：{e}")
+    return sessions
+
+def purge_session_data(session_id: str):
+    """刪除某個 Session 在磁碟上的所有 RAG 資料 (兩種向量後端、關鍵字索引、文件摘要、上傳目錄)"""
+    collection_name = collection_name_for(session_id)
+    try: get_chroma_client().delete_collection(collection_name)
+    except Exception: pass # 不存在的 collection
+    shutil.rmtree(os.path.join(NUMPY_VECTOR_DIRECTORY, collection_name), ignore_errors=True)
+    for path in (*index_files(keyword_index_path(collection_name)), legacy_keyword_index_path(collection_name), os.path.join(DOC_SUMMARY_DIRECTORY, f"{collection_name}.json")):
+        if os.path.exists(path): os.remove(path)
+    shutil.rmtree(os.path.join(Config.UPLOAD_DIR, session_id), ignore_errors=True)
 
 # 定義參數架構
 class RagInput(BaseModel):
@@ -28,52 +120,150 @@ class RAGManager:
     """
     每個使用者 (Session) 專屬的 RAG 管理器。
     支援 Hybrid Search (Vector Search + BM25 Keyword Search)。
+    BM25 使用持久化的倒排索引，隨 ingest/remove/reset 增量更新，查詢時不需重讀整個向量庫。
+    向量檢索透過可替換的 VectorBackend (Config.VECTOR_BACKEND)，片段內文統一由向量後端保存。
     """
     def __init__(self, session_id: str):
         self.session_id = session_id
-        self.collection_name = f"user_{session_id.replace('-', '_')}"
+        self.collection_name = collection_name_for(session_id)
         self.upload_dir = os.path.join(Config.UPLOAD_DIR, self.session_id)
         
         os.makedirs(self.upload_dir, exist_ok=True)
+        self._tool = None
+
+        # 查詢結果快取：Key 帶有 generation，知識庫內容一變動就自動失效
+        self.generation = 0
+        self._generation_lock = threading.Lock()
+        self._query_cache = TTLCache(max_size=Config.RAG_QUERY_CACHE_SIZE, ttl_seconds=Config.RAG_QUERY_CACHE_TTL)
         
-        self.vector_store = Chroma(
-            collection_name=self.collection_name,
-            embedding_function=embeddings,
-            persist_directory=PERSIST_DIRECTORY
+        self.vector_backend = self._create_backend()
+        self.keyword_index = KeywordIndex(keyword_index_path(self.collection_name))
+        self.summaries = DocumentSummaryStore(os.path.join(DOC_SUMMARY_DIRECTORY, f"{self.collection_name}.json"))
+        if os.path.exists(legacy_keyword_index_path(self.collection_name)):
+            self._migrate_legacy_keyword_index()
+        if self.keyword_index.is_empty():
+            self._backfill_keyword_index()
+
+    def _create_backend(self):
+        return create_vector_backend(
+            Config.VECTOR_BACKEND, self.collection_name,
+            chroma_client_factory=get_chroma_client,
+            numpy_root=NUMPY_VECTOR_DIRECTORY,
+            quantize=Config.VECTOR_QUANTIZE_INT8
         )
 
-    def ingest_file(self, uploaded_file_bytes: bytes, filename: str):
-        """將二進位檔案寫入專屬目錄並存入向量庫"""
+    def _backfill_keyword_index(self):
+        """舊版資料只存在 Chroma 中：一次性回填關鍵字索引，之後即走增量更新"""
+        try:
+            ids, documents, metadatas = self.vector_backend.get_all()
+            if not ids: return
+            sources = [(meta or {}).get("source", "") for meta in metadatas]
+            self.keyword_index.add(ids, documents, sources)
+        except Exception as e:
+            print(f"⚠️ 關鍵字索引回填失敗：{e}")
+
+    def _migrate_legacy_keyword_index(self):
+        """舊版 JSON 索引：內文補寫到向量後端、Postings 改寫成 SQLite 索引，成功後刪除 JSON (只會發生一次)"""
+        legacy_path = legacy_keyword_index_path(self.collection_name)
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                docs = json.load(f).get("docs", {})
+            ids = list(docs)
+            texts = [docs[chunk_id]["text"] for chunk_id in ids]
+            self.vector_backend.backfill_texts(ids, texts)
+            self.keyword_index.add(ids, texts, [docs[chunk_id]["source"] for chunk_id in ids])
+            os.remove(legacy_path)
+            print(f"  -> [RAG] 已將舊版關鍵字索引轉換為 SQLite ({len(ids)} 個片段)")
+        except Exception as e:
+            print(f"⚠️ 舊版關鍵字索引轉換失敗：{e}")
+
+    def _bump_generation(self):
+        """知識庫內容有變動：遞增版本號，舊版本的查詢結果不會再被使用"""
+        with self._generation_lock:
+            self.generation += 1
+        self._query_cache.clear()
+
+    def add_chunks(self, ids: list, texts: list, metadatas: list) -> int:
+        """Embedding 一批片段並寫入向量庫與關鍵字索引，回傳 Embedding 快取命中數"""
+        # 先查 Embedding 快取，只有沒看過的片段才呼叫 Embedding API
+        vectors, hits = get_embeddings().embed_documents_with_stats(texts)
+        self.vector_backend.add(ids, vectors, texts, metadatas)
+        self.keyword_index.add(ids, texts, [m["source"] for m in metadatas])
+        self._bump_generation()
+        return hits
+
+    def delete_chunks(self, source: str, ids: list):
+        """回滾某個檔案已寫入的片段 (匯入中途失敗時使用)"""
+        self.vector_backend.delete(ids)
+        self.keyword_index.remove_source(source)
+        self._bump_generation()
+
+    def ingest_file(self, uploaded_file_bytes: bytes, filename: str, on_progress=None, cancel_event=None):
+        """
+        將二進位檔案寫入專屬目錄，並以串流管線 (邊解析、邊切塊、邊 Embedding) 存入向量庫。
+        開啟 Config.DOC_SUMMARY_ENABLED 時同步進行 Map-Reduce 文件摘要，供規劃大綱直接使用。
+        """
+        if not filename.lower().endswith(('.pdf', '.txt')): return "❌ 只支援 PDF/TXT"
         file_path = os.path.join(self.upload_dir, filename)
         
         with open(file_path, "wb") as f:
             f.write(uploaded_file_bytes)
+
+        self.summaries.remove(filename) # 重新上傳同名檔案：舊摘要作廢
+        summary_builder = DocumentSummaryBuilder(
+            filename, group_chars=Config.DOC_SUMMARY_GROUP_CHARS, reduce_fanin=Config.DOC_SUMMARY_REDUCE_FANIN,
+            map_chars=Config.DOC_SUMMARY_MAP_CHARS, reduce_chars=Config.DOC_SUMMARY_REDUCE_CHARS
+        ) if Config.DOC_SUMMARY_ENABLED else None
             
         try:
-            if file_path.lower().endswith('.pdf'): loader = PyPDFLoader(file_path)
-            elif file_path.lower().endswith('.txt'): loader = TextLoader(file_path, encoding='utf-8')
-            else: return "❌ 只支援 PDF/TXT"
-
-            docs = loader.load()
-            for doc in docs: doc.metadata["source"] = file_path
-                
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
-            splits = text_splitter.split_documents(docs)
-            
-            if splits:
-                self.vector_store.add_documents(documents=splits)
-                return f"✅ 已存入知識庫: {filename}"
+            stats = StreamingIngestor(self).ingest(
+                file_path, on_progress=on_progress, cancel_event=cancel_event,
+                on_page=summary_builder.add_page if summary_builder else None
+            )
+            if stats["chunks"]:
+                hit_rate = stats["cache_hits"] / stats["chunks"]
+                print(f"  -> [RAG] {filename}: {stats['pages']} 頁 / {stats['chunks']} 個片段，Embedding 快取命中 {stats['cache_hits']} ({hit_rate:.0%})")
+                if summary_builder:
+                    if on_progress: on_progress(stats["pages"], stats["chunks"], stage="summarizing")
+                    self._store_summary(summary_builder, filename, stats)
+                return f"✅ 已存入知識庫: {filename}（Embedding 快取命中率 {hit_rate:.0%}）"
             return "⚠️ 檔案內容為空。"
+        except IngestCancelled:
+            if summary_builder: summary_builder.cancel()
+            if os.path.exists(file_path): os.remove(file_path)
+            return f"⏹️ 已取消匯入：{filename}"
         except Exception as e:
+            if summary_builder: summary_builder.cancel()
             return f"❌ 讀取失敗：{str(e)}"
+        finally:
+            # 匯入結束時「索引中」的提示也跟著失效
+            self._bump_generation()
+
+    def _store_summary(self, summary_builder: DocumentSummaryBuilder, filename: str, stats: dict):
+        """摘要失敗不影響匯入結果：規劃大綱時該檔案會退回即時檢索"""
+        started = time.perf_counter()
+        try:
+            summary = summary_builder.finish()
+        except Exception as e:
+            print(f"⚠️ 文件摘要失敗 ({filename})：{e}")
+            return
+        if not summary: return
+        self.summaries.set(filename, summary, chunks=stats["chunks"], pages=stats["pages"])
+        print(f"  -> [RAG] {filename}: 文件摘要完成 ({len(summary)} 字，Reduce 等待 {time.perf_counter() - started:.1f}s)")
+
+    def get_document_summaries(self) -> dict:
+        """{檔名: 匯入時預先計算的文件摘要}"""
+        return self.summaries.get_all()
 
     def remove_file(self, filename: str):
         """從專屬資料庫與實體目錄中移除檔案"""
         try:
             file_path = os.path.join(self.upload_dir, filename)
-            existing_docs = self.vector_store.get(where={"source": file_path})
-            if existing_docs['ids']:
-                self.vector_store.delete(ids=existing_docs['ids'])
+            # 關鍵字索引記錄了每個檔案的 chunk_id，直接據此刪除向量
+            chunk_ids = self.keyword_index.remove_source(file_path)
+            self.vector_backend.delete(chunk_ids)
+            self.summaries.remove(filename)
+            self._bump_generation()
             
             if os.path.exists(file_path): 
                 os.remove(file_path)
@@ -83,61 +273,123 @@ class RAGManager:
 
     def reset(self):
         """清空該使用者的專屬資料庫與目錄"""
-        try: self.vector_store.delete_collection()
+        try: self.vector_backend.drop()
         except: pass
+        self.keyword_index.clear()
+        self.summaries.clear()
+        self._bump_generation()
         
         if os.path.exists(self.upload_dir):
             shutil.rmtree(self.upload_dir)
             os.makedirs(self.upload_dir, exist_ok=True)
             
-        self.vector_store = Chroma(
-            collection_name=self.collection_name,
-            embedding_function=embeddings,
-            persist_directory=PERSIST_DIRECTORY
-        )
+        self.vector_backend = self._create_backend()
         return "✅ 重置完成"
 
     def query(self, query_str: str):
         """
-        執行 Hybrid Search (向量語意 + 關鍵字比對)
+        執行 Hybrid Search (向量語意 + 關鍵字比對)。
+        相同 (正規化後的) 問題在知識庫未變動前直接回傳快取結果，不再呼叫 Embedding API。
         """
-        try:
-            # 1. 檢查知識庫是否為空
-            db_data = self.vector_store.get()
-            if not db_data['ids']:
-                return "【系統提示】：目前知識庫是空的（使用者尚未上傳任何文件）。"
-
-            # 2. 建立 Vector Search 檢索器 (擅長抓語意)
-            chroma_retriever = self.vector_store.as_retriever(search_kwargs={"k": 4})
-
-            # 3. 建立 BM25 檢索器 (擅長抓精確關鍵字、數字)
-            # 將 Chroma 裡的原始資料即時轉為 Document 物件給 BM25 吃
-            docs = [Document(page_content=doc, metadata=meta) 
-                    for doc, meta in zip(db_data['documents'], db_data['metadatas'])]
-            bm25_retriever = BM25Retriever.from_documents(docs)
-            bm25_retriever.k = 4 
-
-            # 4. 建立 Ensemble Retriever (混合檢索)
-            # weights=[0.5, 0.5] 代表向量與關鍵字的比重各佔 50%
-            ensemble_retriever = EnsembleRetriever(
-                retrievers=[bm25_retriever, chroma_retriever],
-                weights=[0.5, 0.5]
-            )
+        return self.query_batch([query_str])[0]
 
-            # 5. 執行融合搜尋
-            results = ensemble_retriever.invoke(query_str)
-            
-            if not results:
-                return "知識庫中找不到相關資訊。"
-                
-            # Ensemble 融合後可能會回傳超過 4 筆（去除重複後），我們取前 5 筆最精華的傳給 LLM
-            return "\n\n".join([f"---片段---\n{doc.page_content}" for doc in results[:5]])
-            
-        except Exception as e:
-            return f"搜尋失敗：{str(e)}"
+    @traced("rag.query_batch", "rag")
+    def query_batch(self, queries: list) -> list:
+        """
+        批次 Hybrid Search：多個問題的 Embedding 只打一次 API，向量檢索也一次送進 Chroma。
+        同一批次中已出現過的片段不重複輸出，回傳與 queries 等長的結果文字列表。
+        """
+        if not queries: return []
+        # 1. 檢查知識庫是否為空 (直接看倒排索引，不必把整個 collection 讀出來)
+        pending_jobs = ingest_jobs.active_count(self.session_id)
+        if self.keyword_index.is_empty():
+            if pending_jobs:
+                notice = f"【系統提示】：有 {pending_jobs} 份文件仍在建立索引，目前尚無可檢索的片段，請稍後再試。"
+            else:
+                notice = "【系統提示】：目前知識庫是空的（使用者尚未上傳任何文件）。"
+            return [notice] * len(queries)
+
+        # 2. 先查結果快取，只對沒命中的 (且去重後的) 問題做檢索
+        generation = self.generation
+        results, misses = {}, {}
+        for q in queries:
+            key = normalize_query(q)
+            if key in results or key in misses: continue
+            cached = self._query_cache.get((key, generation))
+            if cached is not None: results[key] = cached
+            else: misses[key] = q
+        record(cache_hits=len(results), cache_misses=len(misses))
+
+        if misses:
+            try:
+                for key, texts in zip(misses, self._hybrid_search(list(misses.values()))):
+                    results[key] = texts
+                    self._query_cache.set((key, generation), texts)
+            except Exception as e:
+                return [f"搜尋失敗：{str(e)}"] * len(queries)
+
+        return self._format_batch(queries, results, pending_jobs)
+
+    def _hybrid_search(self, queries: list) -> list:
+        """對多個問題做向量 + BM25 檢索並以 RRF 融合，回傳每個問題前 5 名片段內文 (tuple)"""
+        # Vector Search (擅長抓語意)：一次 API 取得所有問題的 Embedding，一次批次查詢向量後端
+        query_vectors = get_embeddings().embed_queries(queries)
+        vector_hits = self.vector_backend.query(query_vectors, k=4)
+
+        # BM25 (擅長抓精確關鍵字、數字)，只讀取命中詞彙的 Postings
+        keyword_hits = [[chunk_id for chunk_id, _ in self.keyword_index.search(query_str, k=4)] for query_str in queries]
+        # 所有命中片段的內文一次向後端取回
+        all_ids = list(dict.fromkeys(chunk_id for hits in (*vector_hits, *keyword_hits) for chunk_id in hits))
+        text_of = dict(zip(all_ids, self.vector_backend.get_texts(all_ids)))
+
+        fused_results = []
+        for vector_ids, keyword_ids in zip(vector_hits, keyword_hits):
+            # Weighted Reciprocal Rank Fusion (向量與關鍵字的比重各佔 50%)，以內文去重
+            fused = {}
+            for weight, chunk_ids in ((0.5, keyword_ids), (0.5, vector_ids)):
+                texts = [text_of[chunk_id] for chunk_id in chunk_ids if text_of[chunk_id]]
+                for rank, text in enumerate(texts, 1):
+                    fused[text] = fused.get(text, 0.0) + weight / (rank + RRF_C)
+            # 融合後可能會回傳超過 4 筆（去除重複後），我們取前 5 筆最精華的傳給 LLM
+            fused_results.append(tuple(sorted(fused, key=fused.get, reverse=True)[:5]))
+        return fused_results
+
+    def _format_batch(self, queries: list, results: dict, pending_jobs: int) -> list:
+        seen = {} # 片段內文 -> 第一次出現的問題
+        outputs = []
+        for q in queries:
+            texts = results[normalize_query(q)]
+            if not texts:
+                outputs.append("知識庫中找不到相關資訊。")
+                continue
+            blocks = []
+            for text in texts:
+                if text in seen and seen[text] != q:
+                    blocks.append(f"---片段---\n(與「{seen[text]}」的檢索結果相同，已省略)")
+                else:
+                    seen.setdefault(text, q)
+                    blocks.append(f"---片段---\n{text}")
+            answer = "\n\n".join(blocks)
+            if pending_jobs:
+                # 背景匯入尚未完成：先用已建立索引的片段回答，並提醒結果可能不完整
+                answer = f"【系統提示】：仍有 {pending_jobs} 份文件正在建立索引，以下結果僅涵蓋已完成的部分。\n\n{answer}"
+            outputs.append(answer)
+        return outputs
+
+    def query_cache_stats(self) -> dict:
+        return {**self._query_cache.stats(), "generation": self.generation}
+
+    def approx_memory_bytes(self) -> int:
+        """粗估此 Manager 常駐記憶體 (關鍵字索引連線的頁面快取)，供 Registry 控制總量"""
+        return self.keyword_index.approx_memory_bytes()
 
     def get_tool(self):
-        """產出綁定此 Session 的 LangChain Tool 物件"""
+        """產出綁定此 Session 的 LangChain Tool 物件 (同一個 Manager 只建立一次)"""
+        if self._tool is None:
+            self._tool = self._build_tool()
+        return self._tool
+
+    def _build_tool(self):
         return Tool(
             name="read_knowledge_base",
             description="讀取使用者已上傳的文件。若無上傳文件，請勿使用。支援精確數字與語意混合搜尋。",
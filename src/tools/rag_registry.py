@@ -0,0 +1,110 @@
+# src/tools/rag_registry.py
+import time
+import threading
+from collections import OrderedDict
+from src.config import Config
+from src.tools.rag import RAGManager
+from src.tools.ingest_jobs import ingest_jobs
+
+class RAGRegistry:
+    """
+    行程層級的 RAGManager 快取。
+    每個 Session 只建立一次 Manager (連同 Tool 與關鍵字索引)，Streamlit 每次 rerun 只剩一次字典查找。
+    閒置超過 TTL、超過 Session 數或記憶體上限時，依 LRU 順序釋放。
+    """
+    def __init__(self, max_sessions: int, ttl_seconds: int, max_memory_bytes: int):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_bytes = max_memory_bytes
+        self._entries = OrderedDict() # session_id -> [RAGManager, last_access]
+        self._last_seen = {}          # session_id -> 最後存取時間 (由 Session GC 定期取走並持久化)
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, session_id: str) -> RAGManager:
+        with self._lock:
+            self._last_seen[session_id] = time.time()
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                self.hits += 1
+                entry[1] = time.time()
+                self._entries.move_to_end(session_id)
+                return entry[0]
+
+            self.misses += 1
+            manager = RAGManager(session_id)
+            self._entries[session_id] = [manager, time.time()]
+            self.sweep()
+            return manager
+
+    def get_tool(self, session_id: str):
+        return self.get(session_id).get_tool()
+
+    def evict(self, session_id: str) -> bool:
+        """主動釋放某個 Session (例如資料已被清除)"""
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+        if entry is None: return False
+        entry[0].keyword_index.close()
+        return True
+
+    def _evictable(self, session_id: str) -> bool:
+        # 背景匯入中的 Session 不可釋放，否則會出現兩份不同步的關鍵字索引
+        return ingest_jobs.active_count(session_id) == 0
+
+    def sweep(self):
+        """依 TTL、Session 數與記憶體上限釋放閒置的 Manager"""
+        with self._lock:
+            self._evict_if_needed()
+
+    def _evict_if_needed(self):
+        now = time.time()
+        # 1. TTL：釋放閒置太久的 Session
+        for session_id, (_, last_access) in list(self._entries.items()):
+            if now - last_access > self.ttl_seconds and self._evictable(session_id):
+                self._drop(session_id)
+        # 2. 容量與記憶體上限：從最久沒用的開始釋放 (最新的一個永遠保留)
+        for session_id in list(self._entries.keys())[:-1]:
+            if len(self._entries) <= self.max_sessions and self.memory_bytes() <= self.max_memory_bytes: break
+            if self._evictable(session_id):
+                self._drop(session_id)
+
+    def _drop(self, session_id: str):
+        manager, _ = self._entries.pop(session_id)
+        manager.keyword_index.close()
+        self.evictions += 1
+
+    def pop_last_seen(self) -> dict:
+        """取出並清空自上次呼叫以來的存取紀錄"""
+        with self._lock:
+            seen, self._last_seen = self._last_seen, {}
+            return seen
+
+    def is_loaded(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._entries
+
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return sum(manager.approx_memory_bytes() for manager, _ in self._entries.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "sessions": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+                "memory_bytes": self.memory_bytes(),
+            }
+
+# 全行程共用的 Registry
+rag_registry = RAGRegistry(
+    max_sessions=Config.RAG_REGISTRY_MAX_SESSIONS,
+    ttl_seconds=Config.RAG_REGISTRY_TTL_SECONDS,
+    max_memory_bytes=Config.RAG_REGISTRY_MAX_MEMORY_MB * 1024 * 1024
+)
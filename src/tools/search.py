@@ -1,34 +1,67 @@
 # src/tools/search.py
-import requests
-from langchain_google_community import GoogleSearchAPIWrapper
+import os
+import threading
+from dataclasses import asdict
 from langchain_core.tools import Tool, tool
 from pydantic import BaseModel, Field
 from src.config import Config
+from src.tools.web_fetch import web_fetcher, FetchResult
+from src.tools.prefetch import page_prefetcher
+from src.utils.cache import normalize_query, canonical_url
+from src.utils.disk_cache import DiskCache
 
-# 初始化 Google Search Wrapper
-search_wrapper = GoogleSearchAPIWrapper(
-    google_api_key=Config.GOOGLE_SEARCH_API_KEY,
-    google_cse_id=Config.GOOGLE_CSE_ID,
-    k=5
-)
+_search_wrapper = None
+_search_wrapper_lock = threading.Lock()
+
+def get_search_wrapper():
+    """Google Search Wrapper 延遲到第一次搜尋才建立 (googleapiclient 的匯入與 discovery 都不便宜)"""
+    global _search_wrapper
+    with _search_wrapper_lock:
+        if _search_wrapper is None:
+            from langchain_google_community import GoogleSearchAPIWrapper
+            _search_wrapper = GoogleSearchAPIWrapper(
+                google_api_key=Config.GOOGLE_SEARCH_API_KEY,
+                google_cse_id=Config.GOOGLE_CSE_ID,
+                k=5
+            )
+        return _search_wrapper
+
+# 搜尋結果與網頁全文的持久化快取 (與向量資料一起存放在 chroma_db/，重啟後仍有效)
+TOOL_CACHE_PATH = os.path.join(os.getcwd(), "chroma_db", "tool_cache.sqlite3")
+tool_cache = DiskCache(TOOL_CACHE_PATH, max_entries=Config.TOOL_CACHE_MAX_ENTRIES)
 
 # 定義參數架構 (Schema)
 class SearchInput(BaseModel):
     query: str = Field(description="The search query string. Cannot be empty.")
 
-def search_func(query: str):
+class WebpageInput(BaseModel):
+    url: str = Field(description="The full URL of the webpage to read.")
+
+def search_func(query: str, session_id: str = None):
     """
     執行 Google 搜尋並回傳結果摘要與明確的網址。
+    開啟預取模式且帶有 session_id 時，會在背景先抓取前幾個網址的全文。
     """
     if not query or query.strip() == "" or query == "None":
         return "⚠️ 搜尋失敗：未提供搜尋關鍵字。請分析使用者的對話內容，提取出具體的搜尋詞，然後再試一次。"
 
     try:
-        # 用 .results() 取得結構化字典，確保一定拿得到 'link'
-        raw_results = search_wrapper.results(query, 5)
+        # 用 .results() 取得結構化字典，確保一定拿得到 'link'；相同 (正規化後) 的查詢直接使用快取，不耗 API 配額
+        raw_results = tool_cache.get_or_fetch(
+            "google_search", normalize_query(query), lambda: get_search_wrapper().results(query, 5),
+            ttl_seconds=Config.SEARCH_CACHE_TTL, stale_seconds=Config.SEARCH_CACHE_STALE_SECONDS,
+            should_cache=lambda results: bool(results) and "link" in results[0]
+        )
         
-        if not raw_results:
+        if not raw_results or "link" not in raw_results[0]:
             return f"找不到關於 '{query}' 的相關資訊。"
+
+        if Config.PREFETCH_ENABLED and session_id:
+            # 已在持久化快取中的網頁不必預取
+            page_prefetcher.schedule(
+                session_id, [r["link"] for r in raw_results if r.get("link")],
+                skip=lambda key: tool_cache.get("read_webpage", key) is not None
+            )
             
         # 格式化輸出，強制把「網址」獨立列出，讓 LLM 方便抓取
         formatted_results = []
@@ -49,6 +82,20 @@ search_tool = Tool(
     args_schema=SearchInput
 )
 
+def read_webpage_func(url: str) -> str:
+    def fetch():
+        # 預取命中 (或正在下載) 時直接取用，否則即時抓取
+        prefetched = page_prefetcher.take(url) if Config.PREFETCH_ENABLED else None
+        return asdict(prefetched or web_fetcher.fetch(url))
+
+    # 只快取成功讀到內文的結果，錯誤、非 200 狀態碼與讀取逾時的部分內文下次仍會重試
+    data = tool_cache.get_or_fetch(
+        "read_webpage", canonical_url(url), fetch,
+        ttl_seconds=Config.WEBPAGE_CACHE_TTL, stale_seconds=Config.WEBPAGE_CACHE_STALE_SECONDS,
+        should_cache=lambda d: d["error"] is None and d["status"] == 200 and not d.get("timed_out")
+    )
+    return format_fetch_result(FetchResult(**data))
+
 @tool
 def read_webpage(url: str) -> str:
     """
@@ -56,16 +103,28 @@ def read_webpage(url: str) -> str:
     當你使用 google_search 找到相關網址，但摘要內容不夠完整（例如需要具體數據、完整新聞、財報細節）時，
     請將該網址 (URL) 傳入此工具，以獲取網頁的完整純文字內容。
     """
-    try:
-        clean_url = url.strip().strip('"').strip("'")
-        target_url = f"https://r.jina.ai/{clean_url}"
-        
-        response = requests.get(target_url, timeout=15)
-        
-        if response.status_code == 200:
-            content = response.text
-            return content[:10000] + "\n...(文章過長已於尾部截斷)"
-        
-        return f"無法讀取網頁，狀態碼：{response.status_code}"
-    except Exception as e:
-        return f"讀取網頁發生錯誤：{str(e)}"
\ No newline at end of file
+    return read_webpage_func(url)
+
+def get_web_tools(session_id: str) -> list:
+    """建立綁定 Session 的 [google_search, read_webpage] (預取額度依 Session 計算)"""
+    session_search = Tool(
+        name=search_tool.name, description=search_tool.description,
+        func=lambda query: search_func(query, session_id), args_schema=SearchInput
+    )
+    session_read = Tool(
+        name=read_webpage.name, description=read_webpage.description,
+        func=read_webpage_func, args_schema=WebpageInput
+    )
+    return [session_search, session_read]
+
+def format_fetch_result(result) -> str:
+    """將 FetchResult 轉成給 LLM 閱讀的文字 (沿用原本的錯誤訊息格式)"""
+    if result.error:
+        return f"讀取網頁發生錯誤：{result.error}"
+    if result.status != 200:
+        return f"無法讀取網頁，狀態碼：{result.status}"
+    if result.truncated:
+        return result.text + "\n...(文章過長已於尾部截斷)"
+    if result.timed_out:
+        return result.text + "\n...(網頁讀取逾時，僅取得部分內容)"
+    return result.text
\ No newline at end of file
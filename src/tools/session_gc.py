@@ -0,0 +1,189 @@
+# src/tools/session_gc.py
+import os
+import json
+import time
+import threading
+from src.config import Config
+from src.tools.rag import (
+    PERSIST_DIRECTORY, NUMPY_VECTOR_DIRECTORY,
+    collection_name_for, keyword_index_path, legacy_keyword_index_path, list_stored_sessions, purge_session_data
+)
+from src.tools.keyword_index import index_files
+from src.tools.rag_registry import rag_registry
+from src.tools.ingest_jobs import ingest_jobs
+from src.tools.prefetch import page_prefetcher
+
+ACCESS_LOG_PATH = os.path.join(PERSIST_DIRECTORY, "session_access.json")
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try: total += os.path.getsize(os.path.join(root, name))
+            except OSError: pass
+    return total
+
+def _output_path(session_id: str) -> str:
+    # 與 writer_node 的命名規則一致 (完整 session_id，避免誤刪前綴相同的其他 Session 的簡報)
+    return os.path.join(Config.OUTPUT_DIR, f"presentation_{session_id}.pptx")
+
+class SessionSweeper:
+    """
+    Session 生命週期回收器 (背景執行緒)。
+    記錄每個 Session 的最後存取時間，定期刪除過期 Session 的向量集合、關鍵字索引、上傳目錄與輸出簡報；
+    磁碟用量超過預算時，再從最久沒用的 Session 開始回收，但只回收閒置超過 pressure_ttl_seconds 的
+    (不在 Registry 中的 Session 可能只是被換出記憶體，分頁仍開著)。每輪最多處理 batch_size 個，不阻塞前端請求。
+    """
+    def __init__(self, ttl_seconds: int, disk_budget_bytes: int, interval_seconds: int, batch_size: int, pressure_ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self.pressure_ttl_seconds = pressure_ttl_seconds
+        self.disk_budget_bytes = disk_budget_bytes
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._access = self._load_access_log() # session_id -> 最後存取時間
+        self._retired = {}                     # session_id -> 退役時間 (下一輪立即回收)
+        self.last_report = None
+        self.totals = {"sweeps": 0, "sessions_deleted": 0, "bytes_reclaimed": 0}
+
+    # --- 存取紀錄 ---
+    def _load_access_log(self) -> dict:
+        try:
+            with open(ACCESS_LOG_PATH, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_access_log(self):
+        os.makedirs(os.path.dirname(ACCESS_LOG_PATH), exist_ok=True)
+        tmp_path = f"{ACCESS_LOG_PATH}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._access, f)
+        os.replace(tmp_path, ACCESS_LOG_PATH)
+
+    def retire(self, session_id: str):
+        """Session 已被前端捨棄 (例如「捨棄重來」)，下一輪直接回收"""
+        with self._lock:
+            self._retired[session_id] = time.time()
+
+    # --- 背景執行 ---
+    def start(self):
+        """啟動背景回收執行緒 (可重複呼叫，只會啟動一次)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive(): return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._loop, name="session-gc", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _loop(self):
+        while not self._stop_event.wait(self.interval_seconds):
+            try:
+                self.sweep_once()
+            except Exception as e:
+                print(f"⚠️ Session GC 執行失敗：{e}")
+
+    def _footprint(self) -> int:
+        return sum(_dir_size(path) for path in (PERSIST_DIRECTORY, Config.UPLOAD_DIR, Config.OUTPUT_DIR))
+
+    def _merge_last_seen(self):
+        for session_id, seen_at in rag_registry.pop_last_seen().items():
+            # 退役之後又被使用 (例如同一個分頁還開著) 才取消退役
+            if seen_at > self._retired.get(session_id, 0):
+                self._retired.pop(session_id, None)
+                self._access[session_id] = seen_at
+
+    def _last_access(self, session_id: str) -> float:
+        if session_id in self._retired: return 0
+        if session_id in self._access: return self._access[session_id]
+        # 沒有紀錄的舊資料 (例如升級前留下的)：以上傳目錄的修改時間估計
+        upload_dir = os.path.join(Config.UPLOAD_DIR, session_id)
+        return os.path.getmtime(upload_dir) if os.path.exists(upload_dir) else 0
+
+    def _is_busy(self, session_id: str, now: float) -> bool:
+        # 背景匯入中、或仍在 Registry 中且最近有人使用的 Session 不可回收
+        if ingest_jobs.active_count(session_id): return True
+        return rag_registry.is_loaded(session_id) and now - self._last_access(session_id) < self.ttl_seconds
+
+    def sweep_once(self) -> dict:
+        """執行一輪回收，回傳本輪報告"""
+        started = time.time()
+        with self._lock:
+            self._merge_last_seen()
+            now = time.time()
+            candidates = sorted(
+                (self._last_access(sid), sid) for sid in list_stored_sessions() | set(self._access) | set(self._retired)
+                if not self._is_busy(sid, now)
+            )
+        before = self._footprint()
+
+        # 1. TTL 過期 (含已退役) 的 Session
+        victims = [sid for last, sid in candidates if now - last > self.ttl_seconds][:self.batch_size]
+        # 2. 仍超出磁碟預算：由舊到新繼續回收，直到遇到閒置未滿 pressure_ttl_seconds 的 Session
+        if before > self.disk_budget_bytes:
+            for last, sid in candidates:
+                if len(victims) >= self.batch_size or now - last <= self.pressure_ttl_seconds: break
+                if sid not in victims: victims.append(sid)
+                estimated = before - sum(self._session_size(v) for v in victims)
+                if estimated <= self.disk_budget_bytes: break
+
+        for session_id in victims:
+            self._purge(session_id)
+
+        after = self._footprint()
+        report = {
+            "started_at": started,
+            "duration_seconds": round(time.time() - started, 3),
+            "sessions_deleted": len(victims),
+            "session_ids": victims,
+            "bytes_before": before,
+            "bytes_after": after,
+            "bytes_reclaimed": max(0, before - after),
+        }
+        with self._lock:
+            self._save_access_log()
+            self.last_report = report
+            self.totals["sweeps"] += 1
+            self.totals["sessions_deleted"] += len(victims)
+            self.totals["bytes_reclaimed"] += report["bytes_reclaimed"]
+        if victims:
+            print(f"🧹 [Session GC] 回收 {len(victims)} 個 Session，釋放 {report['bytes_reclaimed'] / 1024 / 1024:.1f} MB")
+        return report
+
+    def _session_size(self, session_id: str) -> int:
+        """估計回收某個 Session 可釋放的空間 (Chroma 的 SQLite 不會即時縮小，故不計入)"""
+        collection_name = collection_name_for(session_id)
+        size = _dir_size(os.path.join(Config.UPLOAD_DIR, session_id))
+        size += _dir_size(os.path.join(NUMPY_VECTOR_DIRECTORY, collection_name))
+        for index_path in (*index_files(keyword_index_path(collection_name)), legacy_keyword_index_path(collection_name)):
+            if os.path.exists(index_path): size += os.path.getsize(index_path)
+        output_path = _output_path(session_id)
+        if os.path.exists(output_path): size += os.path.getsize(output_path)
+        return size
+
+    def _purge(self, session_id: str):
+        rag_registry.evict(session_id)
+        page_prefetcher.cancel_session(session_id)
+        purge_session_data(session_id)
+        output_path = _output_path(session_id)
+        if os.path.exists(output_path): os.remove(output_path)
+        with self._lock:
+            self._access.pop(session_id, None)
+            self._retired.pop(session_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self.totals, "tracked_sessions": len(self._access), "last_report": self.last_report}
+
+# 全行程共用的回收器 (由 app 啟動背景執行緒)
+session_sweeper = SessionSweeper(
+    ttl_seconds=Config.SESSION_TTL_HOURS * 3600,
+    disk_budget_bytes=Config.SESSION_DISK_BUDGET_MB * 1024 * 1024,
+    interval_seconds=Config.SESSION_GC_INTERVAL_SECONDS,
+    batch_size=Config.SESSION_GC_BATCH_SIZE,
+    pressure_ttl_seconds=Config.SESSION_PRESSURE_TTL_HOURS * 3600
+)
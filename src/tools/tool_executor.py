@@ -0,0 +1,119 @@
+# src/tools/tool_executor.py
+import time
+import asyncio
+import threading
+import concurrent.futures
+from src.config import Config
+from src.utils.tracing import span, bind_context
+
+# 每種工具各自一個執行緒池 (LangChain 工具皆為同步函式)：
+# 逾時後被放棄、仍在背景跑完的呼叫只會佔用同一種工具的執行緒，不會拖垮其他工具
+_tool_pools = {}
+_tool_pools_lock = threading.Lock()
+
+def _pool_for(name: str) -> concurrent.futures.ThreadPoolExecutor:
+    with _tool_pools_lock:
+        if name not in _tool_pools:
+            _tool_pools[name] = concurrent.futures.ThreadPoolExecutor(
+                max_workers=Config.TOOL_EXECUTOR_WORKERS, thread_name_prefix=f"tool-{name}"
+            )
+        return _tool_pools[name]
+
+class AsyncToolExecutor:
+    """
+    以 asyncio 平行執行同一輪的所有 tool_calls：
+    - 每種工具各自的併發上限 (Semaphore) 與逾時秒數 (Config.TOOL_CONCURRENCY / Config.TOOL_TIMEOUTS)；
+      逾時從工作執行緒真正開始執行才起算，在執行緒池排隊的時間不計入
+    - 任一呼叫完成就立刻回呼 on_result，前端可逐筆更新狀態；慢的網頁逾時後以提示文字取代，不拖累其他結果
+    - batch_handlers 可把同名工具合併成一次批次呼叫 (例如知識庫查詢)
+    - deadline 到期時取消所有未完成的呼叫
+    """
+    def __init__(self, concurrency: dict, timeouts: dict, default_concurrency: int = 2, default_timeout: float = 30):
+        self.concurrency = concurrency
+        self.timeouts = timeouts
+        self.default_concurrency = default_concurrency
+        self.default_timeout = default_timeout
+
+    def _timeout_for(self, name: str) -> float:
+        return self.timeouts.get(name, self.default_timeout)
+
+    async def _call_in_pool(self, name: str, fn, semaphore: asyncio.Semaphore, **span_attrs):
+        loop = asyncio.get_running_loop()
+        started = asyncio.Event()
+        def traced_fn():
+            loop.call_soon_threadsafe(started.set)
+            with span(f"tool.{name}", "tool", **span_attrs):
+                return fn()
+        async with semaphore:
+            future = loop.run_in_executor(_pool_for(name), bind_context(traced_fn))
+            started_waiter = asyncio.ensure_future(started.wait())
+            try:
+                await asyncio.wait({future, started_waiter}, return_when=asyncio.FIRST_COMPLETED)
+            except asyncio.CancelledError:
+                future.cancel() # 本輪已結束：還在排隊的呼叫直接取消，不會晚點才執行
+                raise
+            finally:
+                started_waiter.cancel()
+            # 逾時只是不再等待；背景執行緒仍會在工具自身的逾時 (例如 HTTP timeout) 後結束
+            return await asyncio.wait_for(future, timeout=self._timeout_for(name))
+
+    async def _run_async(self, tool_calls: list, tool_map: dict, on_result, batch_handlers: dict, deadline: float) -> dict:
+        semaphores = {}
+        def semaphore_for(name):
+            if name not in semaphores:
+                semaphores[name] = asyncio.Semaphore(self.concurrency.get(name, self.default_concurrency))
+            return semaphores[name]
+
+        results = {}
+        def finish(tc, result, started):
+            results[tc["id"]] = result
+            if on_result: on_result(tc, result, time.perf_counter() - started, len(results), len(tool_calls))
+
+        async def run_single(tc):
+            started = time.perf_counter()
+            tool_instance = tool_map.get(tc["name"])
+            if tool_instance is None:
+                return finish(tc, "Tool not found", started)
+            try:
+                result = await self._call_in_pool(tc["name"], lambda: tool_instance.invoke(tc["args"]), semaphore_for(tc["name"]),
+                                                  args=str(tc["args"])[:120])
+            except asyncio.TimeoutError:
+                result = f"⏱️ 工具執行逾時 ({self._timeout_for(tc['name']):.0f} 秒)，已略過此結果，請改用其他來源。"
+            except Exception as e:
+                result = f"工具執行錯誤：{e}"
+            finish(tc, result, started)
+
+        async def run_batch(name, calls):
+            started = time.perf_counter()
+            try:
+                batch_results = await self._call_in_pool(name, lambda: batch_handlers[name](calls), semaphore_for(name), batch=len(calls))
+            except asyncio.TimeoutError:
+                batch_results = [f"⏱️ 工具執行逾時 ({self._timeout_for(name):.0f} 秒)，已略過此結果。"] * len(calls)
+            except Exception as e:
+                batch_results = [f"工具執行錯誤：{e}"] * len(calls)
+            for tc, result in zip(calls, batch_results):
+                finish(tc, result, started)
+
+        tasks = []
+        for name in batch_handlers:
+            calls = [tc for tc in tool_calls if tc["name"] == name]
+            if calls: tasks.append(asyncio.create_task(run_batch(name, calls)))
+        tasks += [asyncio.create_task(run_single(tc)) for tc in tool_calls if tc["name"] not in batch_handlers]
+
+        _, pending = await asyncio.wait(tasks, timeout=max(0.0, deadline - time.monotonic()) if deadline else None)
+        for task in pending:
+            task.cancel()
+        for tc in tool_calls:
+            if tc["id"] not in results:
+                finish(tc, "⏹️ 本輪工具執行已達時間上限，此呼叫已取消。", time.perf_counter())
+        return results
+
+    def run(self, tool_calls: list, tool_map: dict, on_result=None, batch_handlers: dict = None, deadline_seconds: float = None) -> dict:
+        """
+        同步入口 (供 Streamlit 腳本執行緒呼叫)，回傳 {tool_call_id: 結果}。
+        on_result(tool_call, result, elapsed_seconds, done_count, total) 會在呼叫端執行緒中被呼叫。
+        """
+        deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
+        return asyncio.run(self._run_async(tool_calls, tool_map, on_result, batch_handlers or {}, deadline))
+
+tool_executor = AsyncToolExecutor(Config.TOOL_CONCURRENCY, Config.TOOL_TIMEOUTS)
@@ -0,0 +1,288 @@
+# src/tools/vector_backends.py
+import os
+import json
+import shutil
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+import numpy as np
+
+class VectorBackend(ABC):
+    """
+    RAGManager 背後的向量儲存介面。
+    片段內文統一由向量後端保存 (get_texts)，關鍵字索引只負責「查詢 -> chunk_id」。
+    """
+    @abstractmethod
+    def add(self, ids: list, vectors: list, texts: list, metadatas: list): ...
+    @abstractmethod
+    def delete(self, ids: list): ...
+    @abstractmethod
+    def query(self, query_vectors: list, k: int) -> list: ... # 每個 query 回傳 [chunk_id, ...]
+    @abstractmethod
+    def get_texts(self, ids: list) -> list: ... # 與 ids 等長，不存在的片段為空字串
+    @abstractmethod
+    def count(self) -> int: ...
+    @abstractmethod
+    def drop(self): ...
+
+    def get_all(self):
+        """回傳 (ids, texts, metadatas)，供舊資料回填關鍵字索引使用"""
+        return [], [], []
+
+    def backfill_texts(self, ids: list, texts: list):
+        """舊版資料的內文存在關鍵字索引中：搬移時補寫到向量後端 (本身就存有內文的後端不需處理)"""
+
+class ChromaBackend(VectorBackend):
+    """Chroma (SQLite + HNSW) 後端，所有 Session 共用同一個 PersistentClient"""
+    def __init__(self, client, collection_name: str):
+        self.client = client
+        self.collection_name = collection_name
+        # embedding_function=None：向量一律由外部算好傳入，避免 Chroma 載入預設的 ONNX 模型
+        self.collection = client.get_or_create_collection(name=collection_name, embedding_function=None)
+
+    def add(self, ids, vectors, texts, metadatas):
+        self.collection.upsert(ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+
+    def delete(self, ids):
+        if ids: self.collection.delete(ids=ids)
+
+    def query(self, query_vectors, k):
+        if self.collection.count() == 0: return [[] for _ in query_vectors]
+        res = self.collection.query(query_embeddings=query_vectors, n_results=k, include=[])
+        return res["ids"]
+
+    def get_texts(self, ids):
+        if not ids: return []
+        data = self.collection.get(ids=list(dict.fromkeys(ids)), include=["documents"])
+        text_of = dict(zip(data["ids"], data["documents"]))
+        return [text_of.get(chunk_id) or "" for chunk_id in ids]
+
+    def count(self):
+        return self.collection.count()
+
+    def drop(self):
+        try: self.client.delete_collection(self.collection_name)
+        except Exception: pass
+
+    def get_all(self):
+        data = self.collection.get(include=["documents", "metadatas"])
+        return data["ids"], data["documents"], data["metadatas"]
+
+class NumpyBackend(VectorBackend):
+    """
+    以 NumPy memmap 實作的精確檢索後端 (每個 Session 一個目錄)：
+    - 向量先做 L2 正規化，內積即 Cosine 相似度；可選 int8 純量量化 (每列一個 scale)，磁碟與記憶體約省 4 倍
+    - 只允許追加寫入 (Append-only)，刪除以墓碑 (Tombstone) 標記，墓碑過半時才壓實重寫
+    - meta.json 是唯一的真實來源：向量先寫、meta 後以 os.replace 原子更新；中途當機多出的向量列在載入時截掉，
+      壓實寫到新世代 (generation) 的檔案，meta 切換後才刪除舊檔
+    - 查詢時分塊做批次矩陣乘法，小型語料比 HNSW 更快且結果精確
+    - 片段內文存在同目錄的 texts.sqlite3，先於向量寫入；當機留下的多餘內文無害，重新匯入時覆寫
+    """
+    BLOCK_ROWS = 65_536
+    COMPACT_RATIO = 0.5
+
+    def __init__(self, directory: str, quantize: bool = True):
+        self.directory = directory
+        self.quantize = quantize
+        self._lock = threading.RLock()
+        self._matrix = None # 延遲建立的 memmap，追加寫入後失效
+        self._scales = None
+        self._texts_conn = None
+        os.makedirs(directory, exist_ok=True)
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.texts_path = os.path.join(directory, "texts.sqlite3")
+        self.meta = {"dim": None, "quantize": quantize, "ids": [], "tombstones": []}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                self.meta = json.load(f)
+            self.quantize = self.meta["quantize"]
+        self._recover()
+        self._tombstones = set(self.meta["tombstones"])
+        self._row_of = {chunk_id: row for row, chunk_id in enumerate(self.meta["ids"]) if row not in self._tombstones}
+
+    @property
+    def _dtype(self):
+        return np.int8 if self.quantize else np.float32
+
+    def _data_path(self, name: str) -> str:
+        generation = self.meta.get("generation", 0)
+        return os.path.join(self.directory, f"{name}.{generation}" if generation else name)
+
+    @property
+    def _vectors_path(self):
+        return self._data_path("vectors.i8" if self.quantize else "vectors.f32")
+
+    @property
+    def _scales_path(self):
+        return self._data_path("scales.f32")
+
+    def _recover(self):
+        """上次寫入中途中斷時的復原：向量檔截斷到 meta 記錄的列數，並刪除不屬於目前世代的殘檔"""
+        rows, dim = len(self.meta["ids"]), self.meta["dim"] or 0
+        expected = {self._vectors_path: rows * dim * np.dtype(self._dtype).itemsize}
+        if self.quantize: expected[self._scales_path] = rows * np.dtype(np.float32).itemsize
+        for path, size in expected.items():
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith(("vectors.", "scales.", "meta.json.")) and path not in expected:
+                os.remove(path)
+
+    def _get_texts_conn(self):
+        """呼叫端需持有 _lock"""
+        if self._texts_conn is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._texts_conn = sqlite3.connect(self.texts_path, check_same_thread=False, timeout=30)
+            self._texts_conn.execute("PRAGMA journal_mode=WAL")
+            self._texts_conn.execute("CREATE TABLE IF NOT EXISTS texts (chunk_id TEXT PRIMARY KEY, text TEXT NOT NULL)")
+        return self._texts_conn
+
+    def _write_texts(self, ids, texts):
+        conn = self._get_texts_conn()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO texts (chunk_id, text) VALUES (?, ?)", zip(ids, texts))
+
+    def _save_meta(self):
+        self.meta["tombstones"] = sorted(self._tombstones)
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def _encode(self, vectors: np.ndarray):
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+        if not self.quantize: return vectors.astype(np.float32), None
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def _load(self):
+        if self._matrix is None and self.meta["ids"]:
+            rows, dim = len(self.meta["ids"]), self.meta["dim"]
+            self._matrix = np.memmap(self._vectors_path, dtype=self._dtype, mode="r", shape=(rows, dim))
+            if self.quantize:
+                self._scales = np.memmap(self._scales_path, dtype=np.float32, mode="r", shape=(rows,))
+        return self._matrix
+
+    def add(self, ids, vectors, texts, metadatas):
+        with self._lock:
+            new = [(i, v, t) for i, v, t in zip(ids, vectors, texts) if i not in self._row_of]
+            if not new: return
+            self._write_texts([i for i, _, _ in new], [t for _, _, t in new])
+            matrix = np.asarray([v for _, v, _ in new], dtype=np.float32)
+            if self.meta["dim"] is None: self.meta["dim"] = matrix.shape[1]
+            encoded, scales = self._encode(matrix)
+            with open(self._vectors_path, "ab") as f:
+                f.write(encoded.tobytes())
+            if scales is not None:
+                with open(self._scales_path, "ab") as f:
+                    f.write(scales.tobytes())
+            for chunk_id, _, _ in new:
+                self._row_of[chunk_id] = len(self.meta["ids"])
+                self.meta["ids"].append(chunk_id)
+            self._matrix = self._scales = None
+            self._save_meta()
+
+    def delete(self, ids):
+        with self._lock:
+            removed = [i for i in ids if i in self._row_of]
+            if not removed: return
+            rows = [self._row_of.pop(i) for i in removed]
+            self._tombstones.update(rows)
+            if len(self._tombstones) >= self.COMPACT_RATIO * len(self.meta["ids"]):
+                self._compact()
+            else:
+                self._save_meta()
+            # meta 更新後才刪內文：中途當機時仍在 meta 中的片段不會失去內文
+            conn = self._get_texts_conn()
+            with conn:
+                conn.executemany("DELETE FROM texts WHERE chunk_id = ?", ((i,) for i in removed))
+
+    def _compact(self):
+        """重寫掉被墓碑標記的列"""
+        keep = [row for row in range(len(self.meta["ids"])) if row not in self._tombstones]
+        matrix = self._load()
+        kept_vectors = np.array(matrix[keep]) if keep else None
+        kept_scales = np.array(self._scales[keep]) if keep and self.quantize else None
+        self._matrix = self._scales = None
+        old_paths = (self._vectors_path, self._scales_path)
+        self.meta["generation"] = self.meta.get("generation", 0) + 1
+        if kept_vectors is not None:
+            with open(self._vectors_path, "wb") as f: f.write(kept_vectors.tobytes())
+            if kept_scales is not None:
+                with open(self._scales_path, "wb") as f: f.write(kept_scales.tobytes())
+        self.meta["ids"] = [self.meta["ids"][row] for row in keep]
+        self._row_of = {chunk_id: row for row, chunk_id in enumerate(self.meta["ids"])}
+        self._tombstones = set()
+        self._save_meta() # meta 切換到新世代後才刪舊檔，中途當機仍可從舊世代完整載入
+        for path in old_paths:
+            if os.path.exists(path): os.remove(path)
+
+    def query(self, query_vectors, k):
+        # 整個計分都持有鎖：壓實會換掉 memmap 背後的檔案與列號，不能在計分途中發生
+        with self._lock:
+            return self._query_locked(query_vectors, k)
+
+    def _query_locked(self, query_vectors, k):
+        matrix = self._load()
+        if matrix is None: return [[] for _ in query_vectors]
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        scales, ids = self._scales, self.meta["ids"]
+        tombstones = np.fromiter(self._tombstones, dtype=np.int64) if self._tombstones else None
+
+        n_rows = matrix.shape[0]
+        scores = np.empty((n_rows, len(queries)), dtype=np.float32)
+        for start in range(0, n_rows, self.BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + self.BLOCK_ROWS], dtype=np.float32)
+            block_scores = block @ queries.T
+            if scales is not None:
+                block_scores *= np.asarray(scales[start:start + self.BLOCK_ROWS])[:, None]
+            scores[start:start + len(block)] = block_scores
+        if tombstones is not None:
+            scores[tombstones] = -np.inf
+
+        k = min(k, n_rows - (len(tombstones) if tombstones is not None else 0))
+        if k <= 0: return [[] for _ in query_vectors]
+        results = []
+        for col in range(scores.shape[1]):
+            column = scores[:, col]
+            top = np.argpartition(-column, k - 1)[:k]
+            top = top[np.argsort(-column[top])]
+            results.append([ids[row] for row in top])
+        return results
+
+    def get_texts(self, ids):
+        if not ids: return []
+        with self._lock:
+            if self._texts_conn is None and not os.path.exists(self.texts_path): return [""] * len(ids)
+            conn = self._get_texts_conn()
+            unique = list(dict.fromkeys(ids))
+            text_of = {}
+            for start in range(0, len(unique), 500): # SQLite 單次查詢的參數數量有限
+                batch = unique[start:start + 500]
+                text_of.update(conn.execute(f"SELECT chunk_id, text FROM texts WHERE chunk_id IN ({','.join('?' * len(batch))})", batch))
+        return [text_of.get(chunk_id, "") for chunk_id in ids]
+
+    def backfill_texts(self, ids, texts):
+        with self._lock:
+            pairs = [(i, t) for i, t in zip(ids, texts) if i in self._row_of]
+            if pairs: self._write_texts([i for i, _ in pairs], [t for _, t in pairs])
+
+    def count(self):
+        return len(self.meta["ids"]) - len(self._tombstones)
+
+    def drop(self):
+        with self._lock:
+            self._matrix = self._scales = None
+            if self._texts_conn is not None:
+                self._texts_conn.close()
+                self._texts_conn = None
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+def create_vector_backend(kind: str, collection_name: str, chroma_client_factory, numpy_root: str, quantize: bool = True) -> VectorBackend:
+    """依 Config.VECTOR_BACKEND 建立向量後端 ("chroma" 或 "numpy")"""
+    if kind == "numpy":
+        return NumpyBackend(os.path.join(numpy_root, collection_name), quantize=quantize)
+    return ChromaBackend(chroma_client_factory(), collection_name)
@@ -0,0 +1,128 @@
+# src/tools/web_fetch.py
+import time
+import codecs
+import threading
+import concurrent.futures
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from src.config import Config
+
+@dataclass
+class FetchResult:
+    url: str
+    status: Optional[int] = None
+    text: str = ""
+    truncated: bool = False # 超過字數上限，尾部被截斷
+    timed_out: bool = False # 超過整體讀取期限，只取得部分內容
+    elapsed: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.status == 200
+
+class WebFetcher:
+    """
+    網頁抓取層 (read_webpage 的底層)：
+    - 共用 requests.Session + 連線池，Keep-Alive 重複使用到 Reader Proxy 的 TLS 連線
+    - 串流讀取回應，讀滿字數上限就停止，不必下載整個網頁
+    - 連線 / 讀取分開設定逾時，另有整體期限避免慢速伺服器一直吊著執行緒
+    - 每個主機一個 Semaphore 限制同時連線數，fetch_many 可平行抓取多個網址
+    """
+    CHUNK_BYTES = 16_384
+    DRAIN_BYTES = 65_536 # 讀滿上限後若只剩少量內容就讀完，讓連線回到連線池；剩太多則直接斷線
+
+    def __init__(self, reader_base_url: str, max_chars: int, connect_timeout: float, read_timeout: float,
+                 per_host_limit: int, pool_size: int):
+        self.reader_base_url = reader_base_url
+        self.max_chars = max_chars
+        self.timeout = (connect_timeout, read_timeout)
+        self.per_host_limit = per_host_limit
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._host_slots = {}
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="web-fetch")
+
+    @staticmethod
+    def _clean(url: str) -> str:
+        return url.strip().strip('"').strip("'")
+
+    def _slot(self, url: str) -> threading.BoundedSemaphore:
+        """依原始網址的主機取得 Semaphore (所有請求都經過同一個 Reader Proxy，不能以 Proxy 網址計算)"""
+        host = urlsplit(self._clean(url)).netloc
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._host_slots[host]
+
+    def target_url(self, url: str) -> str:
+        """透過 Reader Proxy 轉成純文字 (未設定 Proxy 時直接抓原網址)"""
+        clean_url = self._clean(url)
+        return f"{self.reader_base_url}{clean_url}" if self.reader_base_url else clean_url
+
+    def fetch(self, url: str, max_chars: Optional[int] = None, cancel_event: Optional[threading.Event] = None) -> FetchResult:
+        """cancel_event 被設定時中止讀取 (供背景預取取消使用)，此時 error 為 "cancelled"。"""
+        max_chars = max_chars or self.max_chars
+        target = self.target_url(url)
+        result = FetchResult(url=url)
+        started = time.perf_counter()
+        # 讀取逾時是「單次 socket 讀取」的上限，另設整體期限擋住一點一點吐資料的伺服器
+        deadline = time.monotonic() + sum(self.timeout)
+        try:
+            with self._slot(url):
+                if cancel_event is not None and cancel_event.is_set():
+                    result.error = "cancelled"
+                    return result
+                with self.session.get(target, stream=True, timeout=self.timeout) as response:
+                    result.status = response.status_code
+                    if response.status_code != 200:
+                        return result
+                    decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+                    parts, length, received = [], 0, 0
+                    chunks = response.iter_content(chunk_size=self.CHUNK_BYTES)
+                    for chunk in chunks:
+                        if cancel_event is not None and cancel_event.is_set():
+                            result.error = "cancelled"
+                            return result
+                        received += len(chunk)
+                        text = decoder.decode(chunk)
+                        parts.append(text)
+                        length += len(text)
+                        if length > max_chars:
+                            result.truncated = True
+                            break
+                        if time.monotonic() > deadline:
+                            result.timed_out = True
+                            break
+                    else:
+                        parts.append(decoder.decode(b"", final=True))
+                    result.text = "".join(parts)[:max_chars]
+                    remaining = int(response.headers.get("Content-Length") or 0) - received
+                    if (result.truncated or result.timed_out) and 0 < remaining <= self.DRAIN_BYTES:
+                        for _ in chunks: pass
+        except Exception as e:
+            result.error = str(e)
+        finally:
+            result.elapsed = time.perf_counter() - started
+        return result
+
+    def fetch_many(self, urls: list, max_chars: Optional[int] = None) -> list:
+        """平行抓取多個網址 (同一主機的同時連線數仍受 per_host_limit 限制)，結果順序與輸入一致"""
+        futures = [self._executor.submit(self.fetch, url, max_chars) for url in urls]
+        return [f.result() for f in futures]
+
+# 全行程共用的抓取器 (連線池跨 Session 共用)
+web_fetcher = WebFetcher(
+    reader_base_url=Config.WEB_READER_BASE_URL,
+    max_chars=Config.WEB_FETCH_MAX_CHARS,
+    connect_timeout=Config.WEB_FETCH_CONNECT_TIMEOUT,
+    read_timeout=Config.WEB_FETCH_READ_TIMEOUT,
+    per_host_limit=Config.WEB_FETCH_PER_HOST_LIMIT,
+    pool_size=Config.WEB_FETCH_POOL_SIZE
+)
@@ -0,0 +1,92 @@
+# src/utils/cache.py
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# 不影響網頁內容的追蹤參數，正規化網址時移除
+_TRACKING_PARAMS = {"fbclid", "gclid", "yclid", "mc_cid", "mc_eid", "ref", "ref_src"}
+
+def normalize_query(query_str: str) -> str:
+    """查詢正規化 (全半形統一、小寫、壓縮空白、去除首尾標點)，讓近似的問題共用同一個快取 Key"""
+    text = unicodedata.normalize("NFKC", query_str or "").lower()
+    text = re.sub(r"\s+", " ", text)
+    return text.strip(" \t\n?？!！。.,，、;；:：\"'「」")
+
+def canonical_url(url: str) -> str:
+    """網址正規化 (小寫主機、去除預設 Port / 片段 / 追蹤參數、參數排序)，讓同一網頁共用同一個快取 Key"""
+    url = (url or "").strip().strip('"').strip("'")
+    parts = urlsplit(url if "://" in url else f"https://{url}")
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    params = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                    if not k.lower().startswith("utm_") and k.lower() not in _TRACKING_PARAMS)
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme, host, path, urlencode(params), ""))
+
+class TTLCache:
+    """
+    執行緒安全的記憶體快取：容量上限 (LRU 淘汰) + 存活時間 (TTL)，並統計命中率。
+    """
+    def __init__(self, max_size: int = 256, ttl_seconds: float = 300):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict() # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires_at = item
+            if time.monotonic() >= expires_at:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl_seconds: float = None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return item[0] if item else default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
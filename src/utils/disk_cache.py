@@ -0,0 +1,159 @@
+# src/utils/disk_cache.py
+import os
+import json
+import time
+import sqlite3
+import threading
+import concurrent.futures
+from src.utils.tracing import record
+
+class DiskCache:
+    """
+    跨行程重啟保留的工具結果快取 (SQLite)，依 namespace 區分不同工具。
+    - fresh_until 之前：直接回傳 (命中)
+    - fresh_until ~ stale_until：先回傳舊值，並在背景重新抓取 (Stale-While-Revalidate)
+    - 超過 stale_until 或不存在：同步抓取 (未命中)
+    筆數超過上限時依最後存取時間做 LRU 淘汰。
+    """
+    EVICT_EVERY = 64 # 每寫入 N 筆才檢查一次容量，避免每次都 COUNT(*)
+
+    def __init__(self, db_path: str, max_entries: int = 5000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes = 0
+        self._refreshing = set()
+        self._refresh_pool = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+        self._stats = {}
+
+    def _get_conn(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    fresh_until REAL NOT NULL,
+                    stale_until REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries(last_access)")
+            self._conn = conn
+        return self._conn
+
+    def _count(self, namespace: str, field: str):
+        stats = self._stats.setdefault(namespace, {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0})
+        stats[field] += 1
+
+    def get(self, namespace: str, key: str):
+        """回傳 (value, is_fresh)；不存在或已超過 stale 期限時回傳 None"""
+        now = time.time()
+        with self._lock:
+            conn = self._get_conn()
+            row = conn.execute(
+                "SELECT value, fresh_until, stale_until FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            if row is None or now >= row[2]:
+                return None
+            conn.execute("UPDATE entries SET last_access = ? WHERE namespace = ? AND key = ?", (now, namespace, key))
+            conn.commit()
+        return json.loads(row[0]), now < row[1]
+
+    def set(self, namespace: str, key: str, value, ttl_seconds: float, stale_seconds: float = 0):
+        now = time.time()
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, fresh_until, stale_until, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (namespace, key, json.dumps(value, ensure_ascii=False), now + ttl_seconds, now + ttl_seconds + stale_seconds, now)
+            )
+            self._writes += 1
+            if self._writes % self.EVICT_EVERY == 0:
+                self._evict(conn, now)
+            conn.commit()
+
+    def _evict(self, conn, now: float):
+        conn.execute("DELETE FROM entries WHERE stale_until <= ?", (now,))
+        (count,) = conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries ORDER BY last_access ASC LIMIT ?)",
+                (overflow,)
+            )
+
+    def get_or_fetch(self, namespace: str, key: str, fetch_fn, ttl_seconds: float, stale_seconds: float = 0,
+                     should_cache=lambda value: True):
+        """
+        讀取快取，必要時呼叫 fetch_fn() 取得新值。
+        fetch_fn 的回傳值必須可 JSON 序列化；should_cache 回傳 False 的結果 (例如錯誤訊息) 不寫入快取。
+        """
+        cached = self.get(namespace, key)
+        if cached is not None:
+            value, is_fresh = cached
+            with self._lock:
+                self._count(namespace, "hits" if is_fresh else "stale_hits")
+            record(cache_hits=1)
+            if not is_fresh:
+                self._schedule_refresh(namespace, key, fetch_fn, ttl_seconds, stale_seconds, should_cache)
+            return value
+
+        with self._lock:
+            self._count(namespace, "misses")
+        record(cache_misses=1)
+        value = fetch_fn()
+        if should_cache(value):
+            self.set(namespace, key, value, ttl_seconds, stale_seconds)
+        return value
+
+    def _schedule_refresh(self, namespace, key, fetch_fn, ttl_seconds, stale_seconds, should_cache):
+        with self._lock:
+            # 同一個 Key 同時只會有一個背景更新
+            if (namespace, key) in self._refreshing: return
+            self._refreshing.add((namespace, key))
+
+        def refresh():
+            try:
+                value = fetch_fn()
+                if should_cache(value):
+                    self.set(namespace, key, value, ttl_seconds, stale_seconds)
+                with self._lock:
+                    self._count(namespace, "refreshes")
+            except Exception as e:
+                # 更新失敗就繼續使用舊值，等下一次存取再試
+                print(f"⚠️ 快取背景更新失敗 ({namespace}): {e}")
+                with self._lock:
+                    self._count(namespace, "refresh_errors")
+            finally:
+                with self._lock:
+                    self._refreshing.discard((namespace, key))
+
+        self._refresh_pool.submit(refresh)
+
+    def invalidate(self, namespace: str, key: str = None):
+        with self._lock:
+            conn = self._get_conn()
+            if key is None:
+                conn.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+            else:
+                conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+            conn.commit()
+
+    def stats(self) -> dict:
+        """各 namespace 的命中統計與目前筆數"""
+        with self._lock:
+            rows = self._get_conn().execute("SELECT namespace, COUNT(*) FROM entries GROUP BY namespace").fetchall()
+            result = {ns: dict(counts) for ns, counts in self._stats.items()}
+        for namespace, entries in rows:
+            result.setdefault(namespace, {})["entries"] = entries
+        for counts in result.values():
+            served = counts.get("hits", 0) + counts.get("stale_hits", 0)
+            total = served + counts.get("misses", 0)
+            counts["hit_rate"] = served / total if total else 0.0
+        return result
@@ -0,0 +1,120 @@
+# src/utils/llm_cache.py
+import os
+import json
+import hashlib
+import threading
+from langchain_core.messages import BaseMessage, AIMessage, ToolMessage, message_to_dict, messages_from_dict
+from src.config import Config
+from src.utils.disk_cache import DiskCache
+from src.utils.tracing import span
+
+NAMESPACE = "llm"
+
+def _message_fingerprint(message) -> dict:
+    """只取影響模型輸出的欄位；tool_call id、usage 等每次呼叫都不同的欄位不列入 Key"""
+    entry = {"type": message.type, "content": message.content}
+    if isinstance(message, AIMessage) and message.tool_calls:
+        entry["tool_calls"] = [(tc["name"], tc["args"]) for tc in message.tool_calls]
+    if isinstance(message, ToolMessage):
+        entry["name"] = message.name
+    return entry
+
+def _tool_fingerprint(tool) -> dict:
+    from langchain_core.utils.function_calling import convert_to_openai_tool
+    return convert_to_openai_tool(tool)
+
+def make_key(llm, messages: list, schema=None, tools=None) -> str:
+    """依模型、溫度、訊息內容、輸出格式 (schema) 與綁定的工具計算快取 Key"""
+    payload = {
+        "model": getattr(llm, "model", type(llm).__name__),
+        "temperature": getattr(llm, "temperature", None),
+        "messages": [_message_fingerprint(m) for m in messages],
+        "schema": schema.model_json_schema() if schema is not None else None,
+        "tools": [_tool_fingerprint(t) for t in tools] if tools else None,
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _encode(result):
+    if isinstance(result, BaseMessage):
+        return {"kind": "message", "data": message_to_dict(result)}
+    if hasattr(result, "model_dump"):
+        return {"kind": "structured", "data": result.model_dump()}
+    return None # None (結構化輸出解析失敗) 等結果不寫入快取
+
+def _decode(value: dict, schema):
+    if value["kind"] == "message":
+        return messages_from_dict([value["data"]])[0]
+    return schema.model_validate(value["data"])
+
+class LLMResponseCache:
+    """
+    LLM 回應的持久化快取 (SQLite，沿用 DiskCache)。
+    相同模型、溫度、訊息、輸出格式與工具的呼叫直接回傳上次的結果，不經過配額排程器；
+    超過 ttl_seconds 的結果視為過期，筆數超過上限時依最後存取時間淘汰。
+    bypass=True 時不讀取快取、一定重新呼叫模型，但仍會以新結果覆寫快取。
+    """
+    def __init__(self, disk_cache: DiskCache, ttl_seconds: float, enabled: bool):
+        self.disk_cache = disk_cache
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "bypassed": 0}
+
+    def _count(self, field: str):
+        with self._lock:
+            self._stats[field] += 1
+
+    def invoke(self, llm, messages: list, call_fn, schema=None, tools=None, bypass: bool = False):
+        """
+        call_fn(runnable, messages) 負責實際呼叫 (配額排程、重試)；runnable 依 schema / tools 由 llm 組成，
+        命中快取時完全不會建立。
+        """
+        def call():
+            runnable = llm.with_structured_output(schema) if schema is not None else llm.bind_tools(tools) if tools else llm
+            return call_fn(runnable, messages)
+
+        label = schema.__name__ if schema is not None else "tools" if tools else "chat"
+        with span(f"llm.{label}", "llm", model=getattr(llm, "model", type(llm).__name__)) as current:
+            if not self.enabled: return call()
+            key = make_key(llm, messages, schema, tools)
+            if bypass:
+                self._count("bypassed")
+                current.set(cache="bypass")
+            else:
+                cached = self.disk_cache.get(NAMESPACE, key)
+                if cached is not None:
+                    try:
+                        result = _decode(cached[0], schema)
+                        self._count("hits")
+                        current.add(cache_hits=1)
+                        return result
+                    except Exception as e:
+                        # schema 改版後舊的結果可能無法解析，視同未命中
+                        print(f"⚠️ LLM 快取內容無法解析，重新呼叫模型：{e}")
+                self._count("misses")
+                current.add(cache_misses=1)
+
+            result = call()
+            encoded = _encode(result)
+            if encoded is not None:
+                self.disk_cache.set(NAMESPACE, key, encoded, self.ttl_seconds)
+            return result
+
+    def clear(self):
+        self.disk_cache.invalidate(NAMESPACE)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        served = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / served if served else 0.0
+        return stats
+
+# 與工具快取分開存放，LLM 回應的淘汰不會擠掉搜尋結果
+LLM_CACHE_PATH = os.path.join(os.getcwd(), "chroma_db", "llm_cache.sqlite3")
+llm_cache = LLMResponseCache(
+    DiskCache(LLM_CACHE_PATH, max_entries=Config.LLM_CACHE_MAX_ENTRIES),
+    ttl_seconds=Config.LLM_CACHE_TTL,
+    enabled=Config.LLM_CACHE_ENABLED
+)
@@ -0,0 +1,16 @@
+# src/utils/logger.py
+import logging
+from src.config import Config
+
+_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+def get_logger(name: str) -> logging.Logger:
+    """專案共用的 Logger (smart_deck.*)，第一次取用時設定輸出格式與等級 (Config.LOG_LEVEL)"""
+    root = logging.getLogger("smart_deck")
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(Config.LOG_LEVEL.upper())
+        root.propagate = False
+    return root.getChild(name)
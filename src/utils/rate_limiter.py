@@ -0,0 +1,226 @@
+# src/utils/rate_limiter.py
+import time
+import heapq
+import itertools
+import threading
+from collections import deque
+from langchain_core.embeddings import Embeddings
+from src.config import Config
+from src.utils.tokens import estimate_tokens, estimate_message_tokens
+from src.utils.tracing import record, annotate
+
+# 優先順序 (數字越小越優先)：使用者正在等的對話 > 大綱規劃 > 背景匯入
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PLANNING = 1
+PRIORITY_BACKGROUND = 2
+
+class QuotaExceededError(Exception):
+    """重試次數用盡仍收到 429"""
+
+def is_rate_limit_error(error: Exception) -> bool:
+    try:
+        from google.api_core.exceptions import ResourceExhausted
+        if isinstance(error, ResourceExhausted): return True
+    except ImportError:
+        pass
+    message = str(error)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message or "ResourceExhausted" in message
+
+class _TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float, slowdown: float):
+        rate = self.capacity / 60 / slowdown
+        self.level = min(self.capacity, self.level + (now - self.updated) * rate)
+        self.updated = now
+
+    def seconds_until(self, amount: float, slowdown: float) -> float:
+        missing = min(amount, self.capacity) - self.level
+        return 0.0 if missing <= 0 else missing / (self.capacity / 60 / slowdown)
+
+class _ModelQuota:
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = _TokenBucket(rpm)
+        self.tokens = _TokenBucket(tpm)
+        self.cond = threading.Condition()
+        self.waiters = []           # heap: (priority, seq)
+        self.slowdown = 1.0         # 收到 429 時放大，成功後逐步恢復
+        self.blocked_until = 0.0
+        self.waits_ms = deque(maxlen=1000)
+        self.counts = {"calls": 0, "throttled": 0, "failed": 0}
+
+class QuotaScheduler:
+    """
+    全行程共用的 Gemini 呼叫排程器。
+    每個模型一組 Token Bucket (RPM + TPM，設定於 Config.MODEL_QUOTAS)，呼叫前先取得額度；
+    額度不足時依優先順序排隊，收到 429 時自動降速並暫停一段時間，再由排程器統一重試，避免各處各自重試造成風暴。
+    未設定配額的模型直接放行 (例如離線的 Hash Embedding)。
+    """
+    def __init__(self, quotas: dict, max_retries: int = 3):
+        self.max_retries = max_retries
+        self._models = {name: _ModelQuota(q["rpm"], q["tpm"]) for name, q in quotas.items()}
+        self._seq = itertools.count()
+
+    def acquire(self, model: str, tokens: int = 0, requests: int = 1, priority: int = PRIORITY_INTERACTIVE) -> float:
+        """阻塞直到取得額度，回傳排隊秒數"""
+        quota = self._models.get(model)
+        if quota is None: return 0.0
+        started = time.monotonic()
+        entry = (priority, next(self._seq))
+        with quota.cond:
+            heapq.heappush(quota.waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    quota.requests.refill(now, quota.slowdown)
+                    quota.tokens.refill(now, quota.slowdown)
+                    if quota.waiters[0] == entry:
+                        wait = max(
+                            quota.blocked_until - now,
+                            quota.requests.seconds_until(requests, quota.slowdown),
+                            quota.tokens.seconds_until(tokens, quota.slowdown),
+                        )
+                        if wait <= 0:
+                            quota.requests.level -= min(requests, quota.requests.capacity)
+                            quota.tokens.level -= min(tokens, quota.tokens.capacity)
+                            break
+                    else:
+                        wait = None # 等前面的人拿到額度後被喚醒
+                    quota.cond.wait(timeout=wait)
+            finally:
+                quota.waiters.remove(entry)
+                heapq.heapify(quota.waiters)
+                quota.cond.notify_all()
+            waited = time.monotonic() - started
+            quota.waits_ms.append(waited * 1000)
+            quota.counts["calls"] += 1
+        return waited
+
+    def report_usage(self, model: str, estimated_tokens: int, actual_tokens: int):
+        """以實際用量 (usage_metadata) 修正預估，差額記為欠款，由後續呼叫償還"""
+        quota = self._models.get(model)
+        if quota is None or not actual_tokens: return
+        with quota.cond:
+            quota.tokens.level -= actual_tokens - estimated_tokens
+
+    def report_throttled(self, model: str):
+        quota = self._models.get(model)
+        if quota is None: return
+        with quota.cond:
+            quota.counts["throttled"] += 1
+            quota.slowdown = min(quota.slowdown * 2, 8.0)
+            quota.requests.level = min(quota.requests.level, 0)
+            quota.blocked_until = max(quota.blocked_until, time.monotonic() + min(2.5 * quota.slowdown, 60))
+            quota.cond.notify_all()
+
+    def report_success(self, model: str):
+        quota = self._models.get(model)
+        if quota is None or quota.slowdown == 1.0: return
+        with quota.cond:
+            quota.slowdown = max(1.0, quota.slowdown * 0.9)
+
+    def call(self, model: str, fn, estimated_tokens: int = 0, requests: int = 1, priority: int = PRIORITY_INTERACTIVE):
+        """取得額度後執行 fn()；遇到 429 時回報降速並重新排隊，最多重試 max_retries 次"""
+        for attempt in range(self.max_retries + 1):
+            waited = self.acquire(model, estimated_tokens, requests, priority)
+            record(queue_wait_ms=round(waited * 1000))
+            try:
+                result = fn()
+            except Exception as e:
+                if not is_rate_limit_error(e): raise
+                self.report_throttled(model)
+                record(retries=1)
+                if attempt == self.max_retries:
+                    self._count(model, "failed")
+                    raise QuotaExceededError(f"{model} 配額不足，重試 {self.max_retries} 次仍失敗：{e}") from e
+                continue
+            self.report_success(model)
+            usage = getattr(result, "usage_metadata", None) or {}
+            self.report_usage(model, estimated_tokens, usage.get("total_tokens", 0))
+            return result
+
+    def _count(self, model: str, field: str):
+        quota = self._models.get(model)
+        if quota is None: return
+        with quota.cond:
+            quota.counts[field] += 1
+
+    def invoke(self, model: str, runnable, messages, priority: int = PRIORITY_INTERACTIVE):
+        """LLM 呼叫的捷徑：依訊息長度估計 Token 後排程 runnable.invoke(messages)"""
+        estimated_tokens = estimate_message_tokens(messages)
+        result = self.call(model, lambda: runnable.invoke(messages), estimated_tokens, priority=priority)
+        usage = getattr(result, "usage_metadata", None)
+        if usage:
+            record(input_tokens=usage.get("input_tokens", 0), output_tokens=usage.get("output_tokens", 0))
+        else:
+            # 結構化輸出只回傳解析後的物件，沒有 usage_metadata：以字數估計
+            output = result.model_dump_json() if hasattr(result, "model_dump_json") else str(result or "")
+            record(input_tokens=estimated_tokens, output_tokens=estimate_tokens(output))
+            annotate(tokens_estimated=True)
+        return result
+
+    def stream(self, model: str, runnable, messages, priority: int = PRIORITY_INTERACTIVE):
+        """串流版的 invoke：逐一產出 chunk。只有在第一個 chunk 之前收到 429 才會重試 (已輸出的內容無法收回)"""
+        estimated_tokens = estimate_message_tokens(messages)
+        for attempt in range(self.max_retries + 1):
+            waited = self.acquire(model, estimated_tokens, priority=priority)
+            record(queue_wait_ms=round(waited * 1000))
+            started, usage = False, {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+            try:
+                for chunk in runnable.stream(messages):
+                    started = True
+                    # Gemini 串流時每個 chunk 的 usage_metadata 是增量，需累加
+                    for key, value in (getattr(chunk, "usage_metadata", None) or {}).items():
+                        if key in usage: usage[key] += value
+                    yield chunk
+            except Exception as e:
+                if started or not is_rate_limit_error(e): raise
+                self.report_throttled(model)
+                record(retries=1)
+                if attempt == self.max_retries:
+                    self._count(model, "failed")
+                    raise QuotaExceededError(f"{model} 配額不足，重試 {self.max_retries} 次仍失敗：{e}") from e
+                continue
+            self.report_success(model)
+            self.report_usage(model, estimated_tokens, usage["total_tokens"])
+            record(input_tokens=usage["input_tokens"], output_tokens=usage["output_tokens"])
+            return
+
+    def stats(self) -> dict:
+        result = {}
+        for name, quota in self._models.items():
+            with quota.cond:
+                waits = sorted(quota.waits_ms)
+                result[name] = {
+                    **quota.counts,
+                    "queued": len(quota.waiters),
+                    "slowdown": round(quota.slowdown, 2),
+                    "wait_p50_ms": round(waits[len(waits) // 2], 1) if waits else 0.0,
+                    "wait_p95_ms": round(waits[int(len(waits) * 0.95)], 1) if waits else 0.0,
+                    "wait_max_ms": round(waits[-1], 1) if waits else 0.0,
+                }
+        return result
+
+class RateLimitedEmbeddings(Embeddings):
+    """
+    讓 Embedding 呼叫也經過排程器：文件 Embedding (匯入) 屬背景工作，查詢 Embedding 屬互動工作。
+    """
+    def __init__(self, inner: Embeddings, model_name: str, scheduler: QuotaScheduler):
+        self.inner = inner
+        self.model_name = model_name
+        self.scheduler = scheduler
+
+    def embed_documents(self, texts: list, **kwargs) -> list:
+        # task_type=RETRIEVAL_QUERY 代表批次查詢 (見 CachedEmbeddings.embed_queries)，使用者正在等
+        priority = PRIORITY_INTERACTIVE if kwargs.get("task_type") == "RETRIEVAL_QUERY" else PRIORITY_BACKGROUND
+        tokens = sum(estimate_tokens(t) for t in texts)
+        return self.scheduler.call(self.model_name, lambda: self.inner.embed_documents(texts, **kwargs), tokens, priority=priority)
+
+    def embed_query(self, text: str) -> list:
+        return self.scheduler.call(self.model_name, lambda: self.inner.embed_query(text), estimate_tokens(text))
+
+# 全行程共用的排程器
+quota_scheduler = QuotaScheduler(Config.MODEL_QUOTAS, max_retries=Config.QUOTA_MAX_RETRIES)
@@ -0,0 +1,19 @@
+# src/utils/tokens.py
+import re
+
+_CJK_RE = re.compile("[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]")
+
+def estimate_tokens(text: str) -> int:
+    """粗估 Token 數：CJK 約 1 字 1 token，其餘約 4 字元 1 token"""
+    if not text: return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def estimate_message_tokens(messages) -> int:
+    """估計一次 LLM 呼叫的輸入 Token 數 (messages 可為字串或 LangChain Message 列表)"""
+    if isinstance(messages, str): return estimate_tokens(messages)
+    total = 0
+    for m in messages:
+        content = getattr(m, "content", m)
+        total += estimate_tokens(content if isinstance(content, str) else str(content)) + 4 # 每則訊息的角色標記開銷
+    return total
@@ -0,0 +1,306 @@
+# src/utils/tracing.py
+"""
+輕量 Tracing：每次「規劃大綱 / 排版」是一個 Trace，其中的 Graph 節點、LLM 呼叫、工具呼叫、RAG 檢索與 PPT 渲染
+各是一個巢狀 Span，記錄耗時、輸入/輸出 Token、重試次數與快取命中。
+
+- 目前所在的 Span 存在 contextvars：LangGraph 的節點執行緒與 asyncio Task 會自動繼承，
+  自己開的 ThreadPoolExecutor 則需以 bind_context() 包裝要執行的函式
+- 不在任何 Trace 之內 (例如一般對話、背景匯入) 時，span() / record() 都是空操作
+- 完成的 Trace 保留在記憶體 (前端瀑布圖)、可匯出 JSONL (Config.TRACE_EXPORT_PATH)，
+  並彙總成 Prometheus 指標 (Config.METRICS_PORT 的 /metrics)
+"""
+import os
+import json
+import time
+import uuid
+import functools
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.config import Config
+from src.utils.logger import get_logger
+
+logger = get_logger("tracing")
+
+# 可累加的計數欄位 (同一個 Span 內多次 record 會相加)
+COUNTERS = ("input_tokens", "output_tokens", "retries", "cache_hits", "cache_misses", "queue_wait_ms")
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_current_span = contextvars.ContextVar("smart_deck_span", default=None)
+
+class Span:
+    def __init__(self, trace, name: str, kind: str, parent_id, attrs: dict):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attrs = dict(attrs)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.thread = threading.current_thread().name
+        self.start = time.perf_counter()
+        self.end = None
+        self.error = None
+
+    def set(self, **attrs):
+        with self.trace.lock:
+            self.attrs.update(attrs)
+
+    def add(self, **amounts):
+        with self.trace.lock:
+            for key, amount in amounts.items():
+                self.counters[key] = self.counters.get(key, 0) + amount
+
+    @property
+    def duration(self) -> float:
+        # Trace 結束時仍未完成的 Span (例如逾時後仍在背景執行的工具) 以 Trace 的結束時間計
+        end = self.end if self.end is not None else self.trace.end or time.perf_counter()
+        return end - self.start
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ms": round((self.start - self.trace.start) * 1000, 1),
+            "duration_ms": round(self.duration * 1000, 1),
+            "thread": self.thread,
+            "error": self.error,
+            "unfinished": self.end is None,
+            **self.counters,
+            "attrs": self.attrs,
+        }
+
+class _NoopSpan:
+    """不在 Trace 之內時回傳的替身，呼叫端不必判斷"""
+    def set(self, **attrs): pass
+    def add(self, **amounts): pass
+
+_NOOP_SPAN = _NoopSpan()
+
+class Trace:
+    def __init__(self, name: str, attrs: dict):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.end = None
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def _add_span(self, span: Span):
+        with self.lock:
+            if self.end is None: self.spans.append(span)
+
+    def totals(self) -> dict:
+        with self.lock:
+            spans = list(self.spans)
+        totals = dict.fromkeys(COUNTERS, 0)
+        for span in spans:
+            for key in COUNTERS: totals[key] += span.counters.get(key, 0)
+        totals["llm_calls"] = sum(1 for span in spans if span.kind == "llm")
+        totals["duration_ms"] = round(spans[0].duration * 1000, 1) if spans else 0.0
+        return totals
+
+    def span_dicts(self) -> list:
+        with self.lock:
+            spans = list(self.spans)
+        return [span.to_dict() for span in spans]
+
+    def to_jsonl(self) -> str:
+        """一行一個 Span (含 trace_id 與 Trace 名稱)，方便以 jq / pandas 分析"""
+        header = {"trace": self.name, "started_at": self.started_at, **{f"trace_{k}": v for k, v in self.attrs.items()}}
+        return "".join(json.dumps({**header, **span}, ensure_ascii=False, default=str) + "\n" for span in self.span_dicts())
+
+def _finish_span(span: Span, token):
+    span.end = time.perf_counter()
+    _current_span.reset(token)
+
+@contextmanager
+def span(name: str, kind: str = "step", **attrs):
+    """在目前的 Span 底下開一個子 Span；不在 Trace 之內時為空操作"""
+    parent = _current_span.get()
+    if parent is None or parent.trace.end is not None:
+        yield _NOOP_SPAN
+        return
+    current = Span(parent.trace, name, kind, parent.span_id, attrs)
+    parent.trace._add_span(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.error = f"{type(e).__name__}: {e}"[:300]
+        raise
+    finally:
+        _finish_span(current, token)
+
+@contextmanager
+def trace(name: str, **attrs):
+    """開始一個新的 Trace (最外層 Span)；結束時交給 tracer 保存與匯出。關閉 Tracing 時回傳 None"""
+    if not Config.TRACING_ENABLED:
+        yield None
+        return
+    run = Trace(name, attrs)
+    root = Span(run, name, "run", None, attrs)
+    run._add_span(root)
+    token = _current_span.set(root)
+    try:
+        yield run
+    except Exception as e:
+        root.error = f"{type(e).__name__}: {e}"[:300]
+        raise
+    finally:
+        _finish_span(root, token)
+        with run.lock:
+            run.end = root.end
+        tracer.finish(run)
+
+def current_span():
+    current = _current_span.get()
+    return current if current is not None and current.trace.end is None else _NOOP_SPAN
+
+def record(**amounts):
+    """累加目前 Span 的計數 (Token、重試、快取命中...)"""
+    current_span().add(**amounts)
+
+def annotate(**attrs):
+    """設定目前 Span 的描述性欄位"""
+    current_span().set(**attrs)
+
+def traced(name: str, kind: str = "node"):
+    """把整個函式包成一個 Span (Graph 節點用)；保留原函式簽章，LangGraph 仍能注入 writer 等參數"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, kind):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def bind_context(fn):
+    """把目前的 Span 帶進其他執行緒 (ThreadPoolExecutor.submit / run_in_executor 不會自動複製 contextvars)"""
+    return functools.partial(contextvars.copy_context().run, fn)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+class Tracer:
+    """保存完成的 Trace：最近幾次留在記憶體、可匯出 JSONL，並彙總成 Prometheus 指標"""
+    def __init__(self, export_path: str, recent_runs: int):
+        self.export_path = export_path
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=recent_runs)
+        self._runs = {}        # trace 名稱 -> 次數
+        self._durations = {}   # (kind, name) -> {"buckets": [...], "sum": 秒數, "count": 次數}
+        self._counters = {}    # (欄位, kind, name) -> 累計值
+        self._errors = {}      # (kind, name) -> 次數
+
+    def finish(self, run: Trace):
+        with self._lock:
+            self._recent.append(run)
+            self._runs[run.name] = self._runs.get(run.name, 0) + 1
+            for current in list(run.spans):
+                self._observe(current)
+        totals = run.totals()
+        logger.info(
+            f"{run.name} 完成：{totals['duration_ms'] / 1000:.2f}s，LLM {totals['llm_calls']} 次 "
+            f"(in {totals['input_tokens']} / out {totals['output_tokens']} tokens)，重試 {totals['retries']} 次，快取命中 {totals['cache_hits']} 次"
+        )
+        if self.export_path:
+            try:
+                if os.path.dirname(self.export_path): os.makedirs(os.path.dirname(self.export_path), exist_ok=True)
+                with self._lock, open(self.export_path, "a", encoding="utf-8") as f:
+                    f.write(run.to_jsonl())
+            except OSError as e:
+                logger.warning(f"Trace 匯出失敗：{e}")
+
+    def _observe(self, current: Span):
+        key = (current.kind, current.name)
+        seconds = current.duration
+        hist = self._durations.setdefault(key, {"buckets": [0] * len(DURATION_BUCKETS), "sum": 0.0, "count": 0})
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound: hist["buckets"][i] += 1
+        hist["sum"] += seconds
+        hist["count"] += 1
+        for field in COUNTERS:
+            value = current.counters.get(field, 0)
+            if value: self._counters[(field, *key)] = self._counters.get((field, *key), 0) + value
+        if current.error: self._errors[key] = self._errors.get(key, 0) + 1
+
+    def recent(self) -> list:
+        with self._lock:
+            return list(self._recent)
+
+    def prometheus_text(self) -> str:
+        """Prometheus text exposition format (0.0.4)"""
+        with self._lock:
+            runs, durations = dict(self._runs), {k: dict(v, buckets=list(v["buckets"])) for k, v in self._durations.items()}
+            counters, errors = dict(self._counters), dict(self._errors)
+        lines = ["# HELP smart_deck_traces_total Finished traces (deck generation runs).", "# TYPE smart_deck_traces_total counter"]
+        lines += [f"smart_deck_traces_total{_labels(name=name)} {count}" for name, count in sorted(runs.items())]
+
+        lines += ["# HELP smart_deck_span_duration_seconds Span wall time.", "# TYPE smart_deck_span_duration_seconds histogram"]
+        for (kind, name), hist in sorted(durations.items()):
+            for bound, count in zip(DURATION_BUCKETS, hist["buckets"]):
+                lines.append(f"smart_deck_span_duration_seconds_bucket{_labels(kind=kind, name=name, le=bound)} {count}")
+            lines.append(f"smart_deck_span_duration_seconds_bucket{_labels(kind=kind, name=name, le='+Inf')} {hist['count']}")
+            lines.append(f"smart_deck_span_duration_seconds_sum{_labels(kind=kind, name=name)} {hist['sum']:.6f}")
+            lines.append(f"smart_deck_span_duration_seconds_count{_labels(kind=kind, name=name)} {hist['count']}")
+
+        lines += ["# HELP smart_deck_span_errors_total Spans that raised an exception.", "# TYPE smart_deck_span_errors_total counter"]
+        lines += [f"smart_deck_span_errors_total{_labels(kind=kind, name=name)} {count}" for (kind, name), count in sorted(errors.items())]
+
+        metrics = {
+            "input_tokens": ("smart_deck_llm_tokens_total", "LLM tokens (estimated for structured output).", {"direction": "input"}),
+            "output_tokens": ("smart_deck_llm_tokens_total", None, {"direction": "output"}),
+            "retries": ("smart_deck_retries_total", "Retries (tenacity and 429 backoff).", {}),
+            "cache_hits": ("smart_deck_cache_lookups_total", "LLM / tool / RAG cache lookups.", {"result": "hit"}),
+            "cache_misses": ("smart_deck_cache_lookups_total", None, {"result": "miss"}),
+            "queue_wait_ms": ("smart_deck_quota_wait_milliseconds_total", "Time spent queuing for Gemini quota.", {}),
+        }
+        for field in COUNTERS:
+            metric, help_text, extra = metrics[field]
+            if help_text: lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            lines += [
+                f"{metric}{_labels(kind=kind, name=name, **extra)} {value}"
+                for (counter_field, kind, name), value in sorted(counters.items()) if counter_field == field
+            ]
+        return "\n".join(lines) + "\n"
+
+tracer = Tracer(Config.TRACE_EXPORT_PATH, Config.TRACE_RECENT_RUNS)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = tracer.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # 不輸出每次抓取的存取紀錄
+
+_metrics_server = None
+_metrics_lock = threading.Lock()
+
+def start_metrics_server(port: int):
+    """在背景執行緒提供 Prometheus /metrics (全行程只啟動一次)"""
+    global _metrics_server
+    with _metrics_lock:
+        if _metrics_server is None:
+            _metrics_server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            threading.Thread(target=_metrics_server.serve_forever, name="metrics-server", daemon=True).start()
+            print(f"📈 Prometheus 指標：http://0.0.0.0:{port}/metrics")
+        return _metrics_server
@@ -0,0 +1,101 @@
+# src/warmup.py
+"""
+啟動預熱 (Warm-up)。
+
+容器啟動時先以 `python -m src.warmup` 執行一次：編譯 src/ 的 bytecode、建立 chroma_db 與各個 SQLite 快取的資料表，
+並載入重量級套件 (讓 OS 檔案快取先熱起來)，最後輸出啟動耗時報告 (chroma_db/startup_report.json)。
+Streamlit 行程內則由 app.py 在第一次 rerun 時以背景執行緒呼叫 start_background_warmup()，
+使用者看到畫面的同時把 Gemini Client、Search Client 建好，第一則訊息不必再等。
+"""
+import os
+import sys
+import json
+import time
+import importlib
+import threading
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+def _compile_sources():
+    import compileall
+    compileall.compile_dir(os.path.join(PROJECT_ROOT, "src"), quiet=1)
+
+def _import_graph():
+    # 只為了載入 LangGraph、LangChain Core 並建好 Graph；以 import_module 明確表示需要的是匯入的副作用
+    importlib.import_module("src.graph")
+
+def _chroma_client():
+    from src.tools.rag import get_chroma_client
+    get_chroma_client().heartbeat()
+
+def _embeddings():
+    from src.tools.rag import get_embeddings
+    get_embeddings()
+
+def _manager_llm():
+    from src.agents.manager import get_llm
+    get_llm()
+
+def _search_client():
+    from src.config import Config
+    if not (Config.GOOGLE_SEARCH_API_KEY and Config.GOOGLE_CSE_ID): return # 未設定搜尋金鑰時略過
+    from src.tools.search import get_search_wrapper
+    get_search_wrapper()
+
+def _tool_cache():
+    from src.tools.search import tool_cache
+    tool_cache.stats()
+
+# (名稱, 函式)；依序執行，單一步驟失敗不影響其他步驟
+WARMUP_STEPS = [
+    ("import_graph", _import_graph),
+    ("chroma_client", _chroma_client),
+    ("embeddings", _embeddings),
+    ("manager_llm", _manager_llm),
+    ("search_client", _search_client),
+    ("tool_cache", _tool_cache),
+]
+
+def run_warmup(steps=None, verbose: bool = True) -> dict:
+    """依序執行預熱步驟，回傳 {"steps": {名稱: 秒數}, "errors": {名稱: 錯誤}, "total_seconds": 秒數}"""
+    report = {"steps": {}, "errors": {}}
+    started = time.perf_counter()
+    for name, fn in steps or WARMUP_STEPS:
+        step_started = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            report["errors"][name] = str(e)
+            if verbose: print(f"⚠️ 預熱步驟 {name} 失敗：{e}")
+        report["steps"][name] = round(time.perf_counter() - step_started, 3)
+    report["total_seconds"] = round(time.perf_counter() - started, 3)
+    if verbose: print(f"🔥 預熱完成 ({report['total_seconds']:.2f}s)：{report['steps']}")
+    return report
+
+class WarmupThread(threading.Thread):
+    """背景預熱執行緒，完成後 report 為 run_warmup 的結果"""
+    def __init__(self, steps=None):
+        super().__init__(name="warmup", daemon=True)
+        self.steps = steps
+        self.report = None
+
+    def run(self):
+        self.report = run_warmup(self.steps)
+
+def start_background_warmup(steps=None) -> WarmupThread:
+    """在背景執行緒預熱 (Streamlit 行程內使用)"""
+    thread = WarmupThread(steps)
+    thread.start()
+    return thread
+
+def main():
+    report = run_warmup([("compile_sources", _compile_sources), *WARMUP_STEPS])
+    from src.tools.rag import PERSIST_DIRECTORY
+    os.makedirs(PERSIST_DIRECTORY, exist_ok=True)
+    with open(os.path.join(PERSIST_DIRECTORY, "startup_report.json"), "w", encoding="utf-8") as f:
+        json.dump({**report, "finished_at": time.time()}, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
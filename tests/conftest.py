@@ -0,0 +1,15 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+# 完全離線：假金鑰 + Hash Embedding；chroma_db / 快取檔寫到暫存目錄，不污染專案
+for key in ("GOOGLE_API_KEY", "GOOGLE_SEARCH_API_KEY", "GOOGLE_CSE_ID"):
+    os.environ.setdefault(key, "offline-test")
+os.environ["EMBEDDING_PROVIDER"] = "hash"
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+os.chdir(tempfile.mkdtemp(prefix="smart_deck_tests_"))
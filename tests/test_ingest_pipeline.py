@@ -0,0 +1,50 @@
+# tests/test_ingest_pipeline.py
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+from src.config import Config
+from src.tools import ingest_pipeline
+
+class BreakingPool:
+    """第 break_at 個 submit 的任務以 BrokenProcessPool 失敗，其餘在呼叫端同步執行"""
+    def __init__(self, break_at: int):
+        self.break_at = break_at
+        self.submitted = 0
+        self.shut_down = False
+
+    def submit(self, fn, *args):
+        self.submitted += 1
+        future = concurrent.futures.Future()
+        if self.submitted >= self.break_at:
+            future.set_exception(BrokenProcessPool("worker died"))
+        else:
+            future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+def _fake_pdf(monkeypatch, total_pages: int):
+    monkeypatch.setattr(ingest_pipeline, "_count_pdf_pages", lambda path: total_pages)
+    monkeypatch.setattr(ingest_pipeline, "_extract_pdf_pages", lambda path, start, end: [(i, f"page {i}") for i in range(start, end)])
+
+def test_broken_pool_resumes_from_first_unyielded_range(monkeypatch):
+    _fake_pdf(monkeypatch, total_pages=10)
+    monkeypatch.setattr(Config, "INGEST_PAGES_PER_TASK", 2)
+    monkeypatch.setattr(Config, "INGEST_PARSE_WORKERS", 1)
+    pool = BreakingPool(break_at=3) # 前兩個區段 (第 0~3 頁) 正常，第三個區段起 Pool 損壞
+    monkeypatch.setattr(ingest_pipeline, "_process_pool", pool)
+
+    pages = [metadata["page"] for metadata, _ in ingest_pipeline.iter_pages("doc.pdf")]
+
+    assert pages == list(range(10)) # 每頁剛好一次，沒有重複產出
+    assert pool.shut_down
+    assert ingest_pipeline._process_pool is None # 下一次匯入會重新建立 Pool
+
+def test_broken_pool_on_first_range_falls_back_for_whole_file(monkeypatch):
+    _fake_pdf(monkeypatch, total_pages=5)
+    monkeypatch.setattr(Config, "INGEST_PAGES_PER_TASK", 2)
+    monkeypatch.setattr(ingest_pipeline, "_process_pool", BreakingPool(break_at=1))
+
+    pages = [metadata["page"] for metadata, _ in ingest_pipeline.iter_pages("doc.pdf")]
+
+    assert pages == list(range(5))
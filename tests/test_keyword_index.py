@@ -0,0 +1,120 @@
+# tests/test_keyword_index.py
+import os
+import math
+import random
+from collections import Counter
+import pytest
+from src.tools import keyword_index as keyword_index_module
+from src.tools.keyword_index import KeywordIndex, index_files, tokenize
+
+WORDS = ["營收", "毛利率", "資本支出", "GPU", "cloud", "2024", "成長", "AI", "台積電", "EPS", "guidance", "庫存"]
+
+def _corpus(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 30))) for _ in range(count)]
+
+def _reference_bm25(docs: dict, query: str, k: int) -> list:
+    """舊版整份放在記憶體的 BM25，用來驗證分段 / 墓碑 / 合併後的分數完全一致"""
+    term_freqs = {chunk_id: Counter(tokenize(text)) for chunk_id, text in docs.items()}
+    lengths = {chunk_id: sum(tf.values()) for chunk_id, tf in term_freqs.items()}
+    avg_len = sum(lengths.values()) / len(docs)
+    scores = Counter()
+    for term, qtf in Counter(tokenize(query)).items():
+        posting = {chunk_id: tf[term] for chunk_id, tf in term_freqs.items() if term in tf}
+        if not posting: continue
+        df = len(posting)
+        idf = math.log((len(docs) - df + 0.5) / (df + 0.5) + 1.0)
+        for chunk_id, tf in posting.items():
+            denom = tf + KeywordIndex.K1 * (1 - KeywordIndex.B + KeywordIndex.B * lengths[chunk_id] / avg_len)
+            scores[chunk_id] += qtf * idf * tf * (KeywordIndex.K1 + 1) / denom
+    return scores.most_common(k)
+
+def _assert_same_ranking(index, docs, query, k=10):
+    expected = _reference_bm25(docs, query, k)
+    actual = index.search(query, k=k)
+    assert [score for _, score in actual] == pytest.approx([score for _, score in expected])
+    # 同分時順序可能不同，只比對分數相同的集合
+    assert {(chunk_id, round(score, 9)) for chunk_id, score in actual} == {(chunk_id, round(score, 9)) for chunk_id, score in expected}
+
+def test_add_search_remove_and_reopen(tmp_path):
+    path = str(tmp_path / "index.sqlite3")
+    index = KeywordIndex(path)
+    assert index.is_empty() and index.search("營收") == []
+
+    index.add(["a1", "a2"], ["台積電 2024 營收成長", "GPU 資本支出"], ["a.txt", "a.txt"])
+    index.add(["b1"], ["毛利率與營收"], ["b.txt"])
+    index.add(["a1"], ["重複的 id 不會再加入"], ["a.txt"])
+    assert index.n_docs == 3
+    assert [chunk_id for chunk_id, _ in index.search("營收", k=4)] in (["a1", "b1"], ["b1", "a1"])
+
+    assert sorted(index.remove_source("a.txt")) == ["a1", "a2"]
+    assert index.remove_source("a.txt") == []
+    assert [chunk_id for chunk_id, _ in index.search("營收 GPU", k=4)] == ["b1"]
+
+    index.close()
+    reopened = KeywordIndex(path)
+    assert reopened.n_docs == 1
+    assert [chunk_id for chunk_id, _ in reopened.search("營收 GPU", k=4)] == ["b1"]
+
+def test_scores_match_full_bm25_across_merges_and_tombstones(tmp_path, monkeypatch):
+    monkeypatch.setattr(KeywordIndex, "MERGE_FANIN", 2) # 少量資料也會觸發多層合併
+    index = KeywordIndex(str(tmp_path / "index.sqlite3"))
+    texts = _corpus(120)
+    docs = {}
+    for start in range(0, len(texts), 7):
+        ids = [f"c{i}" for i in range(start, min(start + 7, len(texts)))]
+        index.add(ids, texts[start:start + 7], [f"s{i % 5}.txt" for i in range(start, start + len(ids))])
+        docs.update(zip(ids, texts[start:start + 7]))
+
+    for query in ("營收 GPU", "毛利率 2024 庫存", "AI"):
+        _assert_same_ranking(index, docs, query)
+
+    removed = index.remove_source("s1.txt")
+    for chunk_id in removed: docs.pop(chunk_id)
+    index.add(["late"], ["營收 營收 GPU"], ["late.txt"])
+    docs["late"] = "營收 營收 GPU"
+    for query in ("營收 GPU", "毛利率 2024 庫存"):
+        _assert_same_ranking(index, docs, query)
+
+    # 墓碑過半時整份壓實：Postings 中不再留有已移除的文件
+    for source in ("s0.txt", "s2.txt", "s3.txt"):
+        for chunk_id in index.remove_source(source): docs.pop(chunk_id)
+    conn = index._get_write_conn()
+    assert conn.execute("SELECT COUNT(*) FROM segments").fetchone()[0] == 1
+    assert conn.execute("SELECT COUNT(*) FROM tombstones").fetchone()[0] == 0
+    _assert_same_ranking(index, docs, "營收 GPU")
+
+def test_open_and_search_read_postings_lazily(tmp_path, monkeypatch):
+    path = str(tmp_path / "index.sqlite3")
+    index = KeywordIndex(path)
+    index.add([f"c{i}" for i in range(200)], _corpus(200, seed=1), ["a.txt"] * 200)
+    index.close()
+
+    decoded = []
+    real_loads = keyword_index_module.marshal.loads
+    monkeypatch.setattr(keyword_index_module.marshal, "loads", lambda data: decoded.append(data) or real_loads(data))
+    reopened = KeywordIndex(path)
+    assert reopened.n_docs == 200 and decoded == [] # 開啟只讀統計
+
+    reopened.search("營收")
+    segments = reopened._get_write_conn().execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+    assert len(decoded) == segments # 一個詞彙在每個 Segment 只解開一個 Bucket
+
+def test_clear_and_corrupted_file(tmp_path):
+    path = str(tmp_path / "index.sqlite3")
+    index = KeywordIndex(path)
+    index.add(["c1"], ["營收"], ["a.txt"])
+    index.clear()
+    assert index.is_empty()
+    assert not any(os.path.exists(p) for p in index_files(path))
+    index.add(["c2"], ["毛利率"], ["b.txt"])
+    assert [chunk_id for chunk_id, _ in index.search("毛利率")] == ["c2"]
+    index.close()
+
+    for p in index_files(path):
+        if os.path.exists(p): os.remove(p)
+    with open(path, "wb") as f: f.write(b"not a database" * 100)
+    rebuilt = KeywordIndex(path)
+    assert rebuilt.is_empty()
+    rebuilt.add(["c3"], ["營收"], ["a.txt"])
+    assert [chunk_id for chunk_id, _ in rebuilt.search("營收")] == ["c3"]
@@ -0,0 +1,66 @@
+# tests/test_memory.py
+import threading
+from types import SimpleNamespace
+from langchain_core.messages import HumanMessage, AIMessage
+from src.agents import memory as memory_module
+from src.agents.memory import ConversationMemory, system_notice, is_system_notice
+
+class FakeScheduler:
+    """取代 quota_scheduler：invoke 會停在 release 之前，模擬還沒回來的摘要模型"""
+    def __init__(self):
+        self.release = threading.Event()
+        self.prompts = []
+
+    def invoke(self, model, runnable, messages, priority=0):
+        self.prompts.append(messages)
+        self.release.wait(timeout=5)
+        return SimpleNamespace(content="摘要內容")
+
+def _memory(monkeypatch) -> tuple:
+    scheduler = FakeScheduler()
+    monkeypatch.setattr(memory_module, "quota_scheduler", scheduler)
+    monkeypatch.setattr(memory_module, "get_summary_llm", lambda: None)
+    memory = ConversationMemory(keep_turns=2, summarize_every=2, summary_max_tokens=500, tool_result_chars=100, digest_tool_chars=100)
+    return memory, scheduler
+
+def _turns(count: int) -> list:
+    messages = []
+    for i in range(count):
+        messages += [HumanMessage(content=f"問題 {i}"), AIMessage(content=f"回答 {i}")]
+    return messages
+
+def test_system_notices_do_not_count_as_turns(monkeypatch):
+    memory, scheduler = _memory(monkeypatch)
+    messages = [system_notice("✅ 已存入知識庫：a.pdf")] + _turns(2) + [system_notice("✅ 已存入知識庫：b.pdf")] * 3
+
+    summary, recent = memory.build(messages)
+
+    assert summary == "" and scheduler.prompts == [] # 只有 2 個使用者回合，未達摘要門檻
+    assert recent == messages # 第一個回合之前的通知也保留
+    assert is_system_notice(recent[0]) and not is_system_notice(recent[1])
+
+def test_summary_runs_in_background_without_blocking_build(monkeypatch):
+    memory, scheduler = _memory(monkeypatch)
+    messages = _turns(4)
+
+    summary, recent = memory.build(messages) # 摘要模型還沒回來，build 仍立即回傳原文
+    assert summary == "" and recent == messages
+    assert len(scheduler.prompts) == 1
+    assert memory.build(messages)[1] == messages and len(scheduler.prompts) == 1 # 同時只送出一個摘要
+
+    scheduler.release.set()
+    memory._pending.result(timeout=5)
+    summary, recent = memory.build(messages)
+    assert summary == "摘要內容"
+    assert recent == messages[4:]
+
+def test_summary_finished_after_reset_is_discarded(monkeypatch):
+    memory, scheduler = _memory(monkeypatch)
+    memory.build(_turns(4))
+    pending = memory._pending
+
+    memory.reset()
+    scheduler.release.set()
+    pending.result(timeout=5)
+
+    assert memory.summary == "" and memory.summarized_upto == 0
@@ -0,0 +1,53 @@
+# tests/test_rate_limiter.py
+import time
+import threading
+from src.utils.rate_limiter import QuotaScheduler, PRIORITY_INTERACTIVE, PRIORITY_PLANNING, PRIORITY_BACKGROUND
+
+MODEL = "test-model"
+
+def _drained_scheduler(rpm: int = 600) -> QuotaScheduler:
+    """額度已用完的排程器：之後每 60 / rpm 秒才補回一次請求額度"""
+    scheduler = QuotaScheduler({MODEL: {"rpm": rpm, "tpm": 1_000_000}})
+    scheduler._models[MODEL].requests.level = 0
+    return scheduler
+
+def _enqueue_in_order(scheduler: QuotaScheduler, entries: list) -> list:
+    """依序啟動 (label, priority) 的呼叫，每個都確定進入佇列後才啟動下一個；回傳取得額度的順序"""
+    granted, lock, threads = [], threading.Lock(), []
+    def worker(label, priority):
+        scheduler.acquire(MODEL, tokens=10, priority=priority)
+        with lock: granted.append(label)
+    for queued, (label, priority) in enumerate(entries, start=1):
+        thread = threading.Thread(target=worker, args=(label, priority))
+        thread.start()
+        threads.append(thread)
+        while scheduler.stats()[MODEL]["queued"] < queued: time.sleep(0.005)
+    for thread in threads: thread.join(timeout=5)
+    return granted
+
+def test_waiters_are_served_by_priority():
+    scheduler = _drained_scheduler(rpm=120) # 第一個呼叫要等 0.5 秒，足夠讓後面的呼叫排進佇列
+    granted = _enqueue_in_order(scheduler, [
+        ("background", PRIORITY_BACKGROUND),
+        ("planning", PRIORITY_PLANNING),
+        ("interactive", PRIORITY_INTERACTIVE),
+    ])
+    assert granted == ["interactive", "planning", "background"]
+
+def test_same_priority_is_first_come_first_served():
+    scheduler = _drained_scheduler(rpm=120)
+    granted = _enqueue_in_order(scheduler, [(f"call{i}", PRIORITY_PLANNING) for i in range(4)])
+    assert granted == ["call0", "call1", "call2", "call3"]
+
+def test_waits_are_paced_by_request_rate():
+    scheduler = _drained_scheduler(rpm=600) # 每 0.1 秒一個請求
+    started = time.monotonic()
+    _enqueue_in_order(scheduler, [(f"call{i}", PRIORITY_INTERACTIVE) for i in range(3)])
+    assert time.monotonic() - started >= 0.25
+    stats = scheduler.stats()[MODEL]
+    assert stats["calls"] == 3 and stats["queued"] == 0
+
+def test_models_without_quota_are_not_scheduled():
+    scheduler = _drained_scheduler()
+    assert scheduler.acquire("unconfigured-model") == 0.0
+    assert scheduler.call("unconfigured-model", lambda: "ok") == "ok"
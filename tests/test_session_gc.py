@@ -0,0 +1,44 @@
+# tests/test_session_gc.py
+import os
+import time
+from src.config import Config
+from src.tools import session_gc
+from src.tools.session_gc import SessionSweeper
+
+HOUR = 3600
+
+def _sweeper(monkeypatch, tmp_path, sessions: dict, footprint: int) -> tuple:
+    """sessions: {session_id: 幾小時前最後存取}；回傳 (sweeper, 被刪除資料的 session 清單)"""
+    purged = []
+    monkeypatch.setattr(Config, "OUTPUT_DIR", str(tmp_path))
+    monkeypatch.setattr(session_gc, "list_stored_sessions", lambda: set(sessions))
+    monkeypatch.setattr(session_gc, "purge_session_data", purged.append)
+    monkeypatch.setattr(SessionSweeper, "_footprint", lambda self: footprint)
+    monkeypatch.setattr(SessionSweeper, "_session_size", lambda self, session_id: 0)
+    sweeper = SessionSweeper(ttl_seconds=24 * HOUR, disk_budget_bytes=100, interval_seconds=60, batch_size=10, pressure_ttl_seconds=HOUR)
+    now = time.time()
+    sweeper._access = {sid: now - hours * HOUR for sid, hours in sessions.items()}
+    return sweeper, purged
+
+def test_disk_budget_only_evicts_sessions_idle_past_pressure_ttl(monkeypatch, tmp_path):
+    sweeper, purged = _sweeper(monkeypatch, tmp_path, {"expired": 30, "idle": 3, "recent": 0.5, "live": 0}, footprint=1000)
+
+    report = sweeper.sweep_once()
+
+    # 仍超出預算，但閒置未滿 1 小時的 Session 可能還開著，不回收
+    assert report["session_ids"] == ["expired", "idle"]
+    assert purged == ["expired", "idle"]
+
+def test_within_budget_only_ttl_applies(monkeypatch, tmp_path):
+    sweeper, purged = _sweeper(monkeypatch, tmp_path, {"expired": 30, "idle": 3}, footprint=10)
+    assert sweeper.sweep_once()["session_ids"] == ["expired"]
+
+def test_output_is_matched_on_full_session_id(monkeypatch, tmp_path):
+    victim, neighbour = "abcdef12-0000-0000-0000-000000000001", "abcdef12-0000-0000-0000-000000000002"
+    sweeper, _ = _sweeper(monkeypatch, tmp_path, {victim: 30, neighbour: 0}, footprint=10)
+    for sid in (victim, neighbour):
+        (tmp_path / f"presentation_{sid}.pptx").write_bytes(b"pptx")
+
+    sweeper.sweep_once()
+
+    assert sorted(os.listdir(tmp_path)) == [f"presentation_{neighbour}.pptx"]
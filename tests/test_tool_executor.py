@@ -0,0 +1,78 @@
+# tests/test_tool_executor.py
+import time
+import threading
+import pytest
+from src.config import Config
+from src.tools import tool_executor as tool_executor_module
+from src.tools.tool_executor import AsyncToolExecutor
+
+class SleepTool:
+    """同步工具替身：每次呼叫睡 seconds 秒並記錄開始 / 結束"""
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.started = []
+        self.finished = []
+        self._lock = threading.Lock()
+
+    def invoke(self, args):
+        with self._lock: self.started.append(args["n"])
+        time.sleep(self.seconds)
+        with self._lock: self.finished.append(args["n"])
+        return f"done {args['n']}"
+
+def _calls(name: str, count: int, offset: int = 0) -> list:
+    return [{"id": f"{name}-{i}", "name": name, "args": {"n": i}} for i in range(offset, offset + count)]
+
+@pytest.fixture
+def fresh_pools(monkeypatch):
+    monkeypatch.setattr(tool_executor_module, "_tool_pools", {})
+    yield monkeypatch
+    for pool in tool_executor_module._tool_pools.values():
+        pool.shutdown(wait=True)
+
+def test_queue_time_in_pool_does_not_count_against_timeout(fresh_pools):
+    fresh_pools.setattr(Config, "TOOL_EXECUTOR_WORKERS", 1)
+    tool = SleepTool(0.2)
+    executor = AsyncToolExecutor({"work": 3}, {"work": 0.5})
+
+    results = executor.run(_calls("work", 3), {"work": tool})
+
+    # 三個呼叫在單一執行緒上依序執行共約 0.6 秒，但每個呼叫本身都在 0.5 秒內完成
+    assert results == {f"work-{i}": f"done {i}" for i in range(3)}
+
+def test_slow_call_times_out_without_blocking_other_results(fresh_pools):
+    slow, fast = SleepTool(1.0), SleepTool(0.05)
+    executor = AsyncToolExecutor({"slow": 1, "fast": 1}, {"slow": 0.2, "fast": 1})
+    finished_order = []
+
+    started = time.perf_counter()
+    results = executor.run(_calls("slow", 1) + _calls("fast", 1), {"slow": slow, "fast": fast},
+                           on_result=lambda tc, result, *_: finished_order.append(tc["id"]))
+
+    assert time.perf_counter() - started < 0.8
+    assert results["fast-0"] == "done 0"
+    assert "逾時" in results["slow-0"]
+    assert finished_order == ["fast-0", "slow-0"]
+
+def test_abandoned_calls_do_not_starve_other_tools(fresh_pools):
+    fresh_pools.setattr(Config, "TOOL_EXECUTOR_WORKERS", 2)
+    stuck, fast = SleepTool(1.0), SleepTool(0.01)
+    executor = AsyncToolExecutor({"stuck": 2, "fast": 1}, {"stuck": 0.1, "fast": 0.3})
+
+    # 逾時被放棄的呼叫仍佔著 stuck 的兩條執行緒
+    executor.run(_calls("stuck", 2), {"stuck": stuck})
+    assert stuck.finished == []
+
+    results = executor.run(_calls("fast", 1), {"fast": fast})
+    assert results == {"fast-0": "done 0"}
+
+def test_round_deadline_cancels_calls_still_queued(fresh_pools):
+    fresh_pools.setattr(Config, "TOOL_EXECUTOR_WORKERS", 1)
+    tool = SleepTool(0.3)
+    executor = AsyncToolExecutor({"work": 3}, {"work": 5})
+
+    results = executor.run(_calls("work", 3), {"work": tool}, deadline_seconds=0.15)
+
+    assert all("時間上限" in result for result in results.values())
+    tool_executor_module._tool_pools["work"].shutdown(wait=True)
+    assert tool.started == [0] # 排隊中的呼叫被取消，不會在本輪結束後才執行
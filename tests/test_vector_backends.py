@@ -0,0 +1,108 @@
+# tests/test_vector_backends.py
+import os
+import numpy as np
+import pytest
+from src.tools.vector_backends import VectorBackend, NumpyBackend
+
+DIM = 16
+
+def _vectors(count: int, seed: int = 0) -> list:
+    return np.random.default_rng(seed).normal(size=(count, DIM)).astype(np.float32).tolist()
+
+def _add(backend, ids, vectors):
+    backend.add(ids, vectors, [f"text of {i}" for i in ids], [{}] * len(ids))
+
+def _data_files(directory) -> list:
+    return sorted(name for name in os.listdir(directory) if not name.startswith("texts.sqlite3"))
+
+def test_vector_backend_is_abstract():
+    with pytest.raises(TypeError):
+        VectorBackend()
+
+@pytest.mark.parametrize("quantize", [True, False])
+def test_add_delete_query_round_trip(tmp_path, quantize):
+    backend = NumpyBackend(str(tmp_path / "col"), quantize=quantize)
+    ids, vectors = [f"c{i}" for i in range(10)], _vectors(10)
+    _add(backend, ids, vectors)
+    _add(backend, ["c0"], _vectors(1, seed=9)) # 重複的 id 不會再追加
+
+    assert backend.count() == 10
+    assert [hits[0] for hits in backend.query(vectors, k=3)] == ids
+
+    backend.delete(["c1", "c2"])
+    assert backend.count() == 8
+    hits = backend.query([vectors[1]], k=10)[0]
+    assert len(hits) == 8 and "c1" not in hits and "c2" not in hits
+
+    # 重新開啟後狀態 (含墓碑) 完整保留
+    reopened = NumpyBackend(str(tmp_path / "col"), quantize=quantize)
+    assert reopened.count() == 8
+    assert reopened.query([vectors[5]], k=1) == [["c5"]]
+    assert "c1" not in reopened.query([vectors[1]], k=10)[0]
+
+def test_compaction_keeps_remaining_rows(tmp_path):
+    backend = NumpyBackend(str(tmp_path / "col"))
+    ids, vectors = [f"c{i}" for i in range(10)], _vectors(10)
+    _add(backend, ids, vectors)
+
+    backend.delete(ids[:6]) # 墓碑過半，觸發壓實
+    assert backend.meta["ids"] == ids[6:]
+    assert [backend.query([v], k=1)[0][0] for v in vectors[6:]] == ids[6:]
+    assert _data_files(tmp_path / "col") == ["meta.json", "scales.f32.1", "vectors.i8.1"]
+
+    reopened = NumpyBackend(str(tmp_path / "col"))
+    assert [reopened.query([v], k=1)[0][0] for v in vectors[6:]] == ids[6:]
+
+def test_recovers_from_crash_between_vector_append_and_meta_save(tmp_path, monkeypatch):
+    directory = str(tmp_path / "col")
+    backend = NumpyBackend(directory)
+    ids, vectors = [f"c{i}" for i in range(4)], _vectors(6)
+    _add(backend, ids, vectors[:4])
+
+    # 向量已追加寫入，但 meta 尚未更新就當機
+    monkeypatch.setattr(NumpyBackend, "_save_meta", lambda self: (_ for _ in ()).throw(OSError("crash")))
+    with pytest.raises(OSError):
+        _add(backend, ["lost"], vectors[4:5])
+    monkeypatch.undo()
+
+    recovered = NumpyBackend(directory)
+    assert recovered.meta["ids"] == ids
+    assert os.path.getsize(os.path.join(directory, "vectors.i8")) == 4 * DIM
+
+    _add(recovered, ["c4"], vectors[5:6])
+    assert [hits[0] for hits in recovered.query(vectors[:4] + vectors[5:6], k=1)] == ids + ["c4"]
+
+def test_recovers_from_crash_during_compaction(tmp_path, monkeypatch):
+    directory = str(tmp_path / "col")
+    backend = NumpyBackend(directory)
+    ids, vectors = [f"c{i}" for i in range(4)], _vectors(4)
+    _add(backend, ids, vectors)
+
+    # 新世代的檔案已寫出，但 meta 尚未切換就當機：應從舊世代完整載入
+    monkeypatch.setattr(NumpyBackend, "_save_meta", lambda self: (_ for _ in ()).throw(OSError("crash")))
+    with pytest.raises(OSError):
+        backend.delete(ids[:3])
+    monkeypatch.undo()
+
+    recovered = NumpyBackend(directory)
+    assert recovered.count() == 4
+    assert [hits[0] for hits in recovered.query(vectors, k=1)] == ids
+    assert recovered.get_texts(ids) == [f"text of {i}" for i in ids]
+    assert _data_files(directory) == ["meta.json", "scales.f32", "vectors.i8"]
+
+def test_texts_follow_add_delete_and_drop(tmp_path):
+    directory = str(tmp_path / "col")
+    backend = NumpyBackend(directory)
+    ids = [f"c{i}" for i in range(4)]
+    _add(backend, ids, _vectors(4))
+    assert backend.get_texts(["c2", "missing", "c0", "c2"]) == ["text of c2", "", "text of c0", "text of c2"]
+
+    backend.delete(["c1"])
+    reopened = NumpyBackend(directory)
+    assert reopened.get_texts(ids) == ["text of c0", "", "text of c2", "text of c3"]
+
+    reopened.backfill_texts(["c3", "c1"], ["migrated c3", "migrated c1"]) # 只補寫仍存在的片段
+    assert reopened.get_texts(["c1", "c3"]) == ["", "migrated c3"]
+
+    reopened.drop()
+    assert not os.path.exists(directory)
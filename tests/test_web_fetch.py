@@ -0,0 +1,98 @@
+# tests/test_web_fetch.py
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+from src.tools.web_fetch import WebFetcher
+from src.tools.search import format_fetch_result
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """模擬 Reader Proxy：路徑是原始網址，依原始主機統計同時連線數"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        original = self.path.lstrip("/")
+        host = original.split("/")[2]
+        with server.lock:
+            server.active[host] = server.active.get(host, 0) + 1
+            server.peak[host] = max(server.peak.get(host, 0), server.active[host])
+            server.total_active += 1
+            server.total_peak = max(server.total_peak, server.total_active)
+        try:
+            if original.endswith("/slow"):
+                self._send_slowly()
+            else:
+                time.sleep(0.2)
+                body = f"content of {original}".encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active[host] -= 1
+                server.total_active -= 1
+
+    def _send_slowly(self):
+        """chunked 回應，每 0.1 秒吐一小段，模擬一點一點送資料的伺服器"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for _ in range(30):
+                self.wfile.write(b"5\r\nslow \r\n")
+                self.wfile.flush()
+                time.sleep(0.1)
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stand_in():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.active, server.peak = {}, {}
+    server.total_active = server.total_peak = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def _fetcher(server, per_host_limit=2, read_timeout=5.0) -> WebFetcher:
+    return WebFetcher(
+        reader_base_url=f"http://127.0.0.1:{server.server_address[1]}/",
+        max_chars=1000, connect_timeout=0.5, read_timeout=read_timeout,
+        per_host_limit=per_host_limit, pool_size=16
+    )
+
+def test_per_host_limit_is_keyed_on_original_host(stand_in):
+    fetcher = _fetcher(stand_in, per_host_limit=2)
+    urls = [f"https://{host}/page{i}" for host in ("a.example", "b.example") for i in range(6)]
+
+    results = fetcher.fetch_many(urls)
+
+    assert all(r.ok for r in results)
+    assert [r.text for r in results] == [f"content of {url}" for url in urls]
+    assert stand_in.peak == {"a.example": 2, "b.example": 2}
+    # 兩個主機各自計算上限，不會因為共用同一個 Proxy 而被壓在 2 條連線
+    assert stand_in.total_peak == 4
+
+def test_read_deadline_is_reported_as_timeout_not_truncation(stand_in):
+    fetcher = _fetcher(stand_in, read_timeout=0.5)
+
+    result = fetcher.fetch("https://slow.example/slow")
+
+    assert result.ok
+    assert result.timed_out and not result.truncated
+    assert result.text.startswith("slow ")
+    assert result.elapsed < 2.0
+    assert "讀取逾時" in format_fetch_result(result)
+    assert "文章過長" not in format_fetch_result(result)